@@ -12,6 +12,9 @@ def init(
     ungap: bool = True,
     imputed: bool = False,
     imputation_method: str = "nearest",
+    ard=None,
+    from_parquet: str = None,
+    on_demand: bool = False,
 ):
     from .genie import GENIE
 
@@ -23,6 +26,9 @@ def init(
         ungap=ungap,
         imputed=imputed,
         imputation_method=imputation_method,
+        ard=ard,
+        from_parquet=from_parquet,
+        on_demand=on_demand,
     )
 
     return genie
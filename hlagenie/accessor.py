@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# accessor.py - pandas accessor for HLA sequence lookups over whole columns
+
+try:
+    import pandas as pd  # for the DataFrame accessor
+except ImportError:
+    raise ImportError(
+        "pandas is required for the hlagenie DataFrame accessor, "
+        "install it with `pip install pandas`"
+    )
+
+# GENIE instance used when a call does not pass one
+_genie = None
+
+
+def set_genie(genie):
+    """
+    Set the GENIE instance used by the accessor by default
+
+    :param genie: GENIE instance
+    """
+    global _genie
+    _genie = genie
+
+
+def _get_genie(genie=None):
+    if genie is not None:
+        return genie
+    if _genie is None:
+        raise ValueError(
+            "No GENIE instance, call hlagenie.accessor.set_genie or pass genie="
+        )
+    return _genie
+
+
+@pd.api.extensions.register_dataframe_accessor("hlagenie")
+class HLAGenieAccessor:
+    """
+    Column-wise GENIE lookups on a DataFrame, available as df.hlagenie
+
+    Each lookup is computed once per distinct allele (or donor/recipient
+    combination) and broadcast back to the rows, so cohort tables with many
+    repeated typings cost about as much as their distinct values. Rows with a
+    missing or unknown allele get a missing value.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self._df = df
+
+    def _map_distinct(self, column: str, func) -> pd.Series:
+        """
+        Apply a function to the distinct values of a column and map it back
+
+        :param column: column of alleles
+        :param func: function of a single allele
+        :return: Series aligned with the DataFrame
+        """
+        results = {}
+        for allele in self._df[column].dropna().unique():
+            try:
+                results[allele] = func(allele)
+            except (KeyError, IndexError):
+                results[allele] = None
+        return self._df[column].map(results)
+
+    def aa(self, column: str, position: int, genie=None) -> pd.Series:
+        """
+        Get the amino acid at a mature position for every allele of a column
+
+        :param column: column of alleles
+        :param position: mature protein position
+        :param genie: GENIE instance, the one given to set_genie if None
+        :return: Series of amino acids
+        """
+        genie = _get_genie(genie)
+        return self._map_distinct(column, lambda a: genie.getAA(a, position))
+
+    def epitope(self, column: str, positions: list[int], genie=None) -> pd.Series:
+        """
+        Get the epitope string at a list of positions for every allele of a column
+
+        :param column: column of alleles
+        :param positions: mature protein positions
+        :param genie: GENIE instance, the one given to set_genie if None
+        :return: Series of epitope strings
+        """
+        genie = _get_genie(genie)
+        return self._map_distinct(column, lambda a: genie.getEpitope(a, positions))
+
+    def region(self, column: str, region: str, genie=None) -> pd.Series:
+        """
+        Get the residues of a region for every allele of a column
+
+        :param column: column of alleles
+        :param region: ARD, XRD, mature or a region added with defineRegion
+        :param genie: GENIE instance, the one given to set_genie if None
+        :return: Series of residue strings
+        """
+        genie = _get_genie(genie)
+        return self._map_distinct(column, lambda a: genie.getRegion(a, region))
+
+    def mismatch(
+        self,
+        donor_cols: list[str],
+        recip_cols: list[str],
+        region: str = "ARD",
+        positions: list[int] = None,
+        genie=None,
+    ) -> pd.Series:
+        """
+        Count amino acid mismatches between donor and recipient for every row
+
+        Counts follow genotypeMismatches, so a donor typed with the same allele
+        twice is homozygous and each of its mismatches counts once.
+
+        :param donor_cols: the two donor allele columns
+        :param recip_cols: the two recipient allele columns
+        :param region: ARD, XRD, mature or a region added with defineRegion,
+            used when positions is None
+        :param positions: mature protein positions to compare instead of a region
+        :param genie: GENIE instance, the one given to set_genie if None
+        :return: Series of mismatch counts
+        """
+        genie = _get_genie(genie)
+        columns = list(donor_cols) + list(recip_cols)
+        if len(columns) != 4:
+            raise ValueError("Two donor and two recipient columns are required")
+        compared = region if positions is None else list(positions)
+
+        # count each distinct donor/recipient combination once
+        typings = self._df[columns].itertuples(index=False, name=None)
+        counts = {}
+        results = []
+        for typing in typings:
+            if typing not in counts:
+                if not all(isinstance(allele, str) for allele in typing):
+                    counts[typing] = None
+                else:
+                    locus = typing[0].split("*")[0]
+                    try:
+                        counts[typing] = genie.genotypeMismatches(
+                            {locus: list(typing[:2])},
+                            {locus: list(typing[2:])},
+                            compared,
+                        )["total"]
+                    except (KeyError, ValueError):
+                        counts[typing] = None
+            results.append(counts[typing])
+
+        return pd.Series(results, index=self._df.index, dtype="Int64")
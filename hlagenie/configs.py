@@ -3,7 +3,23 @@
 config = {}
 
 config["imgt_version"] = "Latest"
+config["imgt_hla_url"] = "https://raw.githubusercontent.com/ANHIG/IMGTHLA"
+config[
+    "imputed_url"
+] = "https://raw.githubusercontent.com/gbiagini/hla-imputed-sequences"
+config["download_workers"] = 8
+config["download_retries"] = 3
+config["download_backoff"] = 0.5
+config["download_timeout"] = 15
+# number of parsed loci that can wait to be written during a build
+config["pipeline_depth"] = 2
+# seconds a resolved "Latest" version is trusted before asking GitHub again
+config["latest_version_ttl"] = 24 * 60 * 60
 config["DEFAULT_CACHE_SIZE"] = 1000
+# threads GENIE.batch spreads calls over
+config["batch_workers"] = 4
+# pairs from which genotypeMismatchesBatch counts each locus in its own thread
+config["parallel_batch_size"] = 64
 config["loci"] = [
     "A",
     "B",
@@ -88,14 +104,9 @@ config["expression_chars"] = [
     "L",
     "S",
 ]
-# TODO: rename gapped_tables to gapped_tables_prot
-config["gapped_tables"] = [f"{locus}_gapped" for locus in config["loci"]]
-config["gapped_mature_tables"] = [f"{locus}_gapped_mature" for locus in config["loci"]]
-# TODO: rename ungapped_tables to ungapped_tables_prot
-config["ungapped_tables"] = [f"{locus}_ungapped" for locus in config["loci"]]
-config["ungapped_mature_tables"] = [
-    f"{locus}_ungapped_mature" for locus in config["loci"]
-]
-config["ungapped_nuc_tables"] = [f"{locus}_ungapped_nuc" for locus in config["loci"]]
-config["gapped_nuc_tables"] = [f"{locus}_gapped_nuc" for locus in config["loci"]]
 config["position_tables"] = [f"{locus}_position" for locus in config["loci"]]
+config["server_host"] = "127.0.0.1"
+config["server_port"] = 7787
+# seconds hlagenie-serve collects calls across requests before evaluating them,
+# 0 to evaluate straight away and only coalesce calls arriving during an evaluation
+config["batch_window"] = 0
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+
+# coordinates.py - mapping between mature protein positions and nucleotide positions
+
+import itertools  # for the codon table
+import operator  # for gathering many codon columns in one call
+from .configs import config  # for configurations
+from .smart_sort import smart_sort  # for choosing a representative nucleotide allele
+
+GAP = "-"
+
+# standard genetic code, with stop codons as X like the IMGT/HLA protein alignments
+_BASES = "TCAG"
+_AMINO_ACIDS = "FFLLSSSSYYXXCCXWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"
+CODON_TABLE = {
+    "".join(codon): residue
+    for codon, residue in zip(itertools.product(_BASES, repeat=3), _AMINO_ACIDS)
+}
+
+# classifications of a donor codon absent in the recipient
+SYNONYMOUS = "synonymous"
+NON_SYNONYMOUS = "non-synonymous"
+UNKNOWN = "unknown"
+
+
+def translate(codon: str):
+    """
+    Translate a codon
+
+    :param codon: three nucleotides
+    :return: amino acid, or None if the codon has gaps or unknown nucleotides
+    """
+    return CODON_TABLE.get(codon)
+
+
+# nucleotide codes of the byte lookup table: A, C, G and T, a gap, anything else
+_CODES = bytearray([5]) * 256
+for _code, _base in enumerate("ACGT-"):
+    _CODES[ord(_base)] = _code
+    _CODES[ord(_base.lower())] = _code
+_CODES = bytes(_CODES)
+
+
+def _residue_table() -> bytes:
+    """
+    Residue of each triplet of nucleotide codes, at index a * 36 + b * 6 + c
+
+    A codon of gaps translates to a gap, and any other codon with a gap or an
+    unknown nucleotide to *, as unsequenced residues in the protein alignments.
+    """
+    table = bytearray(b"*") * 216
+    for codon, residue in CODON_TABLE.items():
+        a, b, c = (_CODES[ord(base)] for base in codon)
+        table[a * 36 + b * 6 + c] = ord(residue)
+    table[4 * 36 + 4 * 6 + 4] = ord(GAP)
+    return bytes(table)
+
+
+_RESIDUES = _residue_table()
+
+
+def translate_sequence(seq: str) -> str:
+    """
+    Translate a coding sequence through a lookup table over its bytes
+
+    :param seq: coding sequence, a trailing partial codon is ignored
+    :return: protein sequence, with - for codons of gaps and * for codons
+        with unknown nucleotides
+    """
+    codes = seq.encode("ascii").translate(_CODES)
+    end = len(codes) - len(codes) % 3
+    return bytes(
+        _RESIDUES[a * 36 + b * 6 + c]
+        for a, b, c in zip(codes[0:end:3], codes[1:end:3], codes[2:end:3])
+    ).decode("ascii")
+
+
+def _differences(codon1: str, codon2: str) -> int:
+    return (
+        (codon1[0] != codon2[0]) + (codon1[1] != codon2[1]) + (codon1[2] != codon2[2])
+    )
+
+
+def classify_codon(codon: str, recip_codons: list[str]):
+    """
+    Classify a donor codon against the recipient codons of the same position
+
+    A codon found in the recipient is not a mismatch. Otherwise it is
+    synonymous if its amino acid is coded by a recipient codon, unknown if
+    the amino acid of either side cannot be told from gaps or unknown
+    nucleotides, and non-synonymous otherwise.
+
+    :param codon: donor codon
+    :param recip_codons: recipient codons
+    :return: tuple of classification and closest recipient codon, or None
+        if the codon is in the recipient
+    """
+    if codon in recip_codons:
+        return None
+    residue = CODON_TABLE.get(codon)
+    recip_residues = [CODON_TABLE.get(recip_codon) for recip_codon in recip_codons]
+    if residue is not None and residue in recip_residues:
+        kind = SYNONYMOUS
+    elif residue is None or None in recip_residues:
+        kind = UNKNOWN
+    else:
+        kind = NON_SYNONYMOUS
+    closest = min(
+        recip_codons, key=lambda recip_codon: _differences(codon, recip_codon)
+    )
+    return kind, closest
+
+
+def two_field_name(allele: str) -> str:
+    """
+    Truncate a full allele name to two fields, keeping its expression character
+
+    :param allele: allele name, such as A*01:01:01:02N
+    :return: two-field name, such as A*01:01N
+    """
+    fields = allele.split(":")
+    reduced = ":".join(fields[:2])
+    if len(fields) > 2 and fields[-1][-1].isalpha() and not reduced[-1].isalpha():
+        reduced += fields[-1][-1]
+    return reduced
+
+
+class CoordinateIndex:
+    """
+    Codon columns of each mature protein position, per locus
+
+    The index is built once by walking the full protein and the coding
+    sequence of the reference allele of each locus side by side: the k-th
+    residue of the protein is coded by the k-th triplet of nucleotides.
+    Positions are in the coordinates of the instance (gapped or ungapped),
+    so they apply to every allele aligned to the reference. Lookups in
+    either direction are then a list index.
+
+    In ungapped coordinates, an allele carrying an insertion keeps its
+    inserted bases, so its coding sequence is longer than the reference
+    and its codons are out of step with the reference columns. Such an
+    allele is in the coordinates of its own protein, whose k-th residue
+    after the leader is coded by the k-th triplet after the leader.
+    """
+
+    def __init__(self, full_seqs, seqs, nuc_seqs):
+        """
+        :param full_seqs: dictionary of two-field allele to full protein sequence
+        :param seqs: dictionary of two-field allele to mature protein sequence
+        :param nuc_seqs: dictionary of full allele name to coding sequence
+        """
+        self.nuc_seqs = nuc_seqs
+        # locus to list of codon columns, indexed by mature position - 1
+        self.codons = {}
+        # locus to list of (mature position, codon offset), indexed by nucleotide position - 1
+        self.residues = {}
+        # locus to the number of leader residues and the reference coding length
+        self.leaders = {}
+        self.lengths = {}
+        self._nuc_alleles = None
+        # (locus, positions) to the positions with a codon and their gatherer
+        self._gatherers = {}
+
+        for locus in config["loci"]:
+            ref_allele = config["refseq"][locus]
+            ref_full = full_seqs[ref_allele]
+            leader = len(ref_full) - len(seqs[ref_allele])
+            ref_nuc = nuc_seqs[config["refseq_full"][locus]]
+            bases = [column for column, base in enumerate(ref_nuc) if base != GAP]
+
+            codons = []
+            residues = [None] * len(ref_nuc)
+            k = 0
+            for column, residue in enumerate(ref_full):
+                if residue == GAP:
+                    # a gap in the reference has no codon of its own
+                    if column >= leader:
+                        codons.append(None)
+                    continue
+                columns = tuple(bases[3 * k : 3 * k + 3])
+                k += 1
+                if column < leader:
+                    continue
+                if len(columns) < 3:
+                    break
+                position = column - leader + 1
+                codons.append(columns)
+                for offset, base_column in enumerate(columns, 1):
+                    residues[base_column] = (position, offset)
+
+            self.codons[locus] = codons
+            self.residues[locus] = residues
+            self.leaders[locus] = leader
+            self.lengths[locus] = len(ref_nuc)
+
+    def nuc_allele(self, allele: str) -> str:
+        """
+        Get the allele whose coding sequence represents an allele
+
+        :param allele: allele name, such as A*01:01, A*01:01:01 or A*01:01:01:01
+        :return: the name itself if it has a coding sequence, otherwise the
+            lowest full name of its two-field allele
+        """
+        if allele in self.nuc_seqs:
+            return allele
+        if self._nuc_alleles is None:
+            nuc_alleles = {}
+            for full_name in smart_sort(self.nuc_seqs):
+                nuc_alleles.setdefault(two_field_name(full_name), full_name)
+            self._nuc_alleles = nuc_alleles
+        try:
+            return self._nuc_alleles[two_field_name(allele)]
+        except KeyError:
+            raise ValueError(f"{allele} has no coding sequence")
+
+    def _in_step(self, locus: str, seq: str) -> bool:
+        """
+        Check if a coding sequence lines up with the reference columns
+
+        :param locus: HLA locus
+        :param seq: coding sequence of an allele of the locus
+        :return: False for an allele carrying an insertion in ungapped coordinates
+        """
+        return len(seq) == self.lengths[locus]
+
+    def _own_start(self, locus: str, seq: str, position: int) -> int:
+        """
+        Get the column of the first base of a position in an allele's own coordinates
+
+        :param locus: HLA locus
+        :param seq: coding sequence of an allele out of step with the reference
+        :param position: mature protein position
+        :return: column of the first base of the codon
+        """
+        start = 3 * (self.leaders[locus] + position - 1)
+        if position < 1 or start + 3 > len(seq):
+            raise IndexError(f"{locus} allele has no position {position}")
+        return start
+
+    def codon(self, allele: str, position: int) -> str:
+        """
+        Get the codon of a mature protein position
+
+        :param allele: two-field allele, or a full name with a coding sequence
+        :param position: mature protein position
+        :return: the three nucleotides, or None at a gap of the reference
+        """
+        full_name = self.nuc_allele(allele)
+        if position < 1:
+            raise IndexError(f"{allele} has no position {position}")
+        locus = allele.split("*")[0]
+        seq = self.nuc_seqs[full_name]
+        if not self._in_step(locus, seq):
+            start = self._own_start(locus, seq, position)
+            return seq[start : start + 3]
+        columns = self.codons[locus][position - 1]
+        if columns is None:
+            return None
+        return seq[columns[0]] + seq[columns[1]] + seq[columns[2]]
+
+    def _gatherer(self, locus: str, positions: tuple) -> tuple:
+        try:
+            return self._gatherers[locus, positions]
+        except KeyError:
+            pass
+        codons = self.codons[locus]
+        coded = tuple(
+            position
+            for position in positions
+            if 0 < position <= len(codons) and codons[position - 1] is not None
+        )
+        columns = [column for position in coded for column in codons[position - 1]]
+        # three columns per codon, so the itemgetter always returns a tuple
+        gather = operator.itemgetter(*columns) if columns else None
+        self._gatherers[locus, positions] = coded, gather
+        return coded, gather
+
+    def codons_at(self, allele: str, positions) -> tuple:
+        """
+        Get the codons of many mature protein positions in one pass
+
+        :param allele: two-field allele, or a full name with a coding sequence
+        :param positions: mature protein positions
+        :return: tuple of the positions that have a codon and list of their codons
+        """
+        full_name = self.nuc_allele(allele)
+        locus = allele.split("*")[0]
+        seq = self.nuc_seqs[full_name]
+        if not self._in_step(locus, seq):
+            start = 3 * self.leaders[locus]
+            coded = tuple(p for p in positions if 0 < p and start + 3 * p <= len(seq))
+            return coded, [seq[start + 3 * p - 3 : start + 3 * p] for p in coded]
+        coded, gather = self._gatherer(locus, tuple(positions))
+        if gather is None:
+            return coded, []
+        bases = "".join(gather(seq))
+        return coded, [bases[i : i + 3] for i in range(0, len(bases), 3)]
+
+    def mismatches(self, donor: list[str], recip: list[str], positions) -> dict:
+        """
+        Classify the codons of distinct donor alleles absent in the recipient
+
+        :param donor: distinct donor alleles of one locus
+        :param recip: recipient alleles of the locus
+        :param positions: mature protein positions to compare
+        :return: dictionary as returned by GENIE.codonMismatches
+        """
+        # codons by position, as alleles out of step may cover other positions
+        recip_codons = [
+            dict(zip(*self.codons_at(allele, positions))) for allele in recip
+        ]
+        result = {
+            "codons": [],
+            SYNONYMOUS: 0,
+            NON_SYNONYMOUS: 0,
+            UNKNOWN: 0,
+            "nucleotide_differences": 0,
+        }
+        for allele in donor:
+            coded, codons = self.codons_at(allele, positions)
+            for position, codon in zip(coded, codons):
+                if not all(position in recip_codon for recip_codon in recip_codons):
+                    continue
+                at_position = [recip_codon[position] for recip_codon in recip_codons]
+                classified = classify_codon(codon, at_position)
+                if classified is None:
+                    continue
+                kind, closest = classified
+                differences = _differences(codon, closest)
+                result["codons"].append(
+                    {
+                        "allele": allele,
+                        "position": position,
+                        "donor": codon,
+                        "recipient": closest,
+                        "differences": differences,
+                        "type": kind,
+                    }
+                )
+                result[kind] += 1
+                result["nucleotide_differences"] += differences
+        return result
+
+    def residue_position(self, allele: str, nuc_position: int):
+        """
+        Get the mature protein position coded at a nucleotide position
+
+        :param allele: two-field allele, or a full name with a coding sequence
+        :param nuc_position: position in the coding sequence
+        :return: tuple of (mature position, position within the codon from 1
+            to 3), or None outside the mature protein
+        """
+        if nuc_position < 1:
+            raise IndexError(f"{allele} has no nucleotide position {nuc_position}")
+        locus = allele.split("*")[0]
+        seq = self.nuc_seqs[self.nuc_allele(allele)]
+        if self._in_step(locus, seq):
+            return self.residues[locus][nuc_position - 1]
+        if nuc_position > len(seq) - len(seq) % 3:
+            raise IndexError(f"{allele} has no nucleotide position {nuc_position}")
+        codon, offset = divmod(nuc_position - 1, 3)
+        if codon < self.leaders[locus]:
+            return None
+        return codon - self.leaders[locus] + 1, offset + 1
@@ -1,47 +1,44 @@
-import copy
-import functools
+import glob  # for stale temporary builds
+import os  # for atomic replacement of the database
+import pathlib  # for path manipulation
+import shutil  # for copying a database to extend it
 import sqlite3
-import hlagenie.load
-from .load import (
-    load_sequence_alignment,
-    load_nucleotide_alignment,
-)
+from .pipeline import build_locus_tables  # for pipelined builds
 from hlagenie.configs import config
-from hlagenie.smart_sort import smart_sort_comparator
 from . import db
+from . import metrics  # for build instrumentation
 from .misc import find_gaps, regex_gen, coordinate, coordinate_end
-import pyard  # for HLA nomenclature
+from .misc import get_default_db_directory  # for the default data directory
+from .coordinates import translate_sequence, two_field_name  # for translated tables
+from .residues import PolymorphismIndex  # for the polymorphic positions
 
 
 def generate_gapped_tables(
-    db_conn: sqlite3.Connection, imgt_version, imputed, imputation_method, load_mac: bool = True
+    db_conn: sqlite3.Connection,
+    imgt_version,
+    imputed,
+    imputation_method,
+    load_mac: bool = True,
+    ard=None,
+    data_dir=None,
 ):
     """
     Create tables with gapped sequences for every allele in the IMGT/HLA database for each locus
 
     :param db_conn: The database connection object
+    :param ard: py-ard object used to reduce alleles to two fields, created if None
+    :param data_dir: directory where downloaded alignments are cached
     :return: dictionary of gapped sequences
     """
 
-    # check if the tables exist so as to not rebuild if unnecessary
-    if db.tables_exist(db_conn, config["gapped_tables"]):
-        return db.load_gapped_tables(db_conn)
+    # initialize pyard object if not given, imported here as only builds need it
+    if ard is None:
+        import pyard  # for HLA nomenclature
 
-    # initialize pyard object
-    ard = pyard.init(imgt_version, load_mac=load_mac)
-
-    # initialize the dictionary to store all sequences
-    gapped_seqs = {}
-
-    # retrieve multiple sequence alignment for each locus
-    for locus in config["loci"]:
-        # load the sequence alignment
-        multi_seq = load_sequence_alignment(
-            imgt_version, locus, imputed, imputation_method
-        )
-
-        # turn the sequence alignment into a dictionary
+        ard = pyard.init(imgt_version, load_mac=load_mac)
 
+    # turn the sequence alignment of a locus into a dictionary
+    def process(locus, multi_seq):
         ## initialize a per-locus dictionary
         loc_seqs = {}
 
@@ -58,13 +55,19 @@ def generate_gapped_tables(
             if allele not in loc_seqs.keys():
                 loc_seqs[allele] = str(record.seq)
 
-        # save the sequence alignment to the database
-        db.save_dict(db_conn, f"{locus}_gapped", loc_seqs, ("allele", "seq"))
+        return loc_seqs
 
-        # update overall dictionary
-        gapped_seqs.update(loc_seqs)
-
-    return gapped_seqs
+    # download, process and save the alignments of all loci as a pipeline
+    return build_locus_tables(
+        db_conn,
+        imgt_version,
+        "prot",
+        imputed,
+        imputation_method,
+        "gapped",
+        process,
+        data_dir,
+    )
 
 
 def generate_gapped_mature_tables(db_conn: sqlite3.Connection):
@@ -74,17 +77,13 @@ def generate_gapped_mature_tables(db_conn: sqlite3.Connection):
     :return: dictionary of gapped mature sequences
     """
 
-    # check if the tables exist so as to not rebuild if unnecessary
-    if db.tables_exist(db_conn, config["gapped_mature_tables"]):
-        return db.load_gapped_mature_tables(db_conn)
-
     # initialize dictionary to store all sequences
     mature_seqs = {}
 
     # retrieve gapped sequences for each locus
     for locus in config["loci"]:
         # get the gapped sequences
-        locus_seqs = db.load_dict(db_conn, f"{locus}_gapped", ("allele", "seq"))
+        locus_seqs = db.load_sequences(db_conn, "gapped", locus)
 
         # get the reference sequence
         ref_allele = config["refseq"][locus]
@@ -107,7 +106,7 @@ def generate_gapped_mature_tables(db_conn: sqlite3.Connection):
             loc_dict[key] = value[start_coords:]
 
         # save the dictionary to the database
-        db.save_dict(db_conn, f"{locus}_gapped_mature", loc_dict, ("allele", "seq"))
+        db.save_sequences(db_conn, "gapped_mature", locus, loc_dict)
 
         # update overall dictionary
         mature_seqs.update(loc_dict)
@@ -117,32 +116,31 @@ def generate_gapped_mature_tables(db_conn: sqlite3.Connection):
 
 # TODO - consider if this should leave positions which are simply unknown (current) or also remove these
 def generate_ungapped_tables(
-    db_conn: sqlite3.Connection, imgt_version, imputed, imputation_method, load_mac: bool = True
+    db_conn: sqlite3.Connection,
+    imgt_version,
+    imputed,
+    imputation_method,
+    load_mac: bool = True,
+    ard=None,
+    data_dir=None,
 ):
     """
     Create tables with ungapped sequences for every allele in the IMGT/HLA database for each locus
 
     :param db_conn: The database connection object
+    :param ard: py-ard object used to reduce alleles to two fields, created if None
+    :param data_dir: directory where downloaded alignments are cached
     :return: dictionary of ungapped sequences
     """
 
-    # check if the tables exist so as to not rebuild if unnecessary
-    if db.tables_exist(db_conn, config["ungapped_tables"]):
-        return db.load_ungapped_tables(db_conn)
+    # initialize pyard object if not given, imported here as only builds need it
+    if ard is None:
+        import pyard  # for HLA nomenclature
 
-    # initialize pyard object
-    ard = pyard.init(imgt_version, load_mac=load_mac)
-
-    # initialize the dictionary to store all sequences
-    ungapped_seqs = {}
-
-    # retrieve multiple sequence alignment for each locus
-    for locus in config["loci"]:
-        # load the sequence alignment
-        multi_seq = load_sequence_alignment(
-            imgt_version, locus, imputed, imputation_method
-        )
+        ard = pyard.init(imgt_version, load_mac=load_mac)
 
+    # turn the sequence alignment of a locus into a dictionary of ungapped sequences
+    def process(locus, multi_seq):
         # get the reference sequence
         ref_allele = config["refseq"][locus]
         for record in multi_seq:
@@ -150,47 +148,52 @@ def generate_ungapped_tables(
                 ref_seq = str(record.seq)
                 break
 
-        # get the gaps in the reference sequence
-        gaps = find_gaps(ref_seq)
-
-        # turn the sequence alignment into a dictionary
+        # get the gaps in the reference sequence, as a set for fast lookups
+        gaps = set(find_gaps(ref_seq))
 
         ## initialize a per-locus dictionary
         loc_seqs = {}
 
-        ## iterate through the sequence alignment
-        for record in multi_seq:
-            ### use py-ard to get two-field allele
-            allele = ard.redux(record.id, "U2")
-
-            # for DRB345, skip if not specific locus
-            if allele.split("*")[0] != locus:
-                continue
-
-            ### only add allele if not already present to avoid overwriting with less complete sequence
-            if allele not in loc_seqs.keys():
-                #### remove gaps from the sequence (if actually a gap)
-                sequence = "".join(
-                    [
-                        char
-                        for i, char in enumerate(str(record.seq))
-                        if ((i not in gaps) or (char != "-"))
-                    ]
-                )
-
-                loc_seqs[allele] = sequence
-
-        # save the sequence alignment to the database
-        db.save_dict(db_conn, f"{locus}_ungapped", loc_seqs, ("allele", "seq"))
-
-        # update overall dictionary
-        ungapped_seqs.update(loc_seqs)
-
-    return ungapped_seqs
+        ## iterate through the sequence alignment, timed once per locus
+        with metrics.timer("gap_strip_seconds", locus=locus):
+            for record in multi_seq:
+                ### use py-ard to get two-field allele
+                allele = ard.redux(record.id, "U2")
+
+                # for DRB345, skip if not specific locus
+                if allele.split("*")[0] != locus:
+                    continue
+
+                ### only add allele if not already present to avoid overwriting with less complete sequence
+                if allele not in loc_seqs.keys():
+                    #### remove gaps from the sequence (if actually a gap)
+                    sequence = "".join(
+                        [
+                            char
+                            for i, char in enumerate(str(record.seq))
+                            if ((i not in gaps) or (char != "-"))
+                        ]
+                    )
+
+                    loc_seqs[allele] = sequence
+
+        return loc_seqs
+
+    # download, process and save the alignments of all loci as a pipeline
+    return build_locus_tables(
+        db_conn,
+        imgt_version,
+        "prot",
+        imputed,
+        imputation_method,
+        "ungapped",
+        process,
+        data_dir,
+    )
 
 
 def generate_completed_table(
-    db_conn: sqlite3.Connection, locus: str, seqtype: str, seqs: dict
+    db_conn: sqlite3.Connection, locus: str, seqtype: str, seqs: dict, ungap: bool
 ):
     """
     Create table with list of allele with completed sequences
@@ -203,12 +206,11 @@ def generate_completed_table(
     :type seqtype: str
     :param seqs: dictionary of sequences
     :type seqs: dict
+    :param ungap: whether ungapped sequences were used
+    :type ungap: bool
     :return: list of alleles with completed sequences
     """
 
-    if db.table_exists(db_conn, f"{locus}_completed_{seqtype}"):
-        return db.load_set(db_conn, f"{locus}_completed_{seqtype}", ("allele"))
-
     if seqtype == "prot":
         # get the reference sequence
         ref_allele = config["refseq"][locus]
@@ -236,13 +238,15 @@ def generate_completed_table(
     completed = [allele for allele in completed if not allele[-1].isalpha()]
 
     # save the list to the database
-    db.save_set(db_conn, f"{locus}_completed_{seqtype}", set(completed), ("allele"))
+    db.save_allele_list(
+        db_conn, db.allele_list_name(ungap, locus, "completed", seqtype), completed
+    )
 
     return completed
 
 
 def generate_incomplete_table(
-    db_conn: sqlite3.Connection, locus: str, seqtype: str, seqs: dict
+    db_conn: sqlite3.Connection, locus: str, seqtype: str, seqs: dict, ungap: bool
 ):
     """
     Create table with list of allele with incomplete sequences
@@ -255,12 +259,11 @@ def generate_incomplete_table(
     :type seqtype: str
     :param seqs: dictionary of sequences
     :type seqs: dict
+    :param ungap: whether ungapped sequences were used
+    :type ungap: bool
     :return: list of alleles with incomplete sequences
     """
 
-    if db.table_exists(db_conn, f"{locus}_incomplete_{seqtype}"):
-        return db.load_set(db_conn, f"{locus}_incomplete_{seqtype}", ("allele"))
-
     if seqtype == "prot":
         # get the reference sequence
         ref_allele = config["refseq"][locus]
@@ -288,7 +291,9 @@ def generate_incomplete_table(
     incomplete = [allele for allele in incomplete if not allele[-1].isalpha()]
 
     # save the list to the database
-    db.save_set(db_conn, f"{locus}_incomplete_{seqtype}", set(incomplete), ("allele"))
+    db.save_allele_list(
+        db_conn, db.allele_list_name(ungap, locus, "incomplete", seqtype), incomplete
+    )
 
     return incomplete
 
@@ -312,9 +317,6 @@ def generate_extended_table(
     :return: list of alleles with extended sequences
     """
 
-    if db.table_exists(db_conn, f"{locus}_extended_{seqtype}"):
-        return db.load_set(db_conn, f"{locus}_extended_{seqtype}", ("allele"))
-
     if seqtype == "prot":
         # get the reference sequence
         ref_allele = config["refseq"][locus]
@@ -346,7 +348,9 @@ def generate_extended_table(
         ]
 
     # save the list to the database
-    db.save_set(db_conn, f"{locus}_extended_{seqtype}", set(extended), ("allele"))
+    db.save_allele_list(
+        db_conn, db.allele_list_name(ungap, locus, "extended", seqtype), extended
+    )
 
     return extended
 
@@ -358,17 +362,13 @@ def generate_ungapped_mature_tables(db_conn: sqlite3.Connection):
     :return: dictionary of ungapped mature sequences
     """
 
-    # check if the tables exist so as to not rebuild if unnecessary
-    if db.tables_exist(db_conn, config["ungapped_mature_tables"]):
-        return db.load_ungapped_mature_tables(db_conn)
-
     # initialize dictionary to store all sequences
     mature_seqs = {}
 
     # retrieve gapped sequences for each locus
     for locus in config["loci"]:
         # get the gapped sequences
-        locus_seqs = db.load_dict(db_conn, f"{locus}_ungapped", ("allele", "seq"))
+        locus_seqs = db.load_sequences(db_conn, "ungapped", locus)
 
         # get the reference sequence
         ref_allele = config["refseq"][locus]
@@ -391,7 +391,7 @@ def generate_ungapped_mature_tables(db_conn: sqlite3.Connection):
             loc_dict[key] = value[start_coords:]
 
         # save the dictionary to the database
-        db.save_dict(db_conn, f"{locus}_ungapped_mature", loc_dict, ("allele", "seq"))
+        db.save_sequences(db_conn, "ungapped_mature", locus, loc_dict)
 
         # update overall dictionary
         mature_seqs.update(loc_dict)
@@ -408,13 +408,6 @@ def generate_gapped_ard_table(db_conn: sqlite3.Connection, seqs: dict):
     :return: dictionary of ARD ending positions
     """
 
-    # check if the table exists so as to not rebuild if unnecessary
-    if db.table_exists(db_conn, "gapped_ard"):
-        ard_ends = db.load_dict(db_conn, "gapped_ard", ("locus", "ard_end"))
-        # convert the values to integers
-        ard_ends = dict(map(lambda x: (x[0], int(x[1])), ard_ends.items()))
-        return ard_ends
-
     # initialize dictionary to store ard positions
     ard_ends = {}
 
@@ -436,7 +429,7 @@ def generate_gapped_ard_table(db_conn: sqlite3.Connection, seqs: dict):
         ard_ends[locus] = int(end_coords)
 
     # save the dictionary to the database
-    db.save_dict(db_conn, "gapped_ard", ard_ends, ("locus", "ard_end"))
+    db.save_region_ends(db_conn, "gapped_ard", ard_ends)
 
     return ard_ends
 
@@ -450,13 +443,6 @@ def generate_gapped_xrd_table(db_conn: sqlite3.Connection, seqs: dict):
     :return: dictionary of XRD ending positions
     """
 
-    # check if the table exists so as to not rebuild if unnecessary
-    if db.table_exists(db_conn, "gapped_xrd"):
-        xrd_ends = db.load_dict(db_conn, "gapped_xrd", ("locus", "xrd_end"))
-        # convert the values to integers
-        xrd_ends = dict(map(lambda x: (x[0], int(x[1])), xrd_ends.items()))
-        return xrd_ends
-
     # initialize dictionary to store ard positions
     xrd_ends = {}
 
@@ -478,7 +464,7 @@ def generate_gapped_xrd_table(db_conn: sqlite3.Connection, seqs: dict):
         xrd_ends[locus] = int(end_coords)
 
     # save the dictionary to the database
-    db.save_dict(db_conn, "gapped_xrd", xrd_ends, ("locus", "xrd_end"))
+    db.save_region_ends(db_conn, "gapped_xrd", xrd_ends)
 
     return xrd_ends
 
@@ -492,13 +478,6 @@ def generate_ungapped_ard_table(db_conn: sqlite3.Connection, seqs: dict):
     :return: dictionary of ARD ending positions
     """
 
-    # check if the table exists so as to not rebuild if unnecessary
-    if db.table_exists(db_conn, "ungapped_ard"):
-        ard_ends = db.load_dict(db_conn, "ungapped_ard", ("locus", "ard_end"))
-        # convert the values to integers
-        ard_ends = dict(map(lambda x: (x[0], int(x[1])), ard_ends.items()))
-        return ard_ends
-
     # initialize dictionary to store ard positions
     ard_ends = {}
 
@@ -520,7 +499,7 @@ def generate_ungapped_ard_table(db_conn: sqlite3.Connection, seqs: dict):
         ard_ends[locus] = int(end_coords)
 
     # save the dictionary to the database
-    db.save_dict(db_conn, "ungapped_ard", ard_ends, ("locus", "ard_end"))
+    db.save_region_ends(db_conn, "ungapped_ard", ard_ends)
 
     return ard_ends
 
@@ -534,13 +513,6 @@ def generate_ungapped_xrd_table(db_conn: sqlite3.Connection, seqs: dict):
     :return: dictionary of XRD ending positions
     """
 
-    # check if the table exists so as to not rebuild if unnecessary
-    if db.table_exists(db_conn, "ungapped_xrd"):
-        xrd_ends = db.load_dict(db_conn, "ungapped_xrd", ("locus", "xrd_end"))
-        # convert the values to integers
-        xrd_ends = dict(map(lambda x: (x[0], int(x[1])), xrd_ends.items()))
-        return xrd_ends
-
     # initialize dictionary to store ard positions
     xrd_ends = {}
 
@@ -562,35 +534,28 @@ def generate_ungapped_xrd_table(db_conn: sqlite3.Connection, seqs: dict):
         xrd_ends[locus] = int(end_coords)
 
     # save the dictionary to the database
-    db.save_dict(db_conn, "ungapped_xrd", xrd_ends, ("locus", "xrd_end"))
+    db.save_region_ends(db_conn, "ungapped_xrd", xrd_ends)
 
     return xrd_ends
 
 
 def generate_ungapped_nuc_tables(
-    db_conn: sqlite3.Connection, imgt_version, imputed, imputation_method
+    db_conn: sqlite3.Connection,
+    imgt_version,
+    imputed,
+    imputation_method,
+    data_dir=None,
 ):
     """Generate a table with ungapped nucleotide sequences for every locus
 
     :param db_conn: The database connection object
     :type db_conn: sqlite3.Connection
+    :param data_dir: directory where downloaded alignments are cached
     :return: dictionary of ungapped nucleotide sequences
     """
-    # check if the tables exist so as to not rebuild if unnecessary
-    if db.tables_exist(db_conn, config["ungapped_nuc_tables"]):
-        return db.load_ungapped_nuc_tables(db_conn)
-
-
-    # initialize the dictionary to store all sequences
-    ungapped_seqs = {}
-
-    # retrieve multiple sequence alignment for each locus
-    for locus in config["loci"]:
-        # load the nucleotide sequence alignment
-        multi_seq = load_nucleotide_alignment(
-            imgt_version, locus, imputed, imputation_method
-        )
 
+    # turn the sequence alignment of a locus into a dictionary of ungapped sequences
+    def process(locus, multi_seq):
         # get the reference sequence
         ref_allele = config["refseq_full"][locus]
         for record in multi_seq:
@@ -598,11 +563,66 @@ def generate_ungapped_nuc_tables(
                 ref_seq = str(record.seq)
                 break
 
-        # get the gaps in the reference sequence
-        gaps = find_gaps(ref_seq)
+        # get the gaps in the reference sequence, as a set for fast lookups
+        gaps = set(find_gaps(ref_seq))
+
+        ## initialize a per-locus dictionary
+        loc_seqs = {}
+
+        ## iterate through the sequence alignment, timed once per locus
+        with metrics.timer("gap_strip_seconds", locus=locus):
+            for record in multi_seq:
+                allele = record.id
+
+                # for DRB345, skip if not specific locus
+                if allele.split("*")[0] != locus:
+                    continue
+
+                ### only add allele if not already present to avoid overwriting with less complete sequence
+                if allele not in loc_seqs.keys():
+                    #### remove gaps from the sequence (if actually a gap)
+                    sequence = "".join(
+                        [
+                            char
+                            for i, char in enumerate(str(record.seq))
+                            if ((i not in gaps) or (char != "-"))
+                        ]
+                    )
+
+                    loc_seqs[allele] = sequence
+
+        return loc_seqs
+
+    # download, process and save the alignments of all loci as a pipeline
+    return build_locus_tables(
+        db_conn,
+        imgt_version,
+        "nuc",
+        imputed,
+        imputation_method,
+        "ungapped_nuc",
+        process,
+        data_dir,
+    )
 
-        # turn the sequence alignment into a dictionary
 
+def generate_gapped_nuc_tables(
+    db_conn: sqlite3.Connection,
+    imgt_version,
+    imputed,
+    imputation_method,
+    data_dir=None,
+):
+    """
+    Create tables with gapped nucleotide sequences for every allele in the IMGT/HLA database for each locus
+
+    :param db_conn: The database connection object
+    :param data_dir: directory where downloaded alignments are cached
+    :return: dictionary of gapped sequences
+    """
+
+    # turn the sequence alignment of a locus into a dictionary
+    def process(locus, multi_seq):
         ## initialize a per-locus dictionary
         loc_seqs = {}
 
@@ -616,74 +636,87 @@ def generate_ungapped_nuc_tables(
 
             ### only add allele if not already present to avoid overwriting with less complete sequence
             if allele not in loc_seqs.keys():
-                #### remove gaps from the sequence (if actually a gap)
-                sequence = "".join(
-                    [
-                        char
-                        for i, char in enumerate(str(record.seq))
-                        if ((i not in gaps) or (char != "-"))
-                    ]
-                )
-
-                loc_seqs[allele] = sequence
+                loc_seqs[allele] = str(record.seq)
 
-        # save the sequence alignment to the database
-        db.save_dict(db_conn, f"{locus}_ungapped_nuc", loc_seqs, ("allele", "seq"))
+        return loc_seqs
 
-        # update overall dictionary
-        ungapped_seqs.update(loc_seqs)
+    # download, process and save the alignments of all loci as a pipeline
+    return build_locus_tables(
+        db_conn,
+        imgt_version,
+        "nuc",
+        imputed,
+        imputation_method,
+        "gapped_nuc",
+        process,
+        data_dir,
+    )
 
-    return ungapped_seqs
 
-
-def generate_gapped_nuc_tables(
-    db_conn: sqlite3.Connection, imgt_version, imputed, imputation_method
+def generate_translated_tables(
+    db_conn: sqlite3.Connection, full_seqs: dict, seqs: dict, nuc_seqs: dict
 ):
     """
-    Create tables with gapped nucleotide sequences for every allele in the IMGT/HLA database for each locus
+    Create tables with the mature proteins translated from the ungapped coding
+    sequences, keyed by full allele name, and record where they disagree with
+    the protein alignments
+
+    Positions where either side has a gap or an unknown residue are not
+    compared. A full name is compared with the protein of its two-field name.
 
     :param db_conn: The database connection object
-    :return: dictionary of gapped sequences
+    :param full_seqs: dictionary of ungapped full protein sequences
+    :param seqs: dictionary of ungapped mature protein sequences
+    :param nuc_seqs: dictionary of ungapped coding sequences
+    :return: dictionary of translated mature sequences
     """
+    translated_seqs = {}
+    discrepancies = []
 
-    # check if the tables exist so as to not rebuild if unnecessary
-    if db.tables_exist(db_conn, config["gapped_nuc_tables"]):
-        return db.load_gapped_nuc_tables(db_conn)
-
-    # initialize the dictionary to store all sequences
-    gapped_seqs = {}
-
-    # retrieve multiple sequence alignment for each locus
     for locus in config["loci"]:
-        # load the sequence alignment
-        multi_seq = load_nucleotide_alignment(
-            imgt_version, locus, imputed, imputation_method
-        )
+        # get the length of the leader from the reference sequence
+        ref_allele = config["refseq"][locus]
+        leader = len(full_seqs[ref_allele]) - len(seqs[ref_allele])
 
-        # turn the sequence alignment into a dictionary
+        # translate every coding sequence of the locus, removing the leader
+        loc_dict = {}
+        with metrics.timer("translate_seconds", locus=locus):
+            for allele, nuc_seq in nuc_seqs.items():
+                if allele.split("*")[0] == locus:
+                    loc_dict[allele] = translate_sequence(nuc_seq)[leader:]
+
+        # compare with the aligned protein of the two-field allele
+        for allele, translated in loc_dict.items():
+            protein = seqs.get(two_field_name(allele))
+            if protein is None:
+                continue
+            for position, (residue, aligned) in enumerate(zip(translated, protein), 1):
+                if residue != aligned and residue not in "-*" and aligned not in "-*":
+                    discrepancies.append((allele, position, residue, aligned))
 
-        ## initialize a per-locus dictionary
-        loc_seqs = {}
+        # save the dictionary to the database
+        db.save_sequences(db_conn, "ungapped_translated", locus, loc_dict)
 
-        ## iterate through the sequence alignment
-        for record in multi_seq:
-            allele = record.id
+        # update overall dictionary
+        translated_seqs.update(loc_dict)
 
-            # for DRB345, skip if not specific locus
-            if allele.split("*")[0] != locus:
-                continue
+    db.save_discrepancies(db_conn, "ungapped", discrepancies)
 
-            ### only add allele if not already present to avoid overwriting with less complete sequence
-            if allele not in loc_seqs.keys():
-                loc_seqs[allele] = str(record.seq)
+    return translated_seqs
 
-        # save the sequence alignment to the database
-        db.save_dict(db_conn, f"{locus}_gapped_nuc", loc_seqs, ("allele", "seq"))
 
-        # update overall dictionary
-        gapped_seqs.update(loc_seqs)
+def generate_residue_count_table(db_conn: sqlite3.Connection, seqs: dict, ungap: bool):
+    """
+    Create a table with the residue counts at the polymorphic positions of each locus
 
-    return gapped_seqs
+    :param db_conn: The database connection object
+    :param seqs: dictionary of mature sequences
+    :param ungap: whether ungapped sequences were used
+    :return: dictionary of locus to dictionary of position to residue counts
+    """
+    counts = PolymorphismIndex.from_seqs(seqs).counts
+    db.save_residue_counts(db_conn, "ungapped" if ungap else "gapped", counts)
+    return counts
 
 
 def set_db_version(db_connection: sqlite3.Connection, imgt_version):
@@ -702,3 +735,120 @@ def set_db_version(db_connection: sqlite3.Connection, imgt_version):
     db.set_user_version(db_connection, int(imgt_version))
     print("Version:", imgt_version)
     return imgt_version
+
+
+def build_database(
+    data_dir,
+    imgt_version,
+    imputed: bool,
+    imputation_method: str,
+    ungap: bool = True,
+    load_mac: bool = True,
+    ard=None,
+) -> str:
+    """
+    Build every table of a sequence mode, unless a complete build exists
+
+    The build runs under a lock file, so processes starting at the same time
+    wait for one of them to build instead of all downloading. Tables are
+    written to a temporary database in a single transaction, marked complete
+    and then renamed over the database in one step, so a crashed build never
+    leaves a partial database behind. A database already built for the other mode is copied
+    into the temporary one and kept.
+
+    :param data_dir: directory of the database, default if None
+    :param imgt_version: IMGT/HLA version
+    :param imputed: whether to use imputed sequences
+    :param imputation_method: imputation method of imputed sequences
+    :param ungap: build the ungapped tables if True, the gapped ones if False
+    :param load_mac: load MACs when py-ard is initialized for the build
+    :param ard: py-ard object used to reduce alleles to two fields, created if None
+    :return: path of the database
+    """
+    if data_dir is None:
+        data_dir = get_default_db_directory()
+    pathlib.Path(data_dir).mkdir(parents=True, exist_ok=True)
+
+    mode = "ungapped" if ungap else "gapped"
+    db_path = db.db_filename(data_dir, imgt_version, imputed, imputation_method)
+    if mode in db.completed_builds(db_path):
+        return db_path
+
+    with db.file_lock(f"{db_path}.lock"):
+        # another process may have finished the build while this one waited
+        completed = db.completed_builds(db_path)
+        if mode in completed:
+            return db_path
+
+        # builds that crashed left their temporary files behind
+        for stale in glob.glob(f"{glob.escape(db_path)}.*.tmp"):
+            os.remove(stale)
+
+        tmp_path = f"{db_path}.{os.getpid()}.tmp"
+        if completed:
+            shutil.copyfile(db_path, tmp_path)
+        print(f"Building {mode} tables in database file {db_path}")
+
+        # the temporary file is discarded on any error, so it needs neither a
+        # journal nor syncs, and every table is written in one transaction
+        conn = sqlite3.connect(tmp_path, isolation_level=None)
+        try:
+            for pragma in db.BULK_LOAD_PRAGMAS:
+                conn.execute(pragma)
+            set_db_version(conn, imgt_version)
+            conn.execute("BEGIN")
+            db.create_schema(conn)
+            if ungap:
+                full_seqs = generate_ungapped_tables(
+                    conn,
+                    imgt_version,
+                    imputed,
+                    imputation_method,
+                    load_mac,
+                    ard,
+                    data_dir,
+                )
+                nuc_seqs = generate_ungapped_nuc_tables(
+                    conn, imgt_version, imputed, imputation_method, data_dir
+                )
+                seqs = generate_ungapped_mature_tables(conn)
+                generate_ungapped_ard_table(conn, seqs)
+                generate_ungapped_xrd_table(conn, seqs)
+                generate_translated_tables(conn, full_seqs, seqs, nuc_seqs)
+            else:
+                generate_gapped_tables(
+                    conn,
+                    imgt_version,
+                    imputed,
+                    imputation_method,
+                    load_mac,
+                    ard,
+                    data_dir,
+                )
+                nuc_seqs = generate_gapped_nuc_tables(
+                    conn, imgt_version, imputed, imputation_method, data_dir
+                )
+                seqs = generate_gapped_mature_tables(conn)
+                generate_gapped_ard_table(conn, seqs)
+                generate_gapped_xrd_table(conn, seqs)
+
+            generate_residue_count_table(conn, seqs, ungap)
+
+            # allele lists, so queries never write to the database
+            for locus in config["loci"]:
+                for seqtype, seqtype_seqs in (("prot", seqs), ("nuc", nuc_seqs)):
+                    generate_completed_table(conn, locus, seqtype, seqtype_seqs, ungap)
+                    generate_incomplete_table(conn, locus, seqtype, seqtype_seqs, ungap)
+                    generate_extended_table(conn, locus, seqtype, ungap, seqtype_seqs)
+
+            db.mark_build_complete(conn, mode)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.close()
+            os.remove(tmp_path)
+            raise
+        conn.close()
+
+        os.replace(tmp_path, db_path)
+
+    return db_path
@@ -1,371 +1,496 @@
 import sqlite3  # for database operations
 import pathlib  # for path manipulation
+from contextlib import contextmanager  # for the build lock
+
+try:
+    import fcntl  # for locking builds on POSIX
+except ImportError:
+    fcntl = None
+    import msvcrt  # for locking builds on Windows
 from .misc import (
     get_imgt_db_versions,
     get_default_db_directory,
 )  # for getting default database directory
 from .load import load_latest_version
 from hlagenie.configs import config  # configurations
-
-
-def create_db_connection(data_dir, imgt_version, imputed, imputation_method):
-    """
-    Create connection to SQLite database
-
-    :param data_dir: The directory where the database is stored
+from . import metrics  # for write and load timings
+
+
+# version of the table layout, recorded in the manifest of every build
+SCHEMA_VERSION = 5
+
+# every table of a build, keyed by kind and locus so one query loads a kind
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS sequences (
+        kind TEXT NOT NULL,
+        locus TEXT NOT NULL,
+        allele TEXT NOT NULL,
+        seq TEXT NOT NULL,
+        PRIMARY KEY (kind, locus, allele)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS region_ends (
+        kind TEXT NOT NULL,
+        locus TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        PRIMARY KEY (kind, locus)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS allele_lists (
+        name TEXT NOT NULL,
+        allele TEXT NOT NULL,
+        PRIMARY KEY (name, allele)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS discrepancies (
+        kind TEXT NOT NULL,
+        allele TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        translated TEXT NOT NULL,
+        protein TEXT NOT NULL,
+        PRIMARY KEY (kind, allele, position)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS residue_counts (
+        kind TEXT NOT NULL,
+        locus TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        residue TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (kind, locus, position, residue)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS regions (
+        kind TEXT NOT NULL,
+        name TEXT NOT NULL,
+        locus TEXT NOT NULL,
+        positions TEXT NOT NULL,
+        PRIMARY KEY (kind, name, locus)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS manifest (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    ) WITHOUT ROWID""",
+)
+
+# settings for writing a fresh database that is renamed into place once
+# complete, so a crash loses nothing that the rename would have published
+BULK_LOAD_PRAGMAS = (
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA locking_mode = EXCLUSIVE",
+)
+
+
+def db_filename(data_dir, imgt_version, imputed, imputation_method) -> str:
+    """
+    Get the path of the database of a version and imputation
+
+    :param data_dir: The directory where the database is stored, default if None
     :param imgt_version: The version of the IMGT/HLA database to use
-    :return: The database connection
+    :param imputed: whether imputed sequences are used
+    :param imputation_method: imputation method of imputed sequences
+    :return: path of the database file
     """
-
-    # set data directory
     if data_dir is None:
         data_dir = get_default_db_directory()
-
-    # set database filename
     if imputed:
-        db_filename = (
-            f"{data_dir}/hlagenie-{imgt_version}-imputed-{imputation_method}.db"
-        )
-    else:
-        db_filename = f"{data_dir}/hlagenie-{imgt_version}.db"
-
-    # Check if imgt_version is valid
-    # if not pathlib.Path(db_filename).exists():
-    #    all_versions = get_imgt_db_versions()
-    #    if str(imgt_version) not in all_versions:
-    #        raise ValueError(f"{imgt_version} is not a valid IMGT version")
+        return f"{data_dir}/hlagenie-{imgt_version}-imputed-{imputation_method}.db"
+    return f"{data_dir}/hlagenie-{imgt_version}.db"
 
-    # Create the data directory if it doesn't exist
-    if not pathlib.Path(data_dir).exists():
-        pathlib.Path(data_dir).mkdir(parents=True, exist_ok=True)
 
-    # Create the database file and alert user
-    if not pathlib.Path(db_filename).exists():
-        print(f"Creating database file {db_filename} as cache")
+@contextmanager
+def file_lock(lock_path: str):
+    """
+    Hold an exclusive lock on a file, waiting for other processes holding it
 
-    # Open the database connection
-    file_uri = f"file:{db_filename}"
-    return sqlite3.connect(file_uri, uri=True)
+    :param lock_path: lock file, created if missing
+    """
+    with open(lock_path, "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
 
 
-def table_exists(connection: sqlite3.Connection, table_name: str) -> bool:
+def create_schema(connection: sqlite3.Connection):
     """
-    Does the table exist in the database ?
+    Create the tables of a build, keeping any that exist
 
     :param connection: db connection of type sqlite.Connection
-    :param table_name: table in the sqlite db
-    :return: bool indicating whether table_name exists as a table
     """
-    query = """SELECT count(*) from sqlite_master where type = 'table' and name = ?"""
-    cursor = connection.execute(query, (table_name,))
-    result = cursor.fetchone()
-    cursor.close()
-    return result[0] > 0
+    for statement in SCHEMA:
+        connection.execute(statement)
+    set_manifest(connection, "schema_version", str(SCHEMA_VERSION))
 
 
-def tables_exist(connection: sqlite3.Connection, table_names: list[str]):
+def set_manifest(connection: sqlite3.Connection, key: str, value: str):
     """
-    Do all the given tables exist in the database ?
+    Set a manifest entry, without committing
 
     :param connection: db connection of type sqlite.Connection
-    :param table_names: names of tables in the sqlite db
-    :return: bool indicating whether all table_names exists
+    :param key: manifest key
+    :param value: value to store
     """
-    return all([table_exists(connection, table_name) for table_name in table_names])
+    connection.execute("INSERT OR REPLACE INTO manifest VALUES (?, ?)", (key, value))
 
 
-def count_rows(connection: sqlite3.Connection, table_name: str) -> int:
+def mark_build_complete(connection: sqlite3.Connection, mode: str):
     """
-    Count number of rows in the table.
+    Record that every table of a sequence mode was built, without committing
 
     :param connection: db connection of type sqlite.Connection
-    :param table_name: table in the sqlite db
-    :return: bool indicating whether table_name exists as a table
+    :param mode: gapped or ungapped
     """
-    query = f"SELECT count(*) from '{table_name}'"
-    cursor = connection.execute(query)
-    result = cursor.fetchone()
-    cursor.close()
-    return result[0]
+    set_manifest(connection, f"build:{mode}", "complete")
 
 
-def save_dict(
-    connection: sqlite3.Connection,
-    table_name: str,
-    dictionary: dict[str, str],
-    columns: tuple[str, str],
-) -> bool:
+def completed_builds(db_path: str) -> set:
     """
-    Save the dictionary as a table with column names from columns Tuple.
+    Get the sequence modes a database file was fully built for
 
-    :param connection: db connection of type sqlite.Connection
-    :param table_name: name of the table to create
-    :param dictionary: the dictionary which to take the key and values from
-    :param columns: column names in the table
-    :return: success status
+    This is the single lookup made to validate a cached database. Files
+    from an older layout, without a manifest, count as never completed.
+
+    :param db_path: path of the database file
+    :return: set of modes, empty if the file is missing or was never completed
     """
-    cursor = connection.cursor()
+    if not pathlib.Path(db_path).exists():
+        return set()
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        manifest = dict(connection.execute("SELECT key, value FROM manifest"))
+    except sqlite3.OperationalError:
+        # no manifest table
+        return set()
+    finally:
+        connection.close()
+    if manifest.get("schema_version") != str(SCHEMA_VERSION):
+        return set()
+    return {
+        key.split(":", 1)[1]
+        for key, value in manifest.items()
+        if key.startswith("build:") and value == "complete"
+    }
 
-    # Drop the table first
-    drop_table_sql = f"DROP TABLE IF EXISTS {table_name}"
-    cursor.execute(drop_table_sql)
 
-    # Create table
-    create_table_sql = f"""CREATE TABLE {table_name} (
-                            {columns[0]} TEXT PRIMARY KEY,
-                            {columns[1]} TEXT NOT NULL
-                    )"""
-    cursor.execute(create_table_sql)
+def save_sequences(
+    connection: sqlite3.Connection, kind: str, locus: str, seqs: dict[str, str]
+):
+    """
+    Save the sequences of a locus, replacing any of the same kind, without committing
 
-    # insert
-    cursor.executemany(f"INSERT INTO {table_name} VALUES (?, ?)", dictionary.items())
+    :param connection: db connection of type sqlite.Connection
+    :param kind: kind of sequences, such as ungapped or gapped_mature
+    :param locus: HLA locus
+    :param seqs: dictionary of allele to sequence
+    """
+    with metrics.timer("sqlite_write_seconds", table=f"{locus}_{kind}"):
+        connection.execute(
+            "DELETE FROM sequences WHERE kind = ? AND locus = ?", (kind, locus)
+        )
+        connection.executemany(
+            "INSERT INTO sequences VALUES (?, ?, ?, ?)",
+            ((kind, locus, allele, seq) for allele, seq in seqs.items()),
+        )
 
-    # commit transaction - writes to the db
-    connection.commit()
-    # close the cursor
-    cursor.close()
 
-    return True
+def load_sequences(
+    connection: sqlite3.Connection, kind: str, locus: str = None
+) -> dict[str, str]:
+    """
+    Load the sequences of a kind, from every locus or a single one
+
+    :param connection: db connection of type sqlite.Connection
+    :param kind: kind of sequences, such as ungapped or gapped_mature
+    :param locus: HLA locus, None for every locus
+    :return: dictionary of allele to sequence
+    """
+    with metrics.timer("table_load_seconds", table=kind):
+        if locus is None:
+            cursor = connection.execute(
+                "SELECT allele, seq FROM sequences WHERE kind = ?", (kind,)
+            )
+        else:
+            cursor = connection.execute(
+                "SELECT allele, seq FROM sequences WHERE kind = ? AND locus = ?",
+                (kind, locus),
+            )
+        seqs = dict(cursor.fetchall())
+    cursor.close()
+    return seqs
 
 
-def save_set(
-    connection: sqlite3.Connection, table_name: str, rows: set, column: str
-) -> bool:
+def save_region_ends(connection: sqlite3.Connection, kind: str, ends: dict):
     """
-    Save the set rows to the table table_name in the column
+    Save the last position of a region for each locus, without committing
 
     :param connection: db connection of type sqlite.Connection
-    :param table_name: name of the table to create
-    :param rows: set which will become the the column in the table
-    :param column: name of the column in the table
-    :return: success status
-    """
-    cursor = connection.cursor()
-
-    # Drop the table first
-    drop_table_sql = f"DROP TABLE IF EXISTS {table_name}"
-    cursor.execute(drop_table_sql)
-
-    # Create table
-    create_table_sql = f"""CREATE TABLE {table_name} (
-                            {column} TEXT PRIMARY KEY
-                    )"""
-    cursor.execute(create_table_sql)
-
-    # insert
-    cursor.executemany(
-        f"INSERT INTO {table_name} VALUES (?)",
-        zip(
-            rows,
-        ),
+    :param kind: region and mode, such as ungapped_ard
+    :param ends: dictionary of locus to last position
+    """
+    connection.executemany(
+        "INSERT OR REPLACE INTO region_ends VALUES (?, ?, ?)",
+        ((kind, locus, end) for locus, end in ends.items()),
     )
 
-    # commit transaction - writes to the db
-    connection.commit()
-    # close the cursor
-    cursor.close()
-
-    return True
-
 
-def load_set(connection: sqlite3.Connection, table_name: str, column: str) -> set:
+def load_region_ends(connection: sqlite3.Connection, kind: str) -> dict[str, int]:
     """
-    Retrieve the first column of the table as a set
+    Load the last position of a region for each locus
 
     :param connection: db connection of type sqlite.Connection
-    :param table_name: name of the table to query
-    :param column: name of the column in the table to query
-    :return: set containing values from the column
-    """
-    cursor = connection.cursor()
-    select_all_query = f"SELECT {column} FROM {table_name}"
-    cursor.execute(select_all_query)
-    table_as_set = set(map(lambda t: t[0], cursor.fetchall()))
+    :param kind: region and mode, such as ungapped_ard
+    :return: dictionary of locus to last position
+    """
+    cursor = connection.execute(
+        "SELECT locus, position FROM region_ends WHERE kind = ?", (kind,)
+    )
+    ends = dict(cursor.fetchall())
     cursor.close()
-    return table_as_set
+    return ends
 
 
-def load_dict(
-    connection: sqlite3.Connection, table_name: str, columns: tuple[str, str]
-) -> dict[str, str]:
+def save_discrepancies(connection: sqlite3.Connection, kind: str, discrepancies):
     """
-    Retrieve the values in columns as a name, value pair and create a dict.
+    Save the positions where translated and aligned proteins disagree, without committing
 
     :param connection: db connection of type sqlite.Connection
-    :param table_name: name of the table to query
-    :param columns: column names in the table
-    :return: a dict containing key,value pairs from the columns
-    """
-    cursor = connection.cursor()
-    select_all_query = f"SELECT {columns[0]}, {columns[1]} FROM {table_name}"
-    cursor.execute(select_all_query)
-    table_as_dict = {k: v for k, v in cursor.fetchall()}
-    cursor.close()
-    return table_as_dict
+    :param kind: kind of the translated sequences, such as ungapped
+    :param discrepancies: iterable of (allele, position, translated residue,
+        aligned residue)
+    """
+    connection.execute("DELETE FROM discrepancies WHERE kind = ?", (kind,))
+    connection.executemany(
+        "INSERT INTO discrepancies VALUES (?, ?, ?, ?, ?)",
+        ((kind, *discrepancy) for discrepancy in discrepancies),
+    )
 
 
-def get_user_version(connection: sqlite3.Connection) -> int:
+def load_discrepancies(connection: sqlite3.Connection, kind: str) -> list[tuple]:
     """
-    Retrieve user_version from db
+    Load the positions where translated and aligned proteins disagree
 
-    :connection: sqlite3.Connection: SQLite DB Connection
+    :param connection: db connection of type sqlite.Connection
+    :param kind: kind of the translated sequences, such as ungapped
+    :return: list of (allele, position, translated residue, aligned residue)
     """
-    query = "PRAGMA user_version"
-    cursor = connection.execute(query)
-    result = cursor.fetchone()
-    version = result[0]
+    cursor = connection.execute(
+        "SELECT allele, position, translated, protein FROM discrepancies"
+        " WHERE kind = ? ORDER BY allele, position",
+        (kind,),
+    )
+    discrepancies = cursor.fetchall()
     cursor.close()
-
-    if version:
-        return version
-    return None
+    return discrepancies
 
 
-def set_user_version(connection: sqlite3.Connection, version: int):
+def save_residue_counts(connection: sqlite3.Connection, kind: str, counts: dict):
     """
-    Save the version number as user_version in db
+    Save the residue counts of the polymorphic positions, without committing
 
-    :connection: sqlite3.Connection:
-    :version: int: version number to store
-    @return:
-    """
-    query = f"PRAGMA user_version={version}"
-    cursor = connection.execute(query)
-    # commit transaction - writes to the db
-    connection.commit()
-    # close the cursor
-    cursor.close()
+    :param connection: db connection of type sqlite.Connection
+    :param kind: kind of the mature sequences counted, ungapped or gapped
+    :param counts: dictionary of locus to dictionary of position to
+        dictionary of residue to count
+    """
+    connection.execute("DELETE FROM residue_counts WHERE kind = ?", (kind,))
+    connection.executemany(
+        "INSERT INTO residue_counts VALUES (?, ?, ?, ?, ?)",
+        (
+            (kind, locus, position, residue, count)
+            for locus, positions in counts.items()
+            for position, residues in positions.items()
+            for residue, count in residues.items()
+        ),
+    )
 
 
-# TODO: combine load_gapped_tables and load_gapped_nuc_tables
-def load_gapped_tables(connection: sqlite3.Connection):
+def load_residue_counts(connection: sqlite3.Connection, kind: str) -> dict:
     """
-    Return a dictionary of gapped sequence tables
+    Load the residue counts of the polymorphic positions
 
     :param connection: db connection of type sqlite.Connection
-    :return: dict of gapped sequence tables
-    """
+    :param kind: kind of the mature sequences counted, ungapped or gapped
+    :return: dictionary of locus to dictionary of position to dictionary of
+        residue to count
+    """
+    cursor = connection.execute(
+        "SELECT locus, position, residue, count FROM residue_counts"
+        " WHERE kind = ? ORDER BY locus, position, residue",
+        (kind,),
+    )
+    counts = {}
+    for locus, position, residue, count in cursor.fetchall():
+        counts.setdefault(locus, {}).setdefault(position, {})[residue] = count
+    cursor.close()
+    return counts
 
-    # initialize dictionary to store allele:seq key:value pairs
-    gapped_seqs = {}
 
-    for loc in config["loci"]:
-        # extend the dictionary with each locus
-        gapped_seqs.update(
-            load_dict(connection, table_name=f"{loc}_gapped", columns=("allele", "seq"))
-        )
+def save_regions(connection: sqlite3.Connection, kind: str, regions: dict):
+    """
+    Save user-defined regions, replacing any with the same name and locus, without committing
 
-    return gapped_seqs
+    :param connection: db connection of type sqlite.Connection
+    :param kind: coordinates of the positions, ungapped or gapped
+    :param regions: dictionary of (name, locus) to list of positions
+    """
+    connection.executemany(
+        "INSERT OR REPLACE INTO regions VALUES (?, ?, ?, ?)",
+        (
+            (kind, name, locus, ",".join(map(str, positions)))
+            for (name, locus), positions in regions.items()
+        ),
+    )
 
 
-def load_gapped_nuc_tables(connection: sqlite3.Connection):
+def load_regions(connection: sqlite3.Connection, kind: str) -> dict:
     """
-    Return a dictionary of gapped nucleotide tables
+    Load the user-defined regions saved for a coordinate system
 
     :param connection: db connection of type sqlite.Connection
-    :return: dict of gapped sequence tables
+    :param kind: coordinates of the positions, ungapped or gapped
+    :return: dictionary of (name, locus) to list of positions
     """
+    cursor = connection.execute(
+        "SELECT name, locus, positions FROM regions WHERE kind = ?", (kind,)
+    )
+    regions = {
+        (name, locus): [int(position) for position in positions.split(",")]
+        for name, locus, positions in cursor.fetchall()
+    }
+    cursor.close()
+    return regions
 
-    # initialize dictionary to store allele:seq key:value pairs
-    gapped_seqs = {}
 
-    for loc in config["loci"]:
-        # extend the dictionary with each locus
-        gapped_seqs.update(
-            load_dict(
-                connection, table_name=f"{loc}_gapped_nuc", columns=("allele", "seq")
-            )
-        )
+def allele_list_name(ungap: bool, locus: str, status: str, seqtype: str) -> str:
+    """
+    Get the name of a completeness list
 
-    return gapped_seqs
+    :param ungap: whether ungapped sequences were used
+    :param locus: HLA locus
+    :param status: completed, incomplete or extended
+    :param seqtype: prot or nuc
+    :return: name of the list, such as ungapped_A_completed_prot
+    """
+    mode = "ungapped" if ungap else "gapped"
+    return f"{mode}_{locus}_{status}_{seqtype}"
 
 
-def load_gapped_mature_tables(connection: sqlite3.Connection):
+def save_allele_list(connection: sqlite3.Connection, name: str, alleles):
     """
-    Return a dictionary of gapped mature sequence tables
+    Save a named list of alleles, replacing any of the same name, without committing
 
     :param connection: db connection of type sqlite.Connection
-    :return: dict of gapped mature sequence tables
-    """
-
-    # initialize dictionary to store allele:seq key:value pairs
-    gapped_seqs = {}
-
-    for loc in config["loci"]:
-        # extend the dictionary with each locus
-        gapped_seqs.update(
-            load_dict(
-                connection, table_name=f"{loc}_gapped_mature", columns=("allele", "seq")
-            )
+    :param name: name of the list, such as ungapped_A_completed_prot
+    :param alleles: alleles in the list
+    """
+    with metrics.timer("sqlite_write_seconds", table=name):
+        connection.execute("DELETE FROM allele_lists WHERE name = ?", (name,))
+        connection.executemany(
+            "INSERT OR IGNORE INTO allele_lists VALUES (?, ?)",
+            ((name, allele) for allele in alleles),
         )
 
-    return gapped_seqs
 
-
-# TODO: combine load_ungapped_tables and load_ungapped_nuc_tables
-def load_ungapped_tables(connection: sqlite3.Connection):
+def load_allele_list(connection: sqlite3.Connection, name: str) -> list[str]:
     """
-    Return a dictionary of ungapped sequence tables
+    Load a named list of alleles
 
     :param connection: db connection of type sqlite.Connection
-    :return: dict of ungapped sequence tables
+    :param name: name of the list
+    :return: list of alleles
     """
-
-    # initialize dictionary to store allele:seq key:value pairs
-    ungapped_seqs = {}
-
-    for loc in config["loci"]:
-        # extend the dictionary with each locus
-        ungapped_seqs.update(
-            load_dict(
-                connection, table_name=f"{loc}_ungapped", columns=("allele", "seq")
-            )
+    with metrics.timer("table_load_seconds", table=name):
+        cursor = connection.execute(
+            "SELECT allele FROM allele_lists WHERE name = ?", (name,)
         )
-
-    return ungapped_seqs
+        alleles = [allele for (allele,) in cursor.fetchall()]
+    cursor.close()
+    return alleles
 
 
-def load_ungapped_nuc_tables(connection: sqlite3.Connection):
+def create_db_connection(
+    data_dir, imgt_version, imputed, imputation_method, read_only: bool = False
+):
     """
-    Return a dictionary of ungapped nucleotide tables
+    Create connection to SQLite database
 
-    :param connection: db connection of type sqlite.Connection
-    :return: dict of ungapped sequence tables
+    Connections can be handed between threads; callers sharing one
+    connection between threads must serialize its use themselves.
+
+    :param data_dir: The directory where the database is stored
+    :param imgt_version: The version of the IMGT/HLA database to use
+    :param read_only: open an existing database for reading only
+    :return: The database connection
     """
 
-    # initialize dictionary to store allele:seq key:value pairs
-    ungapped_seqs = {}
+    # set data directory
+    if data_dir is None:
+        data_dir = get_default_db_directory()
 
-    for loc in config["loci"]:
-        # extend the dictionary with each locus
-        ungapped_seqs.update(
-            load_dict(
-                connection, table_name=f"{loc}_ungapped_nuc", columns=("allele", "seq")
-            )
+    # set database filename
+    db_path = db_filename(data_dir, imgt_version, imputed, imputation_method)
+
+    # Check if imgt_version is valid
+    # if not pathlib.Path(db_path).exists():
+    #    all_versions = get_imgt_db_versions()
+    #    if str(imgt_version) not in all_versions:
+    #        raise ValueError(f"{imgt_version} is not a valid IMGT version")
+
+    if read_only:
+        if not pathlib.Path(db_path).exists():
+            raise FileNotFoundError(f"No database file {db_path} to open read-only")
+        return sqlite3.connect(
+            f"file:{db_path}?mode=ro", uri=True, check_same_thread=False
         )
 
-    return ungapped_seqs
+    # Create the data directory if it doesn't exist
+    if not pathlib.Path(data_dir).exists():
+        pathlib.Path(data_dir).mkdir(parents=True, exist_ok=True)
 
+    # Create the database file and alert user
+    if not pathlib.Path(db_path).exists():
+        print(f"Creating database file {db_path} as cache")
 
-def load_ungapped_mature_tables(connection: sqlite3.Connection):
+    # Open the database connection
+    return sqlite3.connect(f"file:{db_path}", uri=True, check_same_thread=False)
+
+
+def get_user_version(connection: sqlite3.Connection) -> int:
     """
-    Return a dictionary of ungapped mature sequence tables
+    Retrieve user_version from db
 
-    :param connection: db connection of type sqlite.Connection
-    :return: dict of ungapped mature sequence tables
+    :connection: sqlite3.Connection: SQLite DB Connection
     """
+    query = "PRAGMA user_version"
+    cursor = connection.execute(query)
+    result = cursor.fetchone()
+    version = result[0]
+    cursor.close()
 
-    # initialize dictionary to store allele:seq key:value pairs
-    ungapped_seqs = {}
+    if version:
+        return version
+    return None
 
-    for loc in config["loci"]:
-        # extend the dictionary with each locus
-        ungapped_seqs.update(
-            load_dict(
-                connection,
-                table_name=f"{loc}_ungapped_mature",
-                columns=("allele", "seq"),
-            )
-        )
 
-    return ungapped_seqs
+def set_user_version(connection: sqlite3.Connection, version: int):
+    """
+    Save the version number as user_version in db
+
+    :connection: sqlite3.Connection:
+    :version: int: version number to store
+    @return:
+    """
+    query = f"PRAGMA user_version={version}"
+    cursor = connection.execute(query)
+    # commit transaction - writes to the db
+    connection.commit()
+    # close the cursor
+    cursor.close()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+# eplets.py - eplet libraries compiled into per-allele bitsets
+
+import pathlib  # for path manipulation
+import re  # for parsing eplet definitions
+from .configs import config  # for configurations
+from .residues import mask_positions  # for listing eplets in a bitset
+
+# "44R_45M": residues at explicit positions, as written by getEpitope
+_EXPLICIT = re.compile(r"^(\d+)([A-Z])$")
+# "62GE": residues at consecutive positions from a start position
+_RUN = re.compile(r"^(\d+)([A-Z]+)$")
+
+
+def parse_definition(definition: str) -> tuple:
+    """
+    Parse an eplet definition into its positions and residues
+
+    Definitions are either explicit position and residue pairs joined by
+    underscores, such as "44R_45M", or a start position followed by the
+    residues at consecutive positions, such as "62GE" for 62G and 63E.
+
+    :param definition: eplet definition
+    :return: sorted tuple of (position, residue)
+    """
+    parts = definition.split("_")
+    if len(parts) > 1:
+        residues = []
+        for part in parts:
+            match = _EXPLICIT.match(part)
+            if match is None:
+                raise ValueError(f"Invalid eplet definition {definition}")
+            residues.append((int(match.group(1)), match.group(2)))
+    else:
+        match = _RUN.match(definition)
+        if match is None:
+            raise ValueError(f"Invalid eplet definition {definition}")
+        start = int(match.group(1))
+        residues = [
+            (start + offset, residue) for offset, residue in enumerate(match.group(2))
+        ]
+
+    if any(position < 1 for position, _ in residues):
+        raise ValueError(f"Invalid eplet definition {definition}")
+    return tuple(sorted(set(residues)))
+
+
+def read_library(path) -> dict:
+    """
+    Read an eplet library file
+
+    Each line holds the loci, the eplet name and, optionally, its
+    definition, separated by tabs or spaces. Loci are separated by commas,
+    and a line without a definition uses the name as the definition, so
+    "A,B,C 62GE" and "DRB1 96EV 96E_98V" are both valid. Blank lines and
+    lines starting with # are skipped.
+
+    :param path: library file
+    :return: dictionary of locus to dictionary of eplet name to definition
+    """
+    library = {}
+    for number, line in enumerate(pathlib.Path(path).read_text().splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        fields = line.split()
+        if len(fields) not in (2, 3):
+            raise ValueError(f"{path}, line {number}: expected loci, name, definition")
+        loci, name = fields[0], fields[1]
+        definition = fields[2] if len(fields) == 3 else name
+        try:
+            residues = parse_definition(definition)
+        except ValueError as error:
+            raise ValueError(f"{path}, line {number}: {error}")
+        for locus in loci.split(","):
+            if locus not in config["loci"]:
+                raise ValueError(f"{path}, line {number}: unknown locus {locus}")
+            library.setdefault(locus, {})[name] = residues
+    return library
+
+
+class EpletLibrary:
+    """
+    Eplets of each locus, compiled against residue bitplanes
+
+    Each eplet of a locus gets a bit, and each allele gets a bitset of the
+    eplets it carries, built on first use from its residue bitplanes. A
+    donor and recipient comparison is then an OR, an AND NOT and a bit count.
+    """
+
+    def __init__(self, library: dict, residues):
+        """
+        :param library: dictionary of locus to dictionary of eplet name to
+            tuple of (position, residue), as returned by read_library
+        :param residues: ResidueIndex of the mature sequences
+        """
+        self.residues = residues
+        self.names = {}
+        self._requirements = {}
+        self._bitsets = {}
+
+        for locus, eplets in library.items():
+            self.names[locus] = list(eplets)
+            # positions each residue must occupy, per eplet
+            requirements = []
+            for definition in eplets.values():
+                required = {}
+                for position, residue in definition:
+                    required[residue] = required.get(residue, 0) | 1 << (position - 1)
+                requirements.append(tuple(required.items()))
+            self._requirements[locus] = requirements
+
+    @classmethod
+    def from_file(cls, path, residues):
+        """
+        Load and compile an eplet library file
+
+        :param path: library file, see read_library
+        :param residues: ResidueIndex of the mature sequences
+        :return: compiled library
+        """
+        return cls(read_library(path), residues)
+
+    def bitset(self, allele: str) -> int:
+        """
+        Get the eplets carried by an allele
+
+        :param allele: two-field allele
+        :return: bitset where bit j is set when the allele carries eplet j of its locus
+        """
+        try:
+            return self._bitsets[allele]
+        except KeyError:
+            pass
+
+        planes, _ = self.residues.planes(allele)
+        bits = 0
+        for j, required in enumerate(self._requirements.get(allele.split("*")[0], ())):
+            if all(planes.get(residue, 0) & mask == mask for residue, mask in required):
+                bits |= 1 << j
+        self._bitsets[allele] = bits
+        return bits
+
+    def eplet_names(self, locus: str, bits: int) -> list[str]:
+        """
+        Get the names of the eplets in a bitset
+
+        :param locus: HLA locus
+        :param bits: eplet bitset of the locus
+        :return: list of eplet names in library order
+        """
+        names = self.names.get(locus, [])
+        return [names[position - 1] for position in mask_positions(bits)]
+
+    def mismatches(self, donor: list[str], recip: list[str]) -> int:
+        """
+        Get the eplets carried by the donor and absent in the recipient
+
+        :param donor: two-field donor alleles of one locus
+        :param recip: two-field recipient alleles of the locus, empty if the
+            recipient lacks the gene
+        :return: bitset of the mismatched eplets
+        """
+        donor_bits = recip_bits = 0
+        for allele in donor:
+            donor_bits |= self.bitset(allele)
+        for allele in recip:
+            recip_bits |= self.bitset(allele)
+        return donor_bits & ~recip_bits
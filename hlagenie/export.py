@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+
+# export.py - Arrow and Parquet bundles of the sequence tables
+
+import json  # for the bundle manifest
+import pathlib  # for path manipulation
+from collections.abc import Mapping  # for Arrow-backed sequence dictionaries
+from .configs import config  # for configurations
+from .smart_sort import smart_sort  # for sorted tables
+
+# file extension of each bundle format
+FORMATS = {"parquet": "parquet", "arrow": "arrow"}
+
+# sequence tables in a bundle and the GENIE attribute each comes from
+SEQUENCE_TABLES = {"full": "full_seqs", "mature": "seqs", "nuc": "nuc_seqs"}
+
+# completeness statuses and the GENIE method listing each
+STATUSES = {
+    "complete": "listCompletes",
+    "incomplete": "listIncompletes",
+    "extended": "listExtendeds",
+}
+
+MANIFEST = "manifest.json"
+
+
+def _import_pyarrow():
+    """
+    Import pyarrow, which is only needed for bundles
+
+    :return: the pyarrow module
+    """
+    try:
+        import pyarrow  # for columnar tables
+    except ImportError:
+        raise ImportError(
+            "pyarrow is required to export or load sequence bundles, "
+            "install it with `pip install pyarrow`"
+        )
+    return pyarrow
+
+
+def _write_table(table, path: pathlib.Path, format: str):
+    """
+    Write an Arrow table as a Parquet or Arrow IPC file
+
+    :param table: pyarrow.Table to write
+    :param path: file to write
+    :param format: parquet or arrow
+    """
+    pa = _import_pyarrow()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if format == "parquet":
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, path)
+    else:
+        with pa.OSFile(str(path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+
+def _read_table(path: pathlib.Path, format: str):
+    """
+    Read a Parquet or Arrow IPC file, memory mapping it
+
+    :param path: file to read
+    :param format: parquet or arrow
+    :return: pyarrow.Table
+    """
+    pa = _import_pyarrow()
+    if format == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.read_table(path, memory_map=True)
+    # Arrow IPC files are used in place, without copying the sequences
+    return pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+
+
+def export_bundle(genie, path, format: str = "parquet") -> pathlib.Path:
+    """
+    Write the sequence and completeness tables of a GENIE instance as a bundle
+
+    Each table is partitioned by locus in the Hive layout
+    (<path>/<table>/locus=<locus>/part-0.<format>), so Spark, pandas and
+    pyarrow.dataset read it directly. A manifest.json records the IMGT/HLA
+    version, the options the instance was built with, the ARD/XRD ends and
+    the regions added with defineRegion.
+
+    :param genie: GENIE instance to export
+    :param path: directory to write the bundle to
+    :param format: parquet or arrow
+    :return: path of the bundle
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Invalid format {format}, must be parquet or arrow")
+    pa = _import_pyarrow()
+
+    path = pathlib.Path(path)
+    extension = FORMATS[format]
+    counts = {}
+
+    for table_name, attribute in SEQUENCE_TABLES.items():
+        seqs = getattr(genie, attribute)
+        for locus in config["loci"]:
+            alleles = smart_sort(a for a in seqs if a.split("*")[0] == locus)
+            loc_seqs = {allele: seqs[allele] for allele in alleles}
+            table = pa.table(
+                {
+                    "allele": pa.array(list(loc_seqs), pa.string()),
+                    "seq": pa.array(list(loc_seqs.values()), pa.string()),
+                }
+            )
+            _write_table(
+                table,
+                path / table_name / f"locus={locus}" / f"part-0.{extension}",
+                format,
+            )
+            counts[f"{table_name}/{locus}"] = len(loc_seqs)
+
+    for locus in config["loci"]:
+        alleles, seqtypes, statuses = [], [], []
+        for seqtype in ("prot", "nuc"):
+            for status, method in STATUSES.items():
+                listed = smart_sort(getattr(genie, method)(locus, seqtype))
+                alleles += listed
+                seqtypes += [seqtype] * len(listed)
+                statuses += [status] * len(listed)
+        table = pa.table(
+            {
+                "allele": pa.array(alleles, pa.string()),
+                "seqtype": pa.array(seqtypes, pa.string()),
+                "status": pa.array(statuses, pa.string()),
+            }
+        )
+        _write_table(
+            table,
+            path / "completeness" / f"locus={locus}" / f"part-0.{extension}",
+            format,
+        )
+        counts[f"completeness/{locus}"] = len(alleles)
+
+    manifest = {
+        "imgt_version": str(genie.imgt_version),
+        "ungap": genie.ungap,
+        "imputed": genie.imputed,
+        "imputation_method": genie.imputation_method,
+        "format": format,
+        "loci": config["loci"],
+        "tables": list(SEQUENCE_TABLES) + ["completeness"],
+        "ard_ends": genie.ards,
+        "xrd_ends": genie.xrds,
+        "regions": [
+            {"name": name, "locus": locus, "positions": positions}
+            for (name, locus), positions in genie.regions.user_regions.items()
+        ],
+        "rows": counts,
+    }
+    (path / MANIFEST).write_text(json.dumps(manifest, indent=2))
+
+    return path
+
+
+class ArrowSeqs(Mapping):
+    """
+    Read-only dictionary of allele to sequence backed by Arrow string arrays
+
+    Sequences stay in the Arrow buffers (memory mapped for Arrow IPC bundles)
+    and are only turned into Python strings when looked up.
+    """
+
+    def __init__(self, tables: list):
+        """
+        :param tables: pyarrow.Tables with allele and seq columns
+        """
+        self._index = {}
+        for table in tables:
+            alleles = table.column("allele")
+            seqs = table.column("seq")
+            for allele_chunk, seq_chunk in zip(alleles.chunks, seqs.chunks):
+                for row, allele in enumerate(allele_chunk.to_pylist()):
+                    # keep the first, like the builders do for duplicate alleles
+                    self._index.setdefault(allele, (seq_chunk, row))
+
+    def __getitem__(self, allele: str) -> str:
+        chunk, row = self._index[allele]
+        return chunk[row].as_py()
+
+    def __contains__(self, allele) -> bool:
+        return allele in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+def load_bundle(path) -> dict:
+    """
+    Load a bundle written by export_bundle
+
+    :param path: directory of the bundle
+    :return: dictionary with the manifest, an ArrowSeqs per sequence table,
+        the completeness lists keyed by (locus, seqtype, status) and the
+        user-defined regions keyed by (name, locus)
+    """
+    path = pathlib.Path(path)
+    manifest_path = path / MANIFEST
+    if not manifest_path.exists():
+        raise FileNotFoundError(f"{path} is not an hlagenie bundle, no {MANIFEST}")
+    manifest = json.loads(manifest_path.read_text())
+
+    format = manifest["format"]
+    extension = FORMATS[format]
+
+    def locus_files(table_name):
+        for locus in manifest["loci"]:
+            yield locus, path / table_name / f"locus={locus}" / f"part-0.{extension}"
+
+    bundle = {"manifest": manifest}
+    for table_name in SEQUENCE_TABLES:
+        bundle[table_name] = ArrowSeqs(
+            [_read_table(file, format) for _, file in locus_files(table_name)]
+        )
+
+    completeness = {}
+    for locus, file in locus_files("completeness"):
+        table = _read_table(file, format).to_pydict()
+        for allele, seqtype, status in zip(
+            table["allele"], table["seqtype"], table["status"]
+        ):
+            completeness.setdefault((locus, seqtype, status), []).append(allele)
+    bundle["completeness"] = completeness
+    bundle["regions"] = {
+        (region["name"], region["locus"]): region["positions"]
+        for region in manifest.get("regions", [])
+    }
+
+    return bundle
@@ -3,12 +3,25 @@
 # aa_matching.py - module for amino acid matching functions
 
 # import necessary modules
+import operator  # for comparing residues pairwise
 from pathlib import Path  # for path manipulation
-import pyard  # for HLA nomenclature
+import threading  # for sharing an instance between threads
+from concurrent.futures import ThreadPoolExecutor  # for batches of calls
+from contextlib import contextmanager  # for borrowing reader connections
 from . import db  # for database operations
 from . import data_repository as dr  # for data repository operations
+from . import metrics  # for query instrumentation
 from .load import load_latest_version  # get most updated version of IMGT database
 from .configs import config  # for configurations
+from .smart_sort import smart_sort  # for sorted allele listings
+from .residues import ResidueIndex, mask_to_bools  # for comparing whole regions
+from .residues import PolymorphismIndex  # for skipping invariant positions
+from . import genotype  # for multi-locus typings
+from . import scoring  # for substitution-weighted scores
+from . import regions  # for named position sets
+from .eplets import EpletLibrary  # for eplet mismatch loads
+from .ondemand import SQLiteSeqs  # for sequences looked up when needed
+from .coordinates import CoordinateIndex  # for codon and nucleotide positions
 
 
 class GENIE:
@@ -26,15 +39,71 @@ class GENIE:
         ungap: bool = True,
         imputed: bool = False,
         imputation_method: str = "nearest",
+        ard=None,
+        from_parquet: str = None,
+        from_shared: str = None,
+        on_demand: bool = False,
     ):
         # set values for needed variables
         self._data_dir = data_dir
+        self.on_demand = on_demand
         self.ungap = ungap
         self.load_mac = load_mac
+        self.cache_size = cache_size
+        self.imputed = imputed
+        self.imputation_method = imputation_method
+
+        # guards py-ard initialization, database writes and cache evictions,
+        # so one instance can be shared by the threads of a server
+        self._lock = threading.RLock()
+
+        # read-only connections for threads reading tables that already exist
+        self._idle_readers = []
+
+        # cache of alleles already reduced to two fields
+        self._redux_cache = {}
+
+        # cache of locus mismatch counts and of one allele per distinct sequence
+        self._locus_counts = {}
+        self._representatives = {}
+
+        # py-ard object, only created when an allele needs reducing if not given
+        self.ard = ard
+
+        # completeness lists of an exported bundle, None when backed by SQLite
+        self._completeness = None
+
+        # residue bitplanes of the mature sequences, built on first use
+        self._residues = None
+
+        # codon columns of the mature positions, built on first use
+        self._coordinates = None
+
+        # polymorphic positions of each locus, loaded or computed on first use
+        self._polymorphism = None
+
+        # mature proteins translated from the coding sequences, loaded on first use
+        self._translated_seqs = None
+
+        # eplet library compiled against the residue bitplanes, set by loadEplets
+        self.eplets = None
+
+        # store mapped from another process, set when loaded with from_shared
+        self._shared = None
+
+        # load from an exported bundle instead of the SQLite database
+        if from_parquet is not None:
+            self._load_bundle(from_parquet)
+            return
+
+        # load from a store published by another process
+        if from_shared is not None:
+            self._load_shared(from_shared)
+            return
 
         # if database version is "Latest", get the latest version
         if imgt_version == "Latest":
-            imgt_version = load_latest_version()
+            imgt_version = load_latest_version(data_dir)
 
         self.imgt_version = imgt_version
 
@@ -44,35 +113,127 @@ class GENIE:
                 "Invalid imputation method specified, must be nearest or nearest10"
             )
 
-        # create database connection to SQLite database
-        self.db_connection = db.create_db_connection(
-            data_dir, imgt_version, imputed, imputation_method
+        # build the tables unless a complete build exists, waiting for any
+        # other process already building them
+        self._db_path = dr.build_database(
+            data_dir,
+            imgt_version,
+            imputed,
+            imputation_method,
+            ungap,
+            self.load_mac,
+            self.ard,
         )
 
-        # save the IMGT version
-        dr.set_db_version(self.db_connection, imgt_version)
+        # open the database read-only, as only builds and defineRegion write to it
+        self.db_connection = db.create_db_connection(
+            data_dir, imgt_version, imputed, imputation_method, read_only=True
+        )
 
-        # load sequence data from database
-        if self.ungap:
-            self.full_seqs = dr.generate_ungapped_tables(
-                self.db_connection, imgt_version, imputed, imputation_method, self.load_mac
-            )
-            self.nuc_seqs = dr.generate_ungapped_nuc_tables(
-                self.db_connection, imgt_version, imputed, imputation_method
-            )
-            self.seqs = dr.generate_ungapped_mature_tables(self.db_connection)
-            self.ards = dr.generate_ungapped_ard_table(self.db_connection, self.seqs)
-            self.xrds = dr.generate_ungapped_xrd_table(self.db_connection, self.seqs)
+        # load sequence data from database, a single query per kind of sequence,
+        # or look sequences up when needed to keep memory flat
+        mode = "ungapped" if self.ungap else "gapped"
+        if on_demand:
+            self.full_seqs = SQLiteSeqs(self._reader, mode, cache_size)
+            self.nuc_seqs = SQLiteSeqs(self._reader, f"{mode}_nuc", cache_size)
+            self.seqs = SQLiteSeqs(self._reader, f"{mode}_mature", cache_size)
         else:
-            self.full_seqs = dr.generate_gapped_tables(
-                self.db_connection, imgt_version, imputed, imputation_method, self.load_mac
-            )
-            self.nuc_seqs = dr.generate_gapped_nuc_tables(
-                self.db_connection, imgt_version, imputed, imputation_method
-            )
-            self.seqs = dr.generate_gapped_mature_tables(self.db_connection)
-            self.ards = dr.generate_gapped_ard_table(self.db_connection, self.seqs)
-            self.xrds = dr.generate_gapped_xrd_table(self.db_connection, self.seqs)
+            self.full_seqs = db.load_sequences(self.db_connection, mode)
+            self.nuc_seqs = db.load_sequences(self.db_connection, f"{mode}_nuc")
+            self.seqs = db.load_sequences(self.db_connection, f"{mode}_mature")
+        self.ards = db.load_region_ends(self.db_connection, f"{mode}_ard")
+        self.xrds = db.load_region_ends(self.db_connection, f"{mode}_xrd")
+
+        # built-in regions and those defined with defineRegion
+        self.regions = regions.RegionRegistry(
+            self.ards,
+            self.xrds,
+            db.load_regions(self.db_connection, mode),
+        )
+
+    def _load_bundle(self, path):
+        """
+        Load the sequence tables from a bundle written by export
+
+        :param path: directory of the bundle
+        """
+        from .export import load_bundle
+
+        bundle = load_bundle(path)
+        manifest = bundle["manifest"]
+
+        self.imgt_version = manifest["imgt_version"]
+        self.ungap = manifest["ungap"]
+        self.imputed = manifest["imputed"]
+        self.imputation_method = manifest["imputation_method"]
+        self.db_connection = None
+        self.on_demand = False
+
+        self.full_seqs = bundle["full"]
+        self.seqs = bundle["mature"]
+        self.nuc_seqs = bundle["nuc"]
+        self.ards = manifest["ard_ends"]
+        self.xrds = manifest["xrd_ends"]
+        self._completeness = bundle["completeness"]
+        self.regions = regions.RegionRegistry(self.ards, self.xrds, bundle["regions"])
+
+    def _load_shared(self, path):
+        """
+        Map the sequence tables of a store written by share
+
+        :param path: store file
+        """
+        from .shared import SharedStore
+
+        store = SharedStore(path)
+        header = store.header
+
+        self.imgt_version = header["imgt_version"]
+        self.ungap = header["ungap"]
+        self.imputed = header["imputed"]
+        self.imputation_method = header["imputation_method"]
+        self.db_connection = None
+        self.on_demand = False
+
+        self.full_seqs = store.tables["full"]
+        self.seqs = store.tables["mature"]
+        self.nuc_seqs = store.tables["nuc"]
+        self.ards = header["ard_ends"]
+        self.xrds = header["xrd_ends"]
+        self._completeness = store.completeness
+        self.regions = regions.RegionRegistry(self.ards, self.xrds, store.regions)
+        self._shared = store
+
+    def share(self, path=None):
+        """
+        Publish the sequence tables for worker processes
+
+        The tables are written once to a memory-mapped file (in /dev/shm when
+        available). Workers attach with store.view(), or receive a view
+        pickled as the path of the file, and share the tables without
+        copying them or building a database connection.
+
+        :param path: file to write, a new file if None
+        :return: hlagenie.shared.SharedStore, which removes the file when closed
+        """
+        from .shared import publish
+
+        return publish(self, path)
+
+    def export(self, path, format: str = "parquet"):
+        """
+        Export the sequence and completeness tables as a columnar bundle
+
+        The bundle can be read by Spark or pandas, or used to initialize a
+        GENIE instance with hlagenie.init(from_parquet=path).
+
+        :param path: directory to write the bundle to
+        :param format: parquet or arrow (memory mapped without copying when loaded)
+        :return: path of the bundle
+        """
+        from .export import export_bundle
+
+        return export_bundle(self, path, format)
 
     def __del__(self):
         """Close the db connection, when HLAGenie instance goes away
@@ -81,7 +242,128 @@ class GENIE:
         """
         if hasattr(self, "db_connection") and self.db_connection:
             self.db_connection.close()
+        for reader in getattr(self, "_idle_readers", []):
+            reader.close()
+
+    @contextmanager
+    def _reader(self):
+        """
+        Borrow a read-only database connection
+
+        Connections are pooled, so each thread reading at the same time gets
+        its own and no more are opened than threads ever read at once.
+
+        :return: read-only SQLite connection
+        """
+        with self._lock:
+            reader = self._idle_readers.pop() if self._idle_readers else None
+        if reader is None:
+            reader = db.create_db_connection(
+                self._data_dir,
+                self.imgt_version,
+                self.imputed,
+                self.imputation_method,
+                read_only=True,
+            )
+        try:
+            yield reader
+        finally:
+            with self._lock:
+                self._idle_readers.append(reader)
+
+    def _list_table(self, kind: str, locus: str, seqtype: str):
+        """
+        Read a list of alleles written when the database was built
+
+        :param kind: completed, incomplete or extended
+        :param locus: HLA locus
+        :param seqtype: prot or nuc
+        :return: list of alleles, in natural sort order
+        """
+        name = db.allele_list_name(self.ungap, locus, kind, seqtype)
+        with self._reader() as reader:
+            return smart_sort(db.load_allele_list(reader, name))
+
+    def batch(self, calls: list, workers: int = None, return_exceptions=False):
+        """
+        Run many GENIE calls, spread over a thread pool
+
+        Identical calls are run once. Threads share this instance and its
+        sequences, so no data is copied per thread.
+
+        :param calls: list of (method name, list of arguments)
+        :param workers: number of threads, config["batch_workers"] if None
+        :param return_exceptions: return the exception of a failed call in its
+            place instead of raising it
+        :return: list of results in the order of calls
+        """
+        if workers is None:
+            workers = config["batch_workers"]
 
+        distinct = {}
+        for method, args in calls:
+            if not method[:1].isalpha() or not callable(getattr(self, method, None)):
+                raise ValueError(f"{method} is not a GENIE method")
+            distinct.setdefault((method, repr(args)), (method, args))
+
+        def run(call):
+            method, args = call
+            try:
+                return getattr(self, method)(*args)
+            except Exception as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = dict(zip(distinct, executor.map(run, distinct.values())))
+        return [results[method, repr(args)] for method, args in calls]
+
+    def _get_ard(self):
+        """
+        Get the py-ard object, importing and initializing py-ard on first use
+
+        :return: py-ard object
+        """
+        if self.ard is None:
+            with self._lock:
+                # another thread may have initialized it while this one waited
+                if self.ard is None:
+                    import pyard  # for HLA nomenclature
+
+                    self.ard = pyard.init(self.imgt_version, load_mac=self.load_mac)
+        return self.ard
+
+    def _redux(self, allele: str):
+        """
+        Reduce an allele to the two-field level with py-ard
+
+        py-ard is imported and initialized the first time it is needed, so
+        querying two-field alleles from a prebuilt database never loads it.
+        Reductions are cached, keeping up to cache_size alleles.
+
+        :param allele: The allele to reduce
+        :return: The two-field allele
+        """
+        try:
+            reduced = self._redux_cache[allele]
+            metrics.inc("redux_cache_hits")
+            return reduced
+        except KeyError:
+            metrics.inc("redux_cache_misses")
+
+        reduced = self._get_ard().redux(allele, "U2")
+
+        # evict the oldest entry once the cache is full, caching nothing without room
+        if self.cache_size > 0:
+            with self._lock:
+                if len(self._redux_cache) >= self.cache_size:
+                    del self._redux_cache[next(iter(self._redux_cache))]
+                self._redux_cache[allele] = reduced
+
+        return reduced
+
+    @metrics.timed
     def getAA(self, allele: str, position: int):
         """
         Get the amino acid at a specific position in an allele
@@ -92,16 +374,14 @@ class GENIE:
         """
 
         if allele.count(":") > 1:
-            try:
-                allele = self.ard.redux(allele, "U2")
-            except AttributeError:
-                # add an ard object
-                self.ard = pyard.init(self.imgt_version, load_mac=self.load_mac)
-                allele = self.ard.redux(allele, "U2")
+            allele = self._redux(allele)
 
         # get the amino acid at the specified position
+        if self.on_demand:
+            return self.seqs.residue(allele, position)
         return self.seqs[allele][position - 1]
 
+    @metrics.timed
     def getNuc(self, allele: str, position: int):
         """Get the nucleotide at a specific position in an allele
 
@@ -113,16 +393,170 @@ class GENIE:
         """
 
         if allele.count(":") > 1:
-            try:
-                allele = self.ard.redux(allele, "U2")
-            except AttributeError:
-                # add an ard object
-                self.ard = pyard.init(self.imgt_version, load_mac=self.load_mac)
-                allele = self.ard.redux(allele, "U2")
+            allele = self._redux(allele)
 
         # get the nucleotide at the specified position
+        if self.on_demand:
+            return self.nuc_seqs.residue(allele, position)
         return self.nuc_seqs[allele][position - 1]
 
+    @property
+    def coordinates(self) -> CoordinateIndex:
+        """
+        Codon columns of the mature protein positions, used to map between
+        protein and nucleotide positions
+        """
+        if self._coordinates is None:
+            with self._lock:
+                if self._coordinates is None:
+                    self._coordinates = CoordinateIndex(
+                        self.full_seqs, self.seqs, self.nuc_seqs
+                    )
+        return self._coordinates
+
+    @metrics.timed
+    def codon(self, allele: str, aa_position: int):
+        """
+        Get the codon of an amino acid position
+
+        A two-field allele uses the coding sequence of its lowest full name,
+        such as A*01:01:01:01 for A*01:01.
+
+        :param allele: The allele, two-field or a full name
+        :param aa_position: The mature protein position
+        :return: The three nucleotides coding the position, or None where the
+            reference sequence has a gap
+        """
+        return self.coordinates.codon(allele, aa_position)
+
+    @metrics.timed
+    def codonBatch(self, alleles: list, aa_positions: list) -> list:
+        """
+        Get the codons of many amino acid positions
+
+        :param alleles: The alleles, two-field or full names
+        :param aa_positions: The mature protein position for each allele
+        :return: A list of codons, as returned by codon
+        """
+        codon = self.coordinates.codon
+        return [
+            codon(allele, int(position))
+            for allele, position in zip(alleles, aa_positions)
+        ]
+
+    def _aa_for_nuc(self, allele: str, nuc_position: int):
+        mapped = self.coordinates.residue_position(allele, nuc_position)
+        if mapped is None:
+            return None
+        if allele.count(":") > 1:
+            allele = self._redux(allele)
+        position, offset = mapped
+        return position, offset, self.seqs[allele][position - 1]
+
+    @metrics.timed
+    def aaForNuc(self, allele: str, nuc_position: int):
+        """
+        Get the amino acid coded at a nucleotide position
+
+        :param allele: The allele, two-field or a full name
+        :param nuc_position: The position in the coding sequence, leader included
+        :return: A tuple of the mature protein position, the position within
+            the codon (1 to 3) and the amino acid, or None outside the mature protein
+        """
+        return self._aa_for_nuc(allele, nuc_position)
+
+    @metrics.timed
+    def aaForNucBatch(self, alleles: list, nuc_positions: list) -> list:
+        """
+        Get the amino acids coded at many nucleotide positions
+
+        :param alleles: The alleles, two-field or full names
+        :param nuc_positions: The position in the coding sequence for each allele
+        :return: A list of results, as returned by aaForNuc
+        """
+        return [
+            self._aa_for_nuc(allele, int(position))
+            for allele, position in zip(alleles, nuc_positions)
+        ]
+
+    @property
+    def translated_seqs(self):
+        """
+        Mature proteins translated from the ungapped coding sequences when the
+        database was built, keyed by full allele name
+        """
+        if self._translated_seqs is None:
+            if not self.ungap or self.db_connection is None:
+                raise ValueError(
+                    "Translated sequences are only built into ungapped databases"
+                )
+            with self._lock:
+                if self._translated_seqs is None:
+                    if self.on_demand:
+                        self._translated_seqs = SQLiteSeqs(
+                            self._reader, "ungapped_translated", self.cache_size
+                        )
+                    else:
+                        with self._reader() as reader:
+                            self._translated_seqs = db.load_sequences(
+                                reader, "ungapped_translated"
+                            )
+        return self._translated_seqs
+
+    @metrics.timed
+    def getTranslated(self, allele: str):
+        """
+        Get the mature protein translated from the coding sequence of an allele
+
+        Unlike getARD and the other protein lookups, three- and four-field
+        names are not reduced, so each full name has its own protein.
+        Codons of gaps translate to - and codons with unknown nucleotides to *.
+
+        :param allele: The allele, a full name or two-field, which uses its
+            lowest full name
+        :return: The translated mature protein sequence
+        """
+        return self.translated_seqs[self.coordinates.nuc_allele(allele)]
+
+    @metrics.timed
+    def getTranslatedAA(self, allele: str, position: int):
+        """
+        Get the amino acid at a position of the translated mature protein
+
+        :param allele: The allele, a full name or two-field
+        :param position: The mature protein position
+        :return: The translated amino acid
+        """
+        return self.getTranslated(allele)[position - 1]
+
+    @metrics.timed
+    def listDiscrepancies(self, locus: str = None):
+        """
+        List the positions where a translated protein disagrees with the
+        protein alignment of its two-field allele
+
+        :param locus: The locus to list the discrepancies of, None for every locus
+        :return: A list of dictionaries with the allele, position, translated
+            residue and protein residue
+        """
+        if not self.ungap or self.db_connection is None:
+            raise ValueError(
+                "Translated sequences are only built into ungapped databases"
+            )
+        with self._reader() as reader:
+            discrepancies = db.load_discrepancies(reader, "ungapped")
+        return [
+            {
+                "allele": allele,
+                "position": position,
+                "translated": translated,
+                "protein": protein,
+            }
+            for allele, position, translated, protein in discrepancies
+            if locus is None or allele.split("*")[0] == locus
+        ]
+
+    @metrics.timed
     def getPeptide(self, allele: str, start: int, stop: int):
         """
         Get the amino acid substring from a specified position to another specified position
@@ -134,38 +568,38 @@ class GENIE:
         """
 
         if allele.count(":") > 1:
-            try:
-                allele = self.ard.redux(allele, "U2")
-            except AttributeError:
-                # add an ard object
-                self.ard = pyard.init(self.imgt_version, load_mac=self.load_mac)
-                allele = self.ard.redux(allele, "U2")
+            allele = self._redux(allele)
 
         # get the amino acid substring
+        if self.on_demand:
+            return self.seqs.peptide(allele, start, stop)
         return self.seqs[allele][start - 1 : stop]
 
+    @metrics.timed
     def getEpitope(self, allele: str, positions: list[int]):
         """
         Get the epitope string from a list of positions
 
         :param allele: The allele to get the epitope from
-        :param positions: A list of positions to retrieve the epitope from
+        :param positions: A list of positions to retrieve the epitope from, or
+            the name of a region
         :return: The epitope string from the specified positions
         """
 
         if allele.count(":") > 1:
-            try:
-                allele = self.ard.redux(allele, "U2")
-            except AttributeError:
-                # add an ard object
-                self.ard = pyard.init(self.imgt_version, load_mac=self.load_mac)
-                allele = self.ard.redux(allele, "U2")
+            allele = self._redux(allele)
+
+        # positions of a named region
+        if isinstance(positions, str):
+            region = self.regions.get(allele.split("*")[0], positions)
+            positions = [i + 1 for i in region.indices(len(self.seqs[allele]))]
 
         # get the epitope string
         return "_".join(
             [f"{position}{self.seqs[allele][position-1]}" for position in positions]
         )
 
+    @metrics.timed
     def isPositionMismatched(self, allele1: str, allele2: str, position: int):
         """
         Check if two alleles have a mismatch at a specified position
@@ -177,19 +611,9 @@ class GENIE:
         """
 
         if allele1.count(":") > 1:
-            try:
-                allele1 = self.ard.redux(allele1, "U2")
-            except AttributeError:
-                # add an ard object
-                self.ard = pyard.init(self.imgt_version, load_mac=self.load_mac)
-                allele1 = self.ard.redux(allele1, "U2")
+            allele1 = self._redux(allele1)
         if allele2.count(":") > 1:
-            try:
-                allele2 = self.ard.redux(allele2, "U2")
-            except AttributeError:
-                # add an ard object
-                self.ard = pyard.init(self.imgt_version, load_mac=self.load_mac)
-                allele2 = self.ard.redux(allele2, "U2")
+            allele2 = self._redux(allele2)
 
         # get the amino acid at the specified position for each allele
         aa1 = self.getAA(allele1, position)
@@ -198,6 +622,7 @@ class GENIE:
         # check if the amino acids are the same
         return not (aa1 == aa2)
 
+    @metrics.timed
     def countAAMismatchesAllele(
         self,
         allele1donor: str,
@@ -217,33 +642,13 @@ class GENIE:
         :return: The number of amino acid mismatches between the two alleles at the specified position
         """
         if allele1donor.count(":") > 1:
-            try:
-                allele1donor = self.ard.redux(allele1donor, "U2")
-            except AttributeError:
-                # add an ard object
-                self.ard = pyard.init(self.imgt_version, load_mac=self.load_mac)
-                allele1donor = self.ard.redux(allele1donor, "U2")
+            allele1donor = self._redux(allele1donor)
         if allele2donor.count(":") > 1:
-            try:
-                allele2donor = self.ard.redux(allele2donor, "U2")
-            except AttributeError:
-                # add an ard object
-                self.ard = pyard.init(self.imgt_version, load_mac=self.load_mac)
-                allele2donor = self.ard.redux(allele2donor, "U2")
+            allele2donor = self._redux(allele2donor)
         if allele1recip.count(":") > 1:
-            try:
-                allele1recip = self.ard.redux(allele1recip, "U2")
-            except AttributeError:
-                # add an ard object
-                self.ard = pyard.init(self.imgt_version, load_mac=self.load_mac)
-                allele1recip = self.ard.redux(allele1recip, "U2")
+            allele1recip = self._redux(allele1recip)
         if allele2recip.count(":") > 1:
-            try:
-                allele2recip = self.ard.redux(allele2recip, "U2")
-            except AttributeError:
-                # add an ard object
-                self.ard = pyard.init(self.imgt_version, load_mac=self.load_mac)
-                allele2recip = self.ard.redux(allele2recip, "U2")
+            allele2recip = self._redux(allele2recip)
 
         # check if donor is homozygous
         donor_homozygous = False
@@ -265,6 +670,7 @@ class GENIE:
 
         return mm_count
 
+    @metrics.timed
     def countAAMismatches(
         self, aa1_donor: str, aa2_donor: str, aa1_recip: str, aa2_recip: str
     ):
@@ -287,6 +693,715 @@ class GENIE:
 
         return mm_count
 
+    @property
+    def residues(self) -> ResidueIndex:
+        """
+        Residue bitplanes of the mature sequences, used to compare whole regions
+        """
+        if self._residues is None:
+            with self._lock:
+                if self._residues is None:
+                    stored = None if self._shared is None else self._shared.planes
+                    self._residues = ResidueIndex(self.seqs, stored)
+        return self._residues
+
+    @property
+    def polymorphism(self) -> PolymorphismIndex:
+        """
+        Polymorphic positions of each locus with their residue counts, read
+        from the database or a shared store, or computed from the mature
+        sequences without either
+        """
+        if self._polymorphism is None:
+            with self._lock:
+                if self._polymorphism is None:
+                    if self._shared is not None:
+                        self._polymorphism = self._shared.polymorphism
+                    elif self.db_connection is None:
+                        self._polymorphism = PolymorphismIndex.from_seqs(self.seqs)
+                    else:
+                        mode = "ungapped" if self.ungap else "gapped"
+                        with self._reader() as reader:
+                            counts = db.load_residue_counts(reader, mode)
+                        self._polymorphism = PolymorphismIndex(counts)
+        return self._polymorphism
+
+    @metrics.timed
+    def polymorphicPositions(self, locus: str, region=None):
+        """
+        Get the polymorphic positions of a locus, such as for feature selection
+
+        Every other position carries the same residue in all alleles of the locus.
+
+        :param locus: The locus to get the polymorphic positions of
+        :param region: ARD, XRD, mature, a defined region or a list of mature
+            positions to limit the positions to, None for the whole sequence
+        :return: A dictionary of position to a dictionary of residue to the
+            number of alleles carrying it, in position order
+        """
+        counts = self.polymorphism.counts.get(locus, {})
+        if region is None:
+            return dict(counts)
+        length = max(counts, default=0)
+        positions = genotype.region_positions(self, locus, region, length)
+        return {
+            position: counts[position]
+            for position in sorted(positions)
+            if position in counts
+        }
+
+    @metrics.timed
+    def distanceMatrix(self, alleles: list, region="ARD"):
+        """
+        Count the mismatched positions between every pair of alleles of a locus
+
+        Only the polymorphic positions of the region are compared, and each
+        pair is compared over the positions both alleles cover.
+
+        :param alleles: The alleles to compare, all of the same locus
+        :param region: ARD, XRD, mature, a defined region or a list of mature positions
+        :return: A list of lists of mismatch counts, in the order of alleles
+        """
+        alleles = [
+            self._redux(allele) if allele.count(":") > 1 else allele
+            for allele in alleles
+        ]
+        loci = {allele.split("*")[0] for allele in alleles}
+        if len(loci) > 1:
+            raise ValueError("Alleles are not of the same locus")
+        if not alleles:
+            return []
+
+        positions = list(self.polymorphicPositions(loci.pop(), region))
+        # the residues of each allele at the positions it covers
+        residues = []
+        for allele in alleles:
+            seq = self.seqs[allele]
+            residues.append(
+                "".join(
+                    seq[position - 1] for position in positions if position <= len(seq)
+                )
+            )
+
+        n = len(alleles)
+        matrix = [[0] * n for _ in range(n)]
+        for i in range(n):
+            for j in range(i + 1, n):
+                # zip stops at the shorter allele, so only shared positions count
+                count = sum(map(operator.ne, residues[i], residues[j]))
+                matrix[i][j] = matrix[j][i] = count
+        return matrix
+
+    def _typing_pairs(self, donor_typing, recip_typing) -> dict:
+        """
+        Parse a donor and recipient typing into two-field alleles paired by locus
+
+        :param donor_typing: GL string or dictionary of the donor
+        :param recip_typing: GL string or dictionary of the recipient
+        :return: dictionary of locus to (distinct donor alleles, recipient alleles)
+        """
+        typings = []
+        for typing in (donor_typing, recip_typing):
+            loci = genotype.parse_typing(typing)
+            for locus, alleles in loci.items():
+                loci[locus] = [
+                    self._redux(allele) if allele.count(":") > 1 else allele
+                    for allele in alleles
+                ]
+            typings.append(loci)
+        return genotype.locus_pairs(*typings)
+
+    def _count_locus(self, locus: str, donor: tuple, recip: tuple, region) -> dict:
+        """
+        Count the mismatches of one locus, caching up to cache_size comparisons
+
+        :param locus: HLA locus
+        :param donor: distinct two-field donor alleles
+        :param recip: two-field recipient alleles
+        :param region: ARD, XRD, mature, a defined region or a list of mature positions
+        :return: dictionary with the count and the mismatches per position
+        """
+        key = (
+            locus,
+            donor,
+            recip,
+            region if isinstance(region, str) else tuple(region),
+        )
+        try:
+            return self._locus_counts[key]
+        except KeyError:
+            pass
+
+        counts = genotype.count_locus(self, locus, donor, recip, region)
+
+        # evict the oldest entry once the cache is full, caching nothing without room
+        if self.cache_size > 0:
+            with self._lock:
+                if len(self._locus_counts) >= self.cache_size:
+                    del self._locus_counts[next(iter(self._locus_counts))]
+                self._locus_counts[key] = counts
+
+        return counts
+
+    @metrics.timed
+    def genotypeMismatches(self, donor_typing, recip_typing, region="ARD"):
+        """
+        Count amino acid mismatches between a donor and recipient over every typed locus
+
+        Typings are GL strings ("A*01:01+A*02:01^B*07:02+B*08:01^...") or
+        dictionaries of locus to alleles. Each position counts as in
+        countAAMismatchesAllele. DRB3, DRB4 and DRB5 missing from a typing
+        are taken as not carried, so a donor DRB3 allele is fully mismatched
+        against a recipient without DRB3.
+
+        :param donor_typing: GL string or dictionary of the donor
+        :param recip_typing: GL string or dictionary of the recipient
+        :param region: ARD, XRD, mature, a defined region or a list of mature positions
+        :return: dictionary with the total and, per locus, the count and the
+            number of mismatches at each mismatched position
+        """
+        pairs = self._typing_pairs(donor_typing, recip_typing)
+        loci = {
+            locus: genotype.count_locus(self, locus, donor, recip, region)
+            for locus, (donor, recip) in pairs.items()
+        }
+        return {"total": sum(c["count"] for c in loci.values()), "loci": loci}
+
+    @metrics.timed
+    def genotypeMismatchesBatch(
+        self, typing_pairs: list, region="ARD", workers: int = None
+    ) -> list:
+        """
+        Count genotype mismatches for many donor and recipient pairs
+
+        Each distinct locus comparison is computed once and cached, so cohorts sharing
+        common alleles cost about as much as their distinct allele combinations.
+        Batches of at least config["parallel_batch_size"] pairs count each locus
+        in its own thread.
+
+        :param typing_pairs: list of (donor typing, recipient typing)
+        :param region: ARD, XRD, mature, a defined region or a list of mature positions
+        :param workers: number of threads, config["batch_workers"] if None
+        :return: list of results as returned by genotypeMismatches
+        """
+        if workers is None:
+            workers = config["batch_workers"]
+
+        parsed = [
+            self._typing_pairs(donor_typing, recip_typing)
+            for donor_typing, recip_typing in typing_pairs
+        ]
+
+        # distinct comparisons of each locus, in order of appearance
+        by_locus = {}
+        for pairs in parsed:
+            for locus, pair in pairs.items():
+                by_locus.setdefault(locus, {})[pair] = None
+
+        def count(locus):
+            return locus, {
+                pair: self._count_locus(locus, *pair, region)
+                for pair in by_locus[locus]
+            }
+
+        if (
+            workers > 1
+            and len(by_locus) > 1
+            and len(typing_pairs) >= config["parallel_batch_size"]
+        ):
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                counted = dict(executor.map(count, by_locus))
+        else:
+            counted = dict(map(count, by_locus))
+
+        results = []
+        for pairs in parsed:
+            loci = {locus: counted[locus][pair] for locus, pair in pairs.items()}
+            results.append(
+                {"total": sum(c["count"] for c in loci.values()), "loci": loci}
+            )
+        return results
+
+    def _directional(self, alleles: tuple, region, as_bool: bool) -> dict:
+        """
+        Get the directional mismatches of two-field donor and recipient alleles
+
+        :param alleles: two-field (donor 1, donor 2, recipient 1, recipient 2)
+        :param region: ARD, XRD, mature, a defined region or a list of mature positions
+        :param as_bool: return lists of booleans instead of bitmasks
+        :return: dictionary as returned by directionalMismatches
+        """
+        donor = list(dict.fromkeys(alleles[:2]))
+        recip = list(dict.fromkeys(alleles[2:]))
+        locus = alleles[0].split("*")[0]
+
+        hvg, gvh, hvg_count, gvh_count = self.residues.directional_masks(
+            donor, recip, genotype.compared_mask(self, locus, region, recip)
+        )
+        result = {
+            "hvg": hvg,
+            "gvh": gvh,
+            "hvg_count": hvg_count,
+            "gvh_count": gvh_count,
+        }
+
+        if as_bool:
+            length = min(len(self.seqs[allele]) for allele in alleles)
+            positions = genotype.region_positions(self, locus, region, length)
+            result["positions"] = positions
+            result["hvg"] = mask_to_bools(hvg, positions)
+            result["gvh"] = mask_to_bools(gvh, positions)
+
+        return result
+
+    @metrics.timed
+    def directionalMismatches(
+        self,
+        allele1donor: str,
+        allele2donor: str,
+        allele1recip: str,
+        allele2recip: str,
+        region="ARD",
+        as_bool: bool = False,
+    ):
+        """
+        Get the host-versus-graft and graft-versus-host mismatched positions of a pair
+
+        Host-versus-graft (HvG) positions carry a donor residue absent in the
+        recipient, the direction counted by countAAMismatchesAllele, and
+        graft-versus-host (GvH) positions carry a recipient residue absent in
+        the donor. Both come from a single comparison of the four alleles.
+
+        :param allele1donor: The first allele of the donor
+        :param allele2donor: The second allele of the donor
+        :param allele1recip: The first allele of the recipient
+        :param allele2recip: The second allele of the recipient
+        :param region: ARD, XRD, mature, a defined region or a list of mature positions
+        :param as_bool: return lists of booleans over the region positions
+            instead of bitmasks where bit i is set for position i + 1
+        :return: dictionary with the hvg and gvh masks and, summed over the
+            distinct alleles of each side, the hvg_count and gvh_count of
+            mismatched positions (and the positions when as_bool is True)
+        """
+        alleles = tuple(
+            self._redux(allele) if allele.count(":") > 1 else allele
+            for allele in (allele1donor, allele2donor, allele1recip, allele2recip)
+        )
+        return self._directional(alleles, region, as_bool)
+
+    @metrics.timed
+    def directionalMismatchesBatch(
+        self, allele_pairs: list, region="ARD", as_bool: bool = False
+    ) -> list:
+        """
+        Get the directional mismatches of many donor and recipient pairs
+
+        Each distinct pair is compared once.
+
+        :param allele_pairs: list of (donor 1, donor 2, recipient 1, recipient 2)
+        :param region: ARD, XRD, mature, a defined region or a list of mature positions
+        :param as_bool: return lists of booleans instead of bitmasks
+        :return: list of results as returned by directionalMismatches
+        """
+        compared = {}
+        results = []
+        for pair in allele_pairs:
+            alleles = tuple(
+                self._redux(allele) if allele.count(":") > 1 else allele
+                for allele in pair
+            )
+            if alleles not in compared:
+                compared[alleles] = self._directional(alleles, region, as_bool)
+            results.append(compared[alleles])
+        return results
+
+    def _codon_mismatches(self, alleles: tuple, region) -> dict:
+        """
+        Classify the codon mismatches of donor and recipient alleles
+
+        :param alleles: (donor 1, donor 2, recipient 1, recipient 2)
+        :param region: ARD, XRD, mature, a defined region or a list of mature positions
+        :return: dictionary as returned by codonMismatches
+        """
+        coordinates = self.coordinates
+        locus = alleles[0].split("*")[0]
+        positions = genotype.region_positions(
+            self, locus, region, len(coordinates.codons[locus])
+        )
+        donor = list(dict.fromkeys(alleles[:2]))
+        recip = list(dict.fromkeys(alleles[2:]))
+        return coordinates.mismatches(donor, recip, positions)
+
+    @metrics.timed
+    def codonMismatches(
+        self,
+        allele1donor: str,
+        allele2donor: str,
+        allele1recip: str,
+        allele2recip: str,
+        region="ARD",
+    ):
+        """
+        Classify the nucleotide mismatches of a pair codon by codon
+
+        Each codon of a distinct donor allele absent in the recipient is
+        synonymous when a recipient codon codes the same amino acid,
+        non-synonymous when none does, or unknown when gaps or unknown
+        nucleotides hide the amino acid. Full names are compared at the
+        nucleotide level as they are, and two-field alleles use the coding
+        sequence of their lowest full name.
+
+        :param allele1donor: The first allele of the donor
+        :param allele2donor: The second allele of the donor
+        :param allele1recip: The first allele of the recipient
+        :param allele2recip: The second allele of the recipient
+        :param region: ARD, XRD, mature, a defined region or a list of mature positions
+        :return: dictionary with the list of mismatched codons (donor allele,
+            position, donor codon, closest recipient codon, nucleotide
+            differences and type), the count of each type and the total
+            nucleotide_differences
+        """
+        return self._codon_mismatches(
+            (allele1donor, allele2donor, allele1recip, allele2recip), region
+        )
+
+    @metrics.timed
+    def codonMismatchesBatch(self, allele_pairs: list, region="ARD") -> list:
+        """
+        Classify the nucleotide mismatches of many donor and recipient pairs
+
+        Each distinct pair is compared once.
+
+        :param allele_pairs: list of (donor 1, donor 2, recipient 1, recipient 2)
+        :param region: ARD, XRD, mature, a defined region or a list of mature positions
+        :return: list of results as returned by codonMismatches
+        """
+        compared = {}
+        results = []
+        for pair in allele_pairs:
+            alleles = tuple(pair)
+            if alleles not in compared:
+                compared[alleles] = self._codon_mismatches(alleles, region)
+            results.append(compared[alleles])
+        return results
+
+    @metrics.timed
+    def substitutionScore(
+        self,
+        allele1donor: str,
+        allele2donor: str,
+        allele1recip: str,
+        allele2recip: str,
+        matrix="grantham",
+        region="ARD",
+        position_weights: dict = None,
+        direction: str = "hvg",
+    ):
+        """
+        Score the amino acid substitutions between donor and recipient
+
+        Each donor residue absent in the recipient, at the same positions
+        countAAMismatchesAllele counts, adds its dissimilarity to the closest
+        recipient residue instead of 1, times the weight of the position.
+
+        :param allele1donor: The first allele of the donor
+        :param allele2donor: The second allele of the donor
+        :param allele1recip: The first allele of the recipient
+        :param allele2recip: The second allele of the recipient
+        :param matrix: grantham, blosum62, a dictionary of (residue, residue)
+            to weight or a scoring.SubstitutionMatrix
+        :param region: ARD, XRD, mature, a defined region or a list of mature positions
+        :param position_weights: dictionary of position to weight, 1 if missing
+        :param direction: hvg to score donor residues against the recipient,
+            gvh to score recipient residues against the donor
+        :return: substitution score
+        """
+        return self.substitutionScoreBatch(
+            [(allele1donor, allele2donor, allele1recip, allele2recip)],
+            matrix,
+            region,
+            position_weights,
+            direction,
+        )[0]
+
+    @metrics.timed
+    def substitutionScoreBatch(
+        self,
+        allele_pairs: list,
+        matrix="grantham",
+        region="ARD",
+        position_weights: dict = None,
+        direction: str = "hvg",
+    ) -> list:
+        """
+        Score the amino acid substitutions of many donor and recipient pairs
+
+        The matrix is compiled once and each distinct pair is scored once.
+
+        :param allele_pairs: list of (donor 1, donor 2, recipient 1, recipient 2)
+        :param matrix: grantham, blosum62, a dictionary of (residue, residue)
+            to weight or a scoring.SubstitutionMatrix
+        :param region: ARD, XRD, mature, a defined region or a list of mature positions
+        :param position_weights: dictionary of position to weight, 1 if missing
+        :param direction: hvg or gvh
+        :return: list of substitution scores
+        """
+        if direction not in ("hvg", "gvh"):
+            raise ValueError(f"Invalid direction {direction}, must be hvg or gvh")
+        compiled = scoring.get_matrix(matrix)
+
+        scored = {}
+        results = []
+        for pair in allele_pairs:
+            alleles = tuple(
+                self._redux(allele) if allele.count(":") > 1 else allele
+                for allele in pair
+            )
+            if alleles not in scored:
+                donor, recip = alleles[:2], alleles[2:]
+                if direction == "gvh":
+                    donor, recip = recip, donor
+                locus = alleles[0].split("*")[0]
+                scored[alleles] = scoring.score_locus(
+                    self,
+                    list(dict.fromkeys(donor)),
+                    list(recip),
+                    genotype.compared_mask(self, locus, region, recip),
+                    compiled,
+                    position_weights,
+                )
+            results.append(scored[alleles])
+        return results
+
+    def loadEplets(self, path):
+        """
+        Load an eplet library, replacing any loaded before
+
+        Each line of the file holds the loci, the eplet name and optionally
+        its definition, such as "A,B,C 62GE" or "DRB1 96EV 96E_98V", with
+        positions in the mature coordinates of this instance.
+
+        :param path: eplet library file
+        :return: the compiled eplet library
+        """
+        self.eplets = EpletLibrary.from_file(path, self.residues)
+        return self.eplets
+
+    def _eplet_library(self) -> EpletLibrary:
+        if self.eplets is None:
+            raise ValueError("No eplet library loaded, call loadEplets first")
+        return self.eplets
+
+    @metrics.timed
+    def getEplets(self, allele: str):
+        """
+        Get the eplets of the loaded library carried by an allele
+
+        :param allele: The allele to get the eplets of
+        :return: A list of eplet names in library order
+        """
+        library = self._eplet_library()
+        if allele.count(":") > 1:
+            allele = self._redux(allele)
+        return library.eplet_names(allele.split("*")[0], library.bitset(allele))
+
+    @metrics.timed
+    def epletMismatches(
+        self,
+        allele1donor: str,
+        allele2donor: str,
+        allele1recip: str,
+        allele2recip: str,
+    ):
+        """
+        Get the donor eplets absent in the recipient
+
+        :param allele1donor: The first allele of the donor
+        :param allele2donor: The second allele of the donor
+        :param allele1recip: The first allele of the recipient
+        :param allele2recip: The second allele of the recipient
+        :return: dictionary with the count and the names of the mismatched eplets
+        """
+        return self.epletMismatchesBatch(
+            [(allele1donor, allele2donor, allele1recip, allele2recip)]
+        )[0]
+
+    @metrics.timed
+    def epletMismatchesBatch(self, allele_pairs: list, names: bool = True) -> list:
+        """
+        Get the eplet mismatch loads of many donor and recipient pairs
+
+        Every allele is compiled to its eplet bitset once, so each pair costs
+        a few integer operations.
+
+        :param allele_pairs: list of (donor 1, donor 2, recipient 1, recipient 2)
+        :param names: include the names of the mismatched eplets, which can
+            be left out when only the loads are needed
+        :return: list of dictionaries with the count (and eplets when names is True)
+        """
+        library = self._eplet_library()
+        results = []
+        for pair in allele_pairs:
+            alleles = [
+                self._redux(allele) if allele.count(":") > 1 else allele
+                for allele in pair
+            ]
+            mismatched = library.mismatches(alleles[:2], alleles[2:])
+            result = {"count": mismatched.bit_count()}
+            if names:
+                result["eplets"] = library.eplet_names(
+                    alleles[0].split("*")[0], mismatched
+                )
+            results.append(result)
+        return results
+
+    @metrics.timed
+    def genotypeEpletMismatches(self, donor_typing, recip_typing):
+        """
+        Get the donor eplets absent in the recipient over every typed locus
+
+        Typings are read as in genotypeMismatches, so a donor DRB3, DRB4 or
+        DRB5 allele the recipient does not carry has all its eplets mismatched.
+
+        :param donor_typing: GL string or dictionary of the donor
+        :param recip_typing: GL string or dictionary of the recipient
+        :return: dictionary with the total and, per locus, the count and the
+            names of the mismatched eplets
+        """
+        library = self._eplet_library()
+        loci = {}
+        for locus, (donor, recip) in self._typing_pairs(
+            donor_typing, recip_typing
+        ).items():
+            mismatched = library.mismatches(donor, recip)
+            loci[locus] = {
+                "count": mismatched.bit_count(),
+                "eplets": library.eplet_names(locus, mismatched),
+            }
+        return {"total": sum(c["count"] for c in loci.values()), "loci": loci}
+
+    def _expand_allele(self, allele: str) -> list[str]:
+        """
+        Expand a MAC or XX code into its alleles with py-ard
+
+        :param allele: allele or code
+        :return: list of alleles, just the allele itself if it is not a code
+        """
+        fields = allele.split(":")
+        # only codes have letters in the second field, so py-ard is not needed otherwise
+        if len(fields) < 2 or not fields[1][:1].isalpha():
+            return [allele]
+
+        ard = self._get_ard()
+        if ard.is_mac(allele):
+            return ard.expand_mac(allele).split("/")
+        if ard.is_XX(allele):
+            return ard.expand_xx(allele).split("/")
+        return [allele]
+
+    def _representative(self, allele: str) -> str:
+        """
+        Get the first allele seen with the same mature sequence as an allele
+
+        :param allele: two-field allele
+        :return: allele standing for every allele with its sequence
+        """
+        return self._representatives.setdefault(self.seqs[allele], allele)
+
+    def _candidate_weights(self, locus: str, genotypes: list, frequencies) -> dict:
+        """
+        Reduce and weigh candidate genotypes, merging those with identical sequences
+
+        :param locus: HLA locus
+        :param genotypes: candidate allele tuples
+        :param frequencies: dictionary of two-field allele to frequency, or None
+        :return: dictionary of representative genotype to weight
+        """
+        reduced = []
+        for candidate in genotypes:
+            alleles = tuple(
+                self._redux(allele) if allele.count(":") > 1 else allele
+                for allele in candidate
+            )
+            # drop candidates with alleles not in this IMGT/HLA version
+            if all(allele in self.seqs for allele in alleles):
+                reduced.append(alleles)
+        if genotypes and not reduced:
+            raise ValueError(f"No candidate {locus} genotype has known alleles")
+
+        merged = {}
+        for candidate, weight in genotype.genotype_weights(
+            reduced, frequencies
+        ).items():
+            # homozygous only when the alleles are the same, as in
+            # countAAMismatchesAllele, so two alleles with identical sequences
+            # still count as two
+            if len(set(candidate)) == 1:
+                candidate = candidate[:1]
+            key = tuple(sorted(self._representative(allele) for allele in candidate))
+            merged[key] = merged.get(key, 0.0) + weight
+        return merged
+
+    @metrics.timed
+    def ambiguousMismatches(
+        self, donor_typing, recip_typing, region="ARD", frequencies: dict = None
+    ):
+        """
+        Count amino acid mismatches between ambiguous donor and recipient typings
+
+        Typings are GL strings with allele ("/") and genotype ("|") ambiguity,
+        MAC or XX codes (expanded with py-ard), or dictionaries of locus to
+        alleles. Every candidate donor genotype is compared with every
+        candidate recipient genotype as in genotypeMismatches. Candidates with
+        identical sequences are merged first. Loci are treated as
+        independent, so the totals are sums over loci.
+
+        :param donor_typing: GL string or dictionary of the donor
+        :param recip_typing: GL string or dictionary of the recipient
+        :param region: ARD, XRD, mature, a defined region or a list of mature positions
+        :param frequencies: dictionary of two-field allele to frequency, used to
+            weight candidate genotypes by Hardy-Weinberg proportions, uniform if None
+        :return: dictionary with the min, max and expected total and the same
+            summary per locus
+        """
+        sides = []
+        for typing in (donor_typing, recip_typing):
+            candidates = genotype.parse_ambiguous_typing(typing, self._expand_allele)
+            sides.append(
+                {
+                    locus: self._candidate_weights(locus, genotypes, frequencies)
+                    for locus, genotypes in candidates.items()
+                }
+            )
+        donor_side, recip_side = sides
+
+        loci = {}
+        for locus in config["loci"]:
+            if locus not in donor_side and locus not in recip_side:
+                continue
+            if locus not in genotype.OPTIONAL_LOCI and not (
+                locus in donor_side and locus in recip_side
+            ):
+                missing = "recipient" if locus in donor_side else "donor"
+                raise ValueError(f"{locus} is typed for one side but not the {missing}")
+
+            # a DRB3/4/5 gene absent from a typing is not carried
+            loci[locus] = genotype.ambiguous_locus_summary(
+                self,
+                locus,
+                donor_side.get(locus, {(): 1.0}),
+                recip_side.get(locus, {(): 1.0}),
+                region,
+            )
+
+        return {
+            "min": sum(summary["min"] for summary in loci.values()),
+            "max": sum(summary["max"] for summary in loci.values()),
+            "expected": sum(summary["expected"] for summary in loci.values()),
+            "loci": loci,
+        }
+
+    @metrics.timed
     def getARD(self, allele: str):
         """
         Get the ARD sequence of an allele
@@ -297,19 +1412,17 @@ class GENIE:
 
         # reduce to two field if greater than two field
         if allele.count(":") > 1:
-            try:
-                allele = self.ard.redux(allele, "U2")
-            except AttributeError:
-                # add an ard object
-                self.ard = pyard.init(self.imgt_version, load_mac=self.load_mac)
-                allele = self.ard.redux(allele, "U2")
+            allele = self._redux(allele)
 
         # get locus
         locus = allele.split("*")[0]
 
         # get the ARD sequence
+        if self.on_demand:
+            return self.seqs.peptide(allele, 1, self.ards[locus])
         return self.seqs[allele][: self.ards[locus]]
 
+    @metrics.timed
     def getXRD(self, allele: str):
         """
         Get the XRD sequence of an allele
@@ -320,38 +1433,94 @@ class GENIE:
 
         # reduce to two field if greater than two field
         if allele.count(":") > 1:
-            try:
-                allele = self.ard.redux(allele, "U2")
-            except AttributeError:
-                # add an ard object
-                self.ard = pyard.init(self.imgt_version, load_mac=self.load_mac)
-                allele = self.ard.redux(allele, "U2")
+            allele = self._redux(allele)
 
         # get locus
         locus = allele.split("*")[0]
 
-        # get the ARD sequence
+        # get the XRD sequence
+        if self.on_demand:
+            return self.seqs.peptide(allele, 1, self.xrds[locus])
         return self.seqs[allele][: self.xrds[locus]]
 
+    @metrics.timed
+    def getRegion(self, allele: str, region):
+        """
+        Get the residues of an allele in a region
+
+        :param allele: The allele to get the residues from
+        :param region: ARD, XRD, mature, a region added with defineRegion or a
+            list of mature positions
+        :return: The residues at the positions of the region, in position order
+        """
+
+        if allele.count(":") > 1:
+            allele = self._redux(allele)
+
+        # gather every position of the compiled region at once
+        return self.regions.get(allele.split("*")[0], region).gather(self.seqs[allele])
+
+    def defineRegion(self, name: str, positions):
+        """
+        Add or replace a named region, such as a peptide-binding pocket
+
+        The region is saved in the database, so later instances over the same
+        database and coordinates (gapped or ungapped) know it too. Region
+        names are accepted wherever a region is, such as getEpitope,
+        getRegion and the mismatch counts.
+
+        :param name: name of the region
+        :param positions: list of mature positions used for every locus, or a
+            dictionary of locus to list of mature positions
+        """
+        with self._lock:
+            added = self.regions.define(name, positions)
+            if self.db_connection is not None:
+                # a build may have replaced the file since it was opened
+                with db.file_lock(f"{self._db_path}.lock"):
+                    conn = db.create_db_connection(
+                        self._data_dir,
+                        self.imgt_version,
+                        self.imputed,
+                        self.imputation_method,
+                    )
+                    try:
+                        mode = "ungapped" if self.ungap else "gapped"
+                        db.save_regions(conn, mode, added)
+                        conn.commit()
+                    finally:
+                        conn.close()
+
+            # cached counts may refer to an earlier definition of the region
+            self._locus_counts.clear()
+
+    def listRegions(self, locus: str = None):
+        """
+        List the regions available
+
+        :param locus: The locus to list the regions of, None for any locus
+        :return: A list of region names, built-in regions first
+        """
+        return self.regions.names(locus)
+
     def listIncompletes(self, locus: str, seqtype: str = "prot"):
         """
         List the incomplete alleles in the database
 
         :param locus: The locus to list the incomplete alleles from
         :param seqtype: The sequence type to list the incomplete alleles for (prot or nuc)
-        :return: A list of incomplete alleles
+        :return: A list of incomplete alleles, in natural sort order
         """
 
-        if seqtype == "prot":
-            return dr.generate_incomplete_table(
-                self.db_connection, locus, seqtype, self.seqs
-            )
-        elif seqtype == "nuc":
-            return dr.generate_incomplete_table(
-                self.db_connection, locus, seqtype, self.nuc_seqs
-            )
-        else:
+        # bundles carry the lists computed when they were exported
+        if self._completeness is not None:
+            return self._completeness.get((locus, seqtype, "incomplete"), [])
+
+        if seqtype not in ("prot", "nuc"):
             print("Invalid sequence type specified")
+            return None
+
+        return self._list_table("incomplete", locus, seqtype)
 
     def listCompletes(self, locus: str, seqtype: str = "prot"):
         """
@@ -359,19 +1528,18 @@ class GENIE:
 
         :param locus: The locus to list the complete alleles from
         :param seqtype: The sequence type to list the complete alleles for (prot or nuc)
-        :return: A list of complete alleles
+        :return: A list of complete alleles, in natural sort order
         """
 
-        if seqtype == "prot":
-            return dr.generate_completed_table(
-                self.db_connection, locus, seqtype, self.seqs
-            )
-        elif seqtype == "nuc":
-            return dr.generate_completed_table(
-                self.db_connection, locus, seqtype, self.nuc_seqs
-            )
-        else:
+        # bundles carry the lists computed when they were exported
+        if self._completeness is not None:
+            return self._completeness.get((locus, seqtype, "complete"), [])
+
+        if seqtype not in ("prot", "nuc"):
             print("Invalid sequence type specified")
+            return None
+
+        return self._list_table("completed", locus, seqtype)
 
     def listExtendeds(self, locus: str, seqtype: str = "prot"):
         """
@@ -379,16 +1547,15 @@ class GENIE:
 
         :param locus: The locus to list the extended alleles from
         :param seqtype: The sequence type to list the extended alleles for (prot or nuc)
-        :return: A list of extended alleles
+        :return: A list of extended alleles, in natural sort order
         """
 
-        if seqtype == "prot":
-            return dr.generate_extended_table(
-                self.db_connection, locus, seqtype, self.ungap, self.seqs
-            )
-        elif seqtype == "nuc":
-            return dr.generate_extended_table(
-                self.db_connection, locus, seqtype, self.ungap, self.nuc_seqs
-            )
-        else:
+        # bundles carry the lists computed when they were exported
+        if self._completeness is not None:
+            return self._completeness.get((locus, seqtype, "extended"), [])
+
+        if seqtype not in ("prot", "nuc"):
             print("Invalid sequence type specified")
+            return None
+
+        return self._list_table("extended", locus, seqtype)
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+
+# genotype.py - multi-locus donor and recipient typings
+
+import itertools  # for combining ambiguous alleles
+from .configs import config  # for configurations
+from .residues import positions_mask, mask_positions  # for region comparisons
+
+# loci a person may not carry, so an absent typing means no gene rather than untyped
+OPTIONAL_LOCI = ("DRB3", "DRB4", "DRB5")
+
+
+def parse_typing(typing) -> dict:
+    """
+    Split a typing into its alleles per locus
+
+    A typing is either a GL string such as "A*01:01+A*02:01^B*07:02+B*08:01"
+    or a dictionary of locus to a list of alleles or a GL string of one locus.
+    Ambiguous typings ("/" or "|") are not accepted here.
+
+    :param typing: GL string or dictionary
+    :return: dictionary of locus to list of up to two alleles
+    """
+    if isinstance(typing, str):
+        entries = [(None, genotype) for genotype in typing.split("^") if genotype]
+    elif isinstance(typing, dict):
+        entries = list(typing.items())
+    else:
+        raise ValueError(f"Typing must be a GL string or a dictionary, not {typing!r}")
+
+    loci = {}
+    for locus, alleles in entries:
+        if isinstance(alleles, str):
+            if "/" in alleles or "|" in alleles:
+                raise ValueError(f"Ambiguous typing {alleles} is not supported")
+            alleles = alleles.split("+")
+        alleles = [allele for allele in alleles if allele]
+        if not alleles:
+            continue
+
+        genes = {allele.split("*")[0] for allele in alleles}
+        # DRB3/4/5 can be listed together as one genotype
+        if locus in (None, "DRB345") and genes <= set(OPTIONAL_LOCI):
+            for allele in alleles:
+                loci.setdefault(allele.split("*")[0], []).append(allele)
+            continue
+
+        if locus is None:
+            locus = next(iter(genes)) if len(genes) == 1 else None
+        if genes != {locus}:
+            raise ValueError(f"Alleles {alleles} do not belong to locus {locus}")
+        if locus not in config["loci"]:
+            raise ValueError(f"Unknown locus {locus}")
+        loci.setdefault(locus, []).extend(alleles)
+
+    for locus, alleles in loci.items():
+        if len(alleles) > 2:
+            raise ValueError(f"More than two alleles at {locus}: {alleles}")
+
+    return loci
+
+
+def region_mask(genie, locus: str, region) -> int:
+    """
+    Get the bitmask of the mature positions of a region
+
+    :param genie: GENIE instance
+    :param locus: HLA locus
+    :param region: ARD, XRD, mature, a defined region or a list of positions
+    :return: bitmask of the positions in the region, -1 for the whole mature
+        sequence, which is limited to the length of the sequences when compared
+    """
+    if isinstance(region, str):
+        return genie.regions.get(locus, region).mask
+    return positions_mask(region)
+
+
+def compared_mask(genie, locus: str, region, recip) -> int:
+    """
+    Get the bitmask of the positions of a region worth comparing with a recipient
+
+    Positions where every allele of the locus carries the same residue
+    cannot mismatch a recipient carrying the gene, so only the polymorphic
+    ones are kept. Against a recipient without the gene, every position counts.
+
+    :param genie: GENIE instance
+    :param locus: HLA locus
+    :param region: ARD, XRD, mature, a defined region or a list of positions
+    :param recip: recipient alleles, empty if the recipient lacks the gene
+    :return: bitmask of the positions to compare
+    """
+    mask = region_mask(genie, locus, region)
+    if recip:
+        mask &= genie.polymorphism.mask(locus)
+    return mask
+
+
+def region_positions(genie, locus: str, region, length: int) -> list[int]:
+    """
+    Get the mature positions of a region
+
+    :param genie: GENIE instance
+    :param locus: HLA locus
+    :param region: ARD, XRD, mature, a defined region or a list of positions
+    :param length: length of the shortest compared sequence, ending the mature region
+    :return: list of 1-based positions
+    """
+    if isinstance(region, str):
+        return [i + 1 for i in genie.regions.get(locus, region).indices(length)]
+    return list(region)
+
+
+def locus_pairs(donor: dict, recip: dict) -> dict:
+    """
+    Pair up the donor and recipient alleles of every locus typed
+
+    :param donor: parsed donor typing
+    :param recip: parsed recipient typing
+    :return: dictionary of locus to (distinct donor alleles, recipient alleles)
+    """
+    pairs = {}
+    for locus in config["loci"]:
+        donor_alleles = donor.get(locus, [])
+        recip_alleles = recip.get(locus, [])
+        if not donor_alleles and not recip_alleles:
+            continue
+        if locus not in OPTIONAL_LOCI and not (donor_alleles and recip_alleles):
+            missing = "recipient" if donor_alleles else "donor"
+            raise ValueError(f"{locus} is typed for one side but not the {missing}")
+
+        # a homozygous donor (or a single listed allele) is counted once
+        distinct_donor = list(dict.fromkeys(donor_alleles))
+        pairs[locus] = (tuple(distinct_donor), tuple(recip_alleles))
+    return pairs
+
+
+def count_locus(genie, locus: str, donor: tuple, recip: tuple, region) -> dict:
+    """
+    Count the mismatches of one locus
+
+    :param genie: GENIE instance
+    :param locus: HLA locus
+    :param donor: distinct two-field donor alleles
+    :param recip: two-field recipient alleles
+    :param region: ARD, XRD, mature, a defined region or a list of positions
+    :return: dictionary with the count and the mismatches per position
+    """
+    # a donor without the gene presents nothing to the recipient
+    if not donor:
+        return {"count": 0, "positions": {}}
+
+    masks = genie.residues.mismatch_masks(
+        list(donor), list(recip), compared_mask(genie, locus, region, recip)
+    )
+
+    positions = {}
+    for mask in masks:
+        for position in mask_positions(mask):
+            positions[position] = positions.get(position, 0) + 1
+
+    return {
+        "count": sum(mask.bit_count() for mask in masks),
+        "positions": dict(sorted(positions.items())),
+    }
+
+
+def _split_genotype(genotype: str, expand) -> list[tuple]:
+    """
+    Expand one genotype of a GL string into concrete allele pairs
+
+    :param genotype: genotype such as "A*02:01/A*02:06+A*01:01"
+    :param expand: function turning an allele or code into a list of alleles
+    :return: list of allele tuples
+    """
+    sides = []
+    for side in genotype.split("+"):
+        alleles = []
+        for allele in side.split("/"):
+            if allele:
+                alleles.extend(expand(allele))
+        sides.append(list(dict.fromkeys(alleles)))
+    return [tuple(combination) for combination in itertools.product(*sides)]
+
+
+def parse_ambiguous_typing(typing, expand=lambda allele: [allele]) -> dict:
+    """
+    Split an ambiguous typing into the candidate genotypes of each locus
+
+    Accepts GL strings with allele ("/") and genotype ("|") ambiguity, and
+    dictionaries of locus to a GL string or a list of alleles. DRB3, DRB4 and
+    DRB5 listed together are split into one candidate list per gene, where
+    an empty genotype means the gene is not carried in that candidate.
+
+    :param typing: GL string or dictionary
+    :param expand: function turning an allele or code (such as a MAC) into
+        a list of alleles
+    :return: dictionary of locus to list of candidate allele tuples
+    """
+    if isinstance(typing, str):
+        entries = [(None, part) for part in typing.split("^") if part]
+    elif isinstance(typing, dict):
+        entries = list(typing.items())
+    else:
+        raise ValueError(f"Typing must be a GL string or a dictionary, not {typing!r}")
+
+    loci = {}
+    for locus, part in entries:
+        if isinstance(part, str):
+            genotypes = []
+            for genotype in part.split("|"):
+                genotypes.extend(_split_genotype(genotype, expand))
+        else:
+            genotypes = [tuple(part)]
+        genotypes = [genotype for genotype in genotypes if genotype]
+        if not genotypes:
+            continue
+
+        genes = {allele.split("*")[0] for genotype in genotypes for allele in genotype}
+        # DRB3/4/5 are split into a candidate list per gene
+        if locus in (None, "DRB345") and genes <= set(OPTIONAL_LOCI):
+            for gene in genes:
+                loci.setdefault(gene, []).extend(
+                    tuple(a for a in genotype if a.split("*")[0] == gene)
+                    for genotype in genotypes
+                )
+            continue
+
+        if locus is None:
+            locus = next(iter(genes)) if len(genes) == 1 else None
+        if genes != {locus}:
+            raise ValueError(f"Alleles of {part} do not belong to locus {locus}")
+        if locus not in config["loci"]:
+            raise ValueError(f"Unknown locus {locus}")
+        loci.setdefault(locus, []).extend(genotypes)
+
+    for locus, genotypes in loci.items():
+        for genotype in genotypes:
+            if len(genotype) > 2:
+                raise ValueError(f"More than two alleles at {locus}: {genotype}")
+
+    return loci
+
+
+def genotype_weights(genotypes: list[tuple], frequencies: dict = None) -> dict:
+    """
+    Weigh the candidate genotypes of one locus
+
+    Without frequencies every candidate is equally likely. With allele
+    frequencies, a genotype is weighted by Hardy-Weinberg proportions (p^2
+    or 2pq). Alleles without a frequency get none, unless no candidate has
+    one, in which case the candidates are weighted equally.
+
+    :param genotypes: candidate allele tuples
+    :param frequencies: dictionary of allele to frequency
+    :return: dictionary of genotype to weight, summing to 1
+    """
+    weights = {}
+    for genotype in genotypes:
+        if frequencies is None:
+            weight = 1.0
+        else:
+            weight = 1.0
+            for allele in genotype:
+                weight *= frequencies.get(allele, 0.0)
+            if len(genotype) == 2 and genotype[0] != genotype[1]:
+                weight *= 2
+        weights[genotype] = weights.get(genotype, 0.0) + weight
+
+    total = sum(weights.values())
+    if total == 0:
+        return genotype_weights(genotypes)
+    return {genotype: weight / total for genotype, weight in weights.items()}
+
+
+def ambiguous_locus_summary(
+    genie, locus: str, donor_weights: dict, recip_weights: dict, region
+) -> dict:
+    """
+    Summarize the mismatches of every candidate donor and recipient genotype of a locus
+
+    The positions each donor allele shares with each recipient allele are
+    computed once per allele pair, so every genotype combination only costs
+    a few integer operations. Counts follow genotypeMismatches.
+
+    :param genie: GENIE instance
+    :param locus: HLA locus
+    :param donor_weights: dictionary of donor genotype to weight, where a
+        homozygous donor is a single allele and () means the gene is not carried
+    :param recip_weights: dictionary of recipient genotype to weight
+    :param region: ARD, XRD, mature, a defined region or a list of positions
+    :return: dictionary with the min, max and expected count and the number of
+        candidate pairs
+    """
+    region = region_mask(genie, locus, region)
+    donor_alleles = {allele for donor in donor_weights for allele in donor}
+    recip_alleles = {allele for recip in recip_weights for allele in recip}
+    planes = {
+        allele: genie.residues.planes(allele)
+        for allele in donor_alleles | recip_alleles
+    }
+    length_masks = {allele: (1 << length) - 1 for allele, (_, length) in planes.items()}
+
+    # positions where each donor allele shares its residue with each recipient allele
+    matched = {}
+    for donor_allele in donor_alleles:
+        donor_planes = planes[donor_allele][0]
+        for recip_allele in recip_alleles:
+            recip_planes = planes[recip_allele][0]
+            shared = 0
+            for residue, positions in donor_planes.items():
+                shared |= positions & recip_planes.get(residue, 0)
+            matched[donor_allele, recip_allele] = shared
+
+    minimum, maximum, expected = None, None, 0.0
+    polymorphic = region & genie.polymorphism.mask(locus)
+    for recip, recip_weight in recip_weights.items():
+        compared = polymorphic if recip else region
+        for recip_allele in recip:
+            compared &= length_masks[recip_allele]
+
+        # positions each donor allele mismatches against this recipient genotype
+        mismatched = {}
+        for donor_allele in donor_alleles:
+            shared = 0
+            for recip_allele in recip:
+                shared |= matched[donor_allele, recip_allele]
+            mismatched[donor_allele] = compared & length_masks[donor_allele] & ~shared
+        allele_counts = {
+            allele: mask.bit_count() for allele, mask in mismatched.items()
+        }
+
+        for donor, donor_weight in donor_weights.items():
+            if len(donor) == 2 and planes[donor[0]][1] != planes[donor[1]][1]:
+                # a truncated allele limits the positions compared for both
+                both = length_masks[donor[0]] & length_masks[donor[1]]
+                count = sum((mismatched[allele] & both).bit_count() for allele in donor)
+            else:
+                count = sum(allele_counts[allele] for allele in donor)
+
+            if minimum is None or count < minimum:
+                minimum = count
+            if maximum is None or count > maximum:
+                maximum = count
+            expected += count * donor_weight * recip_weight
+
+    return {
+        "min": minimum,
+        "max": maximum,
+        "expected": expected,
+        "candidates": len(donor_weights) * len(recip_weights),
+    }
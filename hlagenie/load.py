@@ -1,134 +1,356 @@
 import sys
 import os
-import tempfile
-import requests
-from Bio import AlignIO
+import json  # for download validators
+import pathlib  # for path manipulation
+import threading  # for the shared download session
+import time  # for the age of the cached latest version
+from concurrent.futures import ThreadPoolExecutor  # for concurrent downloads
 from urllib.error import URLError
+from .configs import config  # for configurations
+from . import metrics  # for build instrumentation
 
+# shared HTTP session so connections are pooled across downloads
+_session = None
+_session_lock = threading.Lock()
 
-def load_sequence_alignment(
-    imgt_version: str, loc: str, imputed: bool, imputation_method: str
-):
-    """Retrieve sequence alignment from the IMGTHLA GitHub repository and store in a Named Temporary File until processed into the database
+# transient server errors worth retrying
+RETRY_STATUSES = (429, 500, 502, 503, 504)
 
-    :param imgt_version: The version of the IMGT/HLA database to use
-    :param loc: The HLA locus to retrieve the sequence alignment for
-    :return: Bio.Align.MultipleSeqAlignment object
+
+def _msf_locus(loc: str) -> str:
+    """
+    Get the name of the MSF file a locus is stored in
+
+    :param loc: The HLA locus
+    :return: The locus name used by the MSF file
     """
     # for DRB3, DRB4, and DRB5, use DRB345 alignment
     if loc in ["DRB3", "DRB4", "DRB5"]:
-        loc = "DRB345"
+        return "DRB345"
+    return loc
+
+
+def alignment_url(
+    imgt_version: str, loc: str, seqtype: str, imputed: bool, imputation_method: str
+) -> str:
+    """
+    Get the URL of an MSF alignment
+
+    :param imgt_version: The version of the IMGT/HLA database to use
+    :param loc: The HLA locus to retrieve the alignment for
+    :param seqtype: The sequence type of the alignment (prot or nuc)
+    :return: URL of the MSF file
+    """
+    loc = _msf_locus(loc)
 
     # if imputed is True, use the imputed sequence alignment
     if imputed:
         # GitHub URL for imputed sequences
-        IMGT_HLA_URL = (
-            "https://raw.githubusercontent.com/gbiagini/hla-imputed-sequences"
+        IMGT_HLA_URL = config["imputed_url"]
+        return (
+            f"{IMGT_HLA_URL}/{imgt_version}/{imputation_method}/msf/{loc}_{seqtype}.msf"
         )
-        msf_p_url = (
-            f"{IMGT_HLA_URL}/{imgt_version}/{imputation_method}/msf/{loc}_prot.msf"
-        )
-    else:
-        # GitHub URL for IMGT/HLA
-        IMGT_HLA_URL = "https://raw.githubusercontent.com/ANHIG/IMGTHLA"
-        msf_p_url = f"{IMGT_HLA_URL}/{imgt_version}/msf/{loc}_prot.msf"
 
-    try:
-        # download the file data from the IMGT_HLA GitHub repository
-        request = requests.get(msf_p_url, timeout=15)
+    # GitHub URL for IMGT/HLA
+    IMGT_HLA_URL = config["imgt_hla_url"]
+    return f"{IMGT_HLA_URL}/{imgt_version}/msf/{loc}_{seqtype}.msf"
 
-        # create a Named Temporary File to store the file data
-        tf = tempfile.NamedTemporaryFile(delete=False)
 
-        # write the file data to the Named Temporary File
-        tf.write(request.content)
+def alignment_path(
+    data_dir,
+    imgt_version: str,
+    loc: str,
+    seqtype: str,
+    imputed: bool,
+    imputation_method: str,
+) -> pathlib.Path:
+    """
+    Get the local path an MSF alignment is cached at
 
-        # read the data into a multiple sequence alignment object
-        multi_seq = AlignIO.read(tf.name, "msf")
+    :param data_dir: The directory where the database is stored
+    :return: path of the cached MSF file
+    """
+    from .misc import get_default_db_directory
 
-        # close the Named Temporary File, deleting it
-        tf.close()
-        os.unlink(tf.name)
+    if data_dir is None:
+        data_dir = get_default_db_directory()
 
-    except URLError as e:
-        print(f"Error downloading {msf_p_url}", e, file=sys.stderr)
-        sys.exit(1)
+    msf_dir = pathlib.Path(data_dir) / "msf" / str(imgt_version)
+    if imputed:
+        msf_dir = msf_dir / f"imputed-{imputation_method}"
 
-    # return the multiple sequence alignment object
-    return multi_seq
+    return msf_dir / f"{_msf_locus(loc)}_{seqtype}.msf"
 
 
-def load_nucleotide_alignment(
-    imgt_version: str, loc: str, imputed: bool, imputation_method: str
-):
-    """Retrieve nucleotide alignment from the IMGTHLA GitHub repository and store in a Named Temporary File until processed into the database
+def get_session():
+    """
+    Get the HTTP session shared by all downloads, with connection pooling
+
+    Retries are left to download_file, which resumes from the partial file
+    instead of starting over.
+
+    :return: requests.Session
+    """
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            # only needed when downloading, so imported here
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            adapter = HTTPAdapter(
+                pool_connections=config["download_workers"],
+                pool_maxsize=config["download_workers"],
+            )
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+
+    return _session
 
+
+def download_file(url: str, path, session=None, labels: dict = None) -> pathlib.Path:
+    """
+    Download a file, revalidating a cached copy and resuming partial downloads
+
+    The ETag and Last-Modified of each download are kept next to the file, so
+    an unchanged file is answered with 304 Not Modified instead of being
+    downloaded again. An interrupted download is kept as a .part file, with
+    the validators it was started with in a .part.meta file, and resumed with
+    a Range request. The validators of the file only replace the old ones once
+    the file itself is replaced. Connection errors and transient server
+    errors are retried with exponential backoff, other non-2xx responses
+    raise requests.HTTPError.
+
+    :param url: URL to download
+    :param path: local path to store the file at
+    :param session: requests.Session to use, the shared session if None
+    :param labels: metric labels for the download, such as locus and kind
+    :return: path of the downloaded file
+    """
+    import requests
+
+    if session is None:
+        session = get_session()
+    if labels is None:
+        labels = {}
+
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    part_path = path.with_name(path.name + ".part")
+    meta_path = path.with_name(path.name + ".meta")
+    part_meta_path = path.with_name(path.name + ".part.meta")
+
+    for attempt in range(config["download_retries"] + 1):
+        if attempt:
+            time.sleep(config["download_backoff"] * 2 ** (attempt - 1))
+
+        headers = {}
+        part_meta = {}
+        if part_path.exists() and part_meta_path.exists():
+            part_meta = json.loads(part_meta_path.read_text())
+        if part_meta.get("etag"):
+            # resume the partial download if the file has not changed since
+            headers["Range"] = f"bytes={part_path.stat().st_size}-"
+            headers["If-Range"] = part_meta["etag"]
+            headers["Accept-Encoding"] = "identity"
+        elif path.exists() and meta_path.exists():
+            # ask the server to only send the file if it changed
+            meta = json.loads(meta_path.read_text())
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            with metrics.timer("download_seconds", **labels):
+                with session.get(
+                    url,
+                    headers=headers,
+                    stream=True,
+                    timeout=config["download_timeout"],
+                ) as response:
+                    if response.status_code == 304:
+                        return path
+                    if response.status_code == 416:
+                        # the partial file cannot be resumed, start over
+                        part_path.unlink()
+                        continue
+                    if (
+                        response.status_code in RETRY_STATUSES
+                        and attempt < config["download_retries"]
+                    ):
+                        continue
+                    response.raise_for_status()
+
+                    # a full response replaces any partial download
+                    mode = "ab" if response.status_code == 206 else "wb"
+                    if response.status_code != 206:
+                        part_meta = {
+                            "etag": response.headers.get("ETag"),
+                            "last_modified": response.headers.get("Last-Modified"),
+                        }
+                        part_meta_path.write_text(json.dumps(part_meta))
+
+                    with open(part_path, mode) as f:
+                        for chunk in response.iter_content(chunk_size=1 << 16):
+                            f.write(chunk)
+                            metrics.inc("download_bytes", len(chunk), **labels)
+        except (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        ):
+            # keep the partial file and resume from it on the next attempt
+            if attempt == config["download_retries"]:
+                raise
+            continue
+
+        os.replace(part_path, path)
+        os.replace(part_meta_path, meta_path)
+        return path
+
+    raise RuntimeError(f"Could not download {url}")
+
+
+def submit_alignment_downloads(
+    executor,
+    imgt_version: str,
+    loci: list[str],
+    seqtype: str,
+    imputed: bool,
+    imputation_method: str,
+    data_dir=None,
+) -> dict:
+    """
+    Start downloading the MSF alignments for many loci without waiting for them
+
+    :param executor: concurrent.futures executor to download with
     :param imgt_version: The version of the IMGT/HLA database to use
-    :param loc: The HLA locus to retrieve the sequence alignment for
-    :return: Bio.Align.MultipleSeqAlignment object
+    :param loci: The HLA loci to retrieve alignments for
+    :param seqtype: The sequence type of the alignments (prot or nuc)
+    :param data_dir: The directory where the database is stored
+    :return: dictionary of locus to (url, future of the local path of its MSF file)
     """
+    # DRB3, DRB4 and DRB5 share a file, so only fetch it once
+    futures = {}
+    downloads = {}
+    for loc in loci:
+        url = alignment_url(imgt_version, loc, seqtype, imputed, imputation_method)
+        if url not in futures:
+            path = alignment_path(
+                data_dir, imgt_version, loc, seqtype, imputed, imputation_method
+            )
+            labels = {"locus": _msf_locus(loc), "kind": seqtype}
+            futures[url] = executor.submit(download_file, url, path, labels=labels)
+        downloads[loc] = (url, futures[url])
 
-    # for DRB3, DRB4, and DRB5, use DRB345 alignment
-    if loc in ["DRB3", "DRB4", "DRB5"]:
-        loc = "DRB345"
+    return downloads
 
-    # if imputed is True, use the imputed sequence alignment
-    if imputed:
-        # GitHub URL for imputed sequences
-        IMGT_HLA_URL = (
-            "https://raw.githubusercontent.com/gbiagini/hla-imputed-sequences"
-        )
-        msf_n_url = (
-            f"{IMGT_HLA_URL}/{imgt_version}/{imputation_method}/msf/{loc}_nuc.msf"
+
+def download_alignments(
+    imgt_version: str,
+    loci: list[str],
+    seqtype: str,
+    imputed: bool,
+    imputation_method: str,
+    data_dir=None,
+) -> dict:
+    """
+    Download the MSF alignments for many loci concurrently
+
+    :param imgt_version: The version of the IMGT/HLA database to use
+    :param loci: The HLA loci to retrieve alignments for
+    :param seqtype: The sequence type of the alignments (prot or nuc)
+    :param data_dir: The directory where the database is stored
+    :return: dictionary of locus to local path of its MSF file
+    """
+    with ThreadPoolExecutor(max_workers=config["download_workers"]) as executor:
+        downloads = submit_alignment_downloads(
+            executor, imgt_version, loci, seqtype, imputed, imputation_method, data_dir
         )
-    else:
-        # GitHub URL for IMGT/HLA
-        IMGT_HLA_URL = "https://raw.githubusercontent.com/ANHIG/IMGTHLA"
-        msf_n_url = f"{IMGT_HLA_URL}/{imgt_version}/msf/{loc}_nuc.msf"
+        paths = {}
+        for loc, (url, future) in downloads.items():
+            try:
+                paths[loc] = future.result()
+            except Exception as e:
+                print(f"Error downloading {url}", e, file=sys.stderr)
+                sys.exit(1)
 
-    try:
-        # download the file data from the IMGT_HLA GitHub repository
-        request = requests.get(msf_n_url, timeout=15)
+    return paths
 
-        # create a Named Temporary File to store the file data
-        tf = tempfile.NamedTemporaryFile(delete=False)
 
-        # write the file data to the Named Temporary File
-        tf.write(request.content)
+def read_alignment(path, loc: str, seqtype: str):
+    """
+    Parse a downloaded MSF alignment
 
-        # read the data into a multiple sequence alignment object
-        multi_seq = AlignIO.read(tf.name, "msf")
+    :param path: local path of the MSF file
+    :param loc: The HLA locus of the alignment
+    :param seqtype: The sequence type of the alignment (prot or nuc)
+    :return: Bio.Align.MultipleSeqAlignment object
+    """
+    # only needed when building, so imported here to keep `import hlagenie` fast
+    from Bio import AlignIO
 
-        # close the Named Temporary File, deleting it
-        tf.close()
-        os.unlink(tf.name)
+    with metrics.timer("parse_seconds", locus=_msf_locus(loc), kind=seqtype):
+        return AlignIO.read(str(path), "msf")
 
-    except URLError as e:
-        print(f"Error downloading {msf_n_url}", e, file=sys.stderr)
-        sys.exit(1)
 
-    # return the multiple sequence alignment object
-    return multi_seq
+def load_sequence_alignment(
+    imgt_version: str,
+    loc: str,
+    imputed: bool,
+    imputation_method: str,
+    data_dir=None,
+):
+    """Retrieve sequence alignment from the IMGTHLA GitHub repository, caching the file in the data directory
 
+    :param imgt_version: The version of the IMGT/HLA database to use
+    :param loc: The HLA locus to retrieve the sequence alignment for
+    :return: Bio.Align.MultipleSeqAlignment object
+    """
+    paths = download_alignments(
+        imgt_version, [loc], "prot", imputed, imputation_method, data_dir
+    )
+    return read_alignment(paths[loc], loc, "prot")
 
-def load_latest_version():
-    """From py-ard. Get latest version of the IMGT/HLA database
 
-    :return: latest version of the IMGT/HLA database
-    :rtype: str
+def load_nucleotide_alignment(
+    imgt_version: str,
+    loc: str,
+    imputed: bool,
+    imputation_method: str,
+    data_dir=None,
+):
+    """Retrieve nucleotide alignment from the IMGTHLA GitHub repository, caching the file in the data directory
+
+    :param imgt_version: The version of the IMGT/HLA database to use
+    :param loc: The HLA locus to retrieve the sequence alignment for
+    :return: Bio.Align.MultipleSeqAlignment object
+    """
+    paths = download_alignments(
+        imgt_version, [loc], "nuc", imputed, imputation_method, data_dir
+    )
+    return read_alignment(paths[loc], loc, "nuc")
+
+
+def _fetch_latest_version():
+    """
+    Ask the IMGTHLA repository for the version of its Latest branch
+
+    :return: latest version of the IMGT/HLA database, or None if it could not be read
     """
     from urllib.request import urlopen
 
-    version_txt = (
-        "https://raw.githubusercontent.com/ANHIG/IMGTHLA/Latest/release_version.txt"
-    )
+    version_txt = f"{config['imgt_hla_url']}/Latest/release_version.txt"
     try:
-        response = urlopen(version_txt, timeout=15)
-    except URLError as e:
+        response = urlopen(version_txt, timeout=config["download_timeout"])
+    except (URLError, OSError) as e:
         print(f"Error downloading {version_txt}", e, file=sys.stderr)
-        sys.exit(1)
+        return None
 
-    version = 0
+    version = None
     for line in response:
         l = line.decode("utf-8")
         if l.find("version:") != -1:
@@ -136,3 +358,79 @@ def load_latest_version():
             # # version: IPD-IMGT/HLA 3.51.0
             version = l.split()[-1].replace(".", "")
     return version
+
+
+def newest_local_version(data_dir=None):
+    """
+    Get the newest IMGT/HLA version with a database built in the data directory
+
+    :param data_dir: The directory where the database is stored
+    :return: newest built version, or None if nothing has been built
+    """
+    from .misc import get_default_db_directory
+
+    if data_dir is None:
+        data_dir = get_default_db_directory()
+
+    versions = []
+    for db_path in pathlib.Path(data_dir).glob("hlagenie-*.db"):
+        # names look like hlagenie-3510.db or hlagenie-3510-imputed-nearest.db
+        version = db_path.stem.split("-")[1]
+        if version.isdigit():
+            versions.append(version)
+
+    return max(versions, key=int, default=None)
+
+
+def _write_latest_version(cache_path: pathlib.Path, version: str):
+    # write to a temporary file first so readers never see a partial version
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}")
+    tmp_path.write_text(version)
+    os.replace(tmp_path, cache_path)
+
+
+def load_latest_version(data_dir=None, ttl: float = None):
+    """From py-ard. Get latest version of the IMGT/HLA database
+
+    The resolved version is cached in the data directory for ttl seconds, so
+    routine startups do not touch the network. When GitHub cannot be reached,
+    the last cached version is used, then the newest database already built.
+    The fallback is cached for ttl seconds as well, so an offline machine
+    only waits on GitHub once per ttl.
+
+    :param data_dir: The directory where the database is stored
+    :param ttl: seconds the cached version is trusted, latest_version_ttl if None
+    :return: latest version of the IMGT/HLA database
+    :rtype: str
+    """
+    from .misc import get_default_db_directory
+
+    if data_dir is None:
+        data_dir = get_default_db_directory()
+    if ttl is None:
+        ttl = config["latest_version_ttl"]
+
+    cache_path = pathlib.Path(data_dir) / "latest_version.txt"
+    cached = None
+    if cache_path.exists():
+        cached = cache_path.read_text().strip() or None
+        age = time.time() - cache_path.stat().st_mtime
+        if cached and age < ttl:
+            return cached
+
+    version = _fetch_latest_version()
+    if version:
+        _write_latest_version(cache_path, version)
+        return version
+
+    # offline, so fall back to what is already known locally
+    version = cached or newest_local_version(data_dir)
+    if version:
+        print(f"Using IMGT/HLA version {version} found locally", file=sys.stderr)
+        # restart the ttl so the next startups do not wait on GitHub again
+        _write_latest_version(cache_path, version)
+        return version
+
+    print("Could not determine the latest IMGT/HLA version", file=sys.stderr)
+    sys.exit(1)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+# metrics.py - instrumentation hooks and metrics for builds and queries
+
+import functools  # for wrapping instrumented functions
+import threading  # for guarding updates from multiple threads
+import time  # for timing
+from contextlib import contextmanager  # for the timer context manager
+
+# upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (
+    0.000001,
+    0.000005,
+    0.00001,
+    0.00005,
+    0.0001,
+    0.0005,
+    0.001,
+    0.01,
+    0.1,
+    1.0,
+    10.0,
+    60.0,
+)
+
+# prefix of every exported metric name
+PREFIX = "hlagenie"
+
+# metrics are only recorded once enabled, so queries pay nothing by default
+_enabled = False
+_hooks = []
+_lock = threading.Lock()
+
+# (name, labels) -> value
+_counters = {}
+# (name, labels) -> [per-bucket counts..., sum, count]
+_histograms = {}
+
+
+def enable():
+    """Start recording metrics and calling hooks"""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Stop recording metrics and calling hooks"""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    """
+    Are metrics being recorded?
+
+    :return: True if metrics are enabled
+    """
+    return _enabled
+
+
+def add_hook(callback):
+    """
+    Register a callback for every recorded metric
+
+    The callback is called as callback(name, value, labels) where value is
+    the counter increment or the observed duration in seconds.
+
+    :param callback: function to call
+    """
+    _hooks.append(callback)
+
+
+def remove_hook(callback):
+    """
+    Unregister a callback added with add_hook
+
+    :param callback: function to remove
+    """
+    _hooks.remove(callback)
+
+
+def reset():
+    """Clear all recorded metrics"""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def inc(name: str, value: float = 1, **labels):
+    """
+    Increment a counter
+
+    :param name: name of the counter
+    :param value: amount to add
+    :param labels: labels of the counter, such as locus or method
+    """
+    if not _enabled:
+        return
+
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+    for callback in _hooks:
+        callback(name, value, labels)
+
+
+def observe(name: str, seconds: float, **labels):
+    """
+    Record a duration in a histogram
+
+    :param name: name of the histogram
+    :param seconds: observed duration
+    :param labels: labels of the histogram, such as locus or method
+    """
+    if not _enabled:
+        return
+
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+                break
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+    for callback in _hooks:
+        callback(name, seconds, labels)
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """
+    Time a block of code into a histogram
+
+    :param name: name of the histogram
+    :param labels: labels of the histogram
+    """
+    if not _enabled:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(func):
+    """
+    Decorator recording the call count and latency of a GENIE method
+    """
+    method = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            observe("call_seconds", time.perf_counter() - start, method=method)
+
+    return wrapper
+
+
+def snapshot() -> dict:
+    """
+    Get the current value of every metric
+
+    :return: dictionary with "counters" and "histograms", keyed by (name, labels)
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {
+            key: {
+                "buckets": dict(zip(BUCKETS, values[:-2])),
+                "sum": values[-2],
+                "count": values[-1],
+            }
+            for key, values in _histograms.items()
+        }
+    return {"counters": counters, "histograms": histograms}
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{k}="{v}"' for k, v in labels)
+    return "{" + pairs + "}"
+
+
+def to_prometheus() -> str:
+    """
+    Export all metrics in the Prometheus text exposition format
+
+    :return: metrics as text
+    """
+    current = snapshot()
+    lines = []
+
+    # group series by metric name so each name gets a single TYPE line
+    counter_names = sorted({name for name, _ in current["counters"]})
+    for name in counter_names:
+        metric = f"{PREFIX}_{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        for (n, labels), value in sorted(current["counters"].items()):
+            if n == name:
+                lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+    histogram_names = sorted({name for name, _ in current["histograms"]})
+    for name in histogram_names:
+        metric = f"{PREFIX}_{name}"
+        lines.append(f"# TYPE {metric} histogram")
+        for (n, labels), histogram in sorted(current["histograms"].items()):
+            if n != name:
+                continue
+            cumulative = 0
+            for bound, count in histogram["buckets"].items():
+                cumulative += count
+                bucket_labels = labels + (("le", repr(bound)),)
+                lines.append(
+                    f"{metric}_bucket{_format_labels(bucket_labels)} {cumulative}"
+                )
+            inf_labels = labels + (("le", "+Inf"),)
+            lines.append(
+                f"{metric}_bucket{_format_labels(inf_labels)} {histogram['count']}"
+            )
+            lines.append(f"{metric}_sum{_format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {histogram['count']}")
+
+    return "\n".join(lines) + "\n"
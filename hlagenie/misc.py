@@ -6,13 +6,13 @@ from .load import load_latest_version  # to get latest IMGTHLA database version
 
 
 # manipulate input of imgt_version
-def get_imgt_version(imgt_version):
+def get_imgt_version(imgt_version, data_dir=None):
     if imgt_version:
         version = imgt_version.replace(".", "")
         if version.isdigit():
             return version
     # if no version specified, use latest
-    return load_latest_version()
+    return load_latest_version(data_dir)
 
 
 # define directory to store IMGT database
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+# ondemand.py - sequence tables queried from SQLite instead of held in memory
+
+import threading  # for guarding the cache between threads
+from collections import OrderedDict  # for the least recently used cache
+from collections.abc import Mapping  # for database-backed sequence dictionaries
+
+# constant statements, so sqlite3 prepares each once per connection and reuses it
+_SEQ = "SELECT seq FROM sequences WHERE kind = ? AND locus = ? AND allele = ?"
+_SUBSTR = (
+    "SELECT substr(seq, ?, ?) FROM sequences"
+    " WHERE kind = ? AND locus = ? AND allele = ?"
+)
+_ALLELES = "SELECT allele FROM sequences WHERE kind = ?"
+_COUNT = "SELECT count(*) FROM sequences WHERE kind = ?"
+
+
+class SQLiteSeqs(Mapping):
+    """
+    Read-only dictionary of allele to sequence looked up in the database
+
+    Each lookup is a primary key query, and the most recently used
+    sequences are kept in a bounded cache, so memory does not grow with the
+    size of the database. Single positions and peptides are served from the
+    cache when their sequence is in it. Otherwise the first lookup of an
+    allele is cut out in SQL with substr, and a second lookup while the
+    allele is still remembered loads the whole sequence into the cache, so
+    one-off lookups do not evict the sequences in repeated use.
+    """
+
+    def __init__(self, reader, kind: str, cache_size: int):
+        """
+        :param reader: function returning a context manager that lends a
+            database connection, such as GENIE._reader
+        :param kind: kind of sequences, such as ungapped_mature
+        :param cache_size: number of sequences kept in the cache
+        """
+        self._reader = reader
+        self.kind = kind
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        # alleles recently looked up with substr, cached if looked up again
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _query(self, statement: str, *args):
+        with self._reader() as reader:
+            return reader.execute(statement, args).fetchone()
+
+    def _cached(self, allele: str):
+        with self._lock:
+            seq = self._cache.get(allele)
+            if seq is not None:
+                self._cache.move_to_end(allele)
+            return seq
+
+    def _seen_before(self, allele: str) -> bool:
+        with self._lock:
+            if allele in self._seen:
+                del self._seen[allele]
+                return True
+            self._seen[allele] = None
+            if len(self._seen) > self.cache_size:
+                self._seen.popitem(last=False)
+            return False
+
+    def __getitem__(self, allele: str) -> str:
+        seq = self._cached(allele)
+        if seq is not None:
+            return seq
+
+        row = self._query(_SEQ, self.kind, allele.split("*")[0], allele)
+        if row is None:
+            raise KeyError(allele)
+        with self._lock:
+            self._cache[allele] = row[0]
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return row[0]
+
+    def peptide(self, allele: str, start: int, stop: int) -> str:
+        """
+        Get the residues from one position to another, like seq[start - 1 : stop]
+
+        :param allele: two-field allele
+        :param start: first position
+        :param stop: last position
+        :return: residues from start to stop
+        """
+        seq = self._cached(allele)
+        if seq is not None:
+            return seq[start - 1 : stop]
+        # substr counts from the end for negative arguments, unlike slices
+        if start < 1 or stop < start or self._seen_before(allele):
+            return self[allele][start - 1 : stop]
+
+        row = self._query(
+            _SUBSTR, start, stop - start + 1, self.kind, allele.split("*")[0], allele
+        )
+        if row is None:
+            raise KeyError(allele)
+        return row[0]
+
+    def residue(self, allele: str, position: int) -> str:
+        """
+        Get the residue at a position, like seq[position - 1]
+
+        :param allele: two-field allele
+        :param position: position
+        :return: residue at the position
+        """
+        if position < 1:
+            return self[allele][position - 1]
+        residue = self.peptide(allele, position, position)
+        if not residue:
+            raise IndexError(f"{allele} has no position {position}")
+        return residue
+
+    def __contains__(self, allele) -> bool:
+        if not isinstance(allele, str):
+            return False
+        if self._cached(allele) is not None:
+            return True
+        row = self._query(_SUBSTR, 1, 0, self.kind, allele.split("*")[0], allele)
+        return row is not None
+
+    def __iter__(self):
+        with self._reader() as reader:
+            alleles = [allele for (allele,) in reader.execute(_ALLELES, (self.kind,))]
+        return iter(alleles)
+
+    def __len__(self) -> int:
+        return self._query(_COUNT, self.kind)[0]
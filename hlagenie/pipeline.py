@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+# pipeline.py - pipelined download, parse and write of per-locus tables
+
+import sys
+import queue  # for the bounded hand-off between stages
+import threading  # for the parse stage worker
+from concurrent.futures import ThreadPoolExecutor  # for concurrent downloads
+from .configs import config  # for configurations
+from . import db  # for writing tables
+from . import metrics  # for build instrumentation
+from .load import submit_alignment_downloads, read_alignment
+
+# marks the end of the parsed tables
+_DONE = object()
+
+
+class _StageError:
+    """Failure of the download or parse stage, handed to the write stage to re-raise"""
+
+    def __init__(self, stage: str, url: str, error: Exception):
+        self.stage = stage
+        self.url = url
+        self.error = error
+
+
+def build_locus_tables(
+    db_conn,
+    imgt_version: str,
+    seqtype: str,
+    imputed: bool,
+    imputation_method: str,
+    kind: str,
+    process,
+    data_dir=None,
+) -> dict:
+    """
+    Build the sequences of every locus from the MSF alignments in three overlapping stages
+
+    Downloads run in a thread pool, a worker thread parses each alignment and
+    turns it into a dictionary of sequences with process, and the calling
+    thread writes the sequences to SQLite as they arrive. The hand-off between
+    parsing and writing is a bounded queue, so at most pipeline_depth parsed
+    loci are held in memory while the writer catches up.
+
+    :param db_conn: The database connection object
+    :param imgt_version: The version of the IMGT/HLA database to use
+    :param seqtype: The sequence type of the alignments (prot or nuc)
+    :param kind: kind of the sequences, stored with each of them
+    :param process: function of (locus, alignment) returning {allele: seq}
+    :param data_dir: directory where downloaded alignments are cached
+    :return: dictionary of sequences of all loci
+    """
+    loci = config["loci"]
+    parsed = queue.Queue(maxsize=config["pipeline_depth"])
+    stop = threading.Event()
+
+    def put(item):
+        # give up if the writer has stopped, rather than block on a full queue
+        while not stop.is_set():
+            try:
+                parsed.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def parse_stage(downloads):
+        # DRB3, DRB4 and DRB5 share a file, so keep the last alignment to reuse it
+        last_path, multi_seq = None, None
+        url = None
+        try:
+            for locus in loci:
+                url, future = downloads[locus]
+                try:
+                    path = future.result()
+                except Exception as e:
+                    put(_StageError("download", url, e))
+                    return
+                if path != last_path:
+                    multi_seq = read_alignment(path, locus, seqtype)
+                    last_path = path
+                with metrics.timer("process_seconds", locus=locus, kind=seqtype):
+                    loc_seqs = process(locus, multi_seq)
+                put((locus, loc_seqs))
+        except Exception as e:
+            put(_StageError("parse", url, e))
+            return
+        put(_DONE)
+
+    seqs = {}
+    with ThreadPoolExecutor(max_workers=config["download_workers"]) as executor:
+        downloads = submit_alignment_downloads(
+            executor,
+            imgt_version,
+            loci,
+            seqtype,
+            imputed,
+            imputation_method,
+            data_dir,
+        )
+        worker = threading.Thread(target=parse_stage, args=(downloads,), daemon=True)
+        worker.start()
+
+        try:
+            while True:
+                item = parsed.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, _StageError):
+                    if item.stage == "download":
+                        print(
+                            f"Error downloading {item.url}", item.error, file=sys.stderr
+                        )
+                        sys.exit(1)
+                    raise item.error
+
+                # SQLite connections belong to the thread that opened them
+                locus, loc_seqs = item
+                db.save_sequences(db_conn, kind, locus, loc_seqs)
+                seqs.update(loc_seqs)
+        finally:
+            stop.set()
+            for _, future in downloads.values():
+                future.cancel()
+            worker.join()
+
+    return seqs
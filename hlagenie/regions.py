@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+# regions.py - named sets of mature protein positions per locus
+
+import operator  # for gathering many positions in one call
+from .configs import config  # for configurations
+from .residues import positions_mask  # for region comparisons
+
+# regions every locus has, ending at the ARD end, the XRD end or the sequence end
+BUILTIN_REGIONS = ("ARD", "XRD", "mature")
+
+
+class Region:
+    """
+    A set of mature positions of one locus, compiled for lookups
+
+    Positions are kept sorted and compiled into an itemgetter gathering all
+    of them from a sequence in a single call, and a bitmask for comparing
+    residue bitplanes. A region starting at position 1 without holes is
+    gathered with a slice instead.
+    """
+
+    def __init__(self, name: str, locus: str, positions=None):
+        """
+        :param name: name of the region
+        :param locus: HLA locus
+        :param positions: 1-based positions, None for the whole mature sequence
+        """
+        self.name = name
+        self.locus = locus
+
+        if positions is None:
+            self.positions = None
+            self.mask = -1
+            self._stop = None
+            self._getter = None
+            return
+
+        positions = tuple(sorted(set(positions)))
+        if not positions or positions[0] < 1:
+            raise ValueError(f"Region {name} needs positions of 1 or more")
+        self.positions = positions
+        self.mask = positions_mask(positions)
+
+        if positions[-1] == len(positions):
+            self._stop = len(positions)
+            self._getter = None
+        else:
+            self._stop = None
+            self._getter = operator.itemgetter(
+                *(position - 1 for position in positions)
+            )
+
+    def gather(self, seq: str) -> str:
+        """
+        Get the residues of the region from a sequence
+
+        :param seq: mature sequence
+        :return: residues at the positions of the region
+        """
+        if self._getter is None:
+            return seq[: self._stop]
+        # itemgetter of a single index returns the residue rather than a tuple
+        return "".join(self._getter(seq))
+
+    def indices(self, length: int):
+        """
+        Get the 0-based indices of the region within a sequence length
+
+        :param length: length of the shortest compared sequence
+        :return: range or tuple of indices
+        """
+        if self.positions is None:
+            return range(length)
+        if self._stop is not None:
+            return range(min(self._stop, length))
+        return tuple(position - 1 for position in self.positions if position <= length)
+
+    def __repr__(self) -> str:
+        return f"Region({self.name!r}, {self.locus!r})"
+
+
+class RegionRegistry:
+    """
+    Built-in and user-defined regions of a GENIE instance, compiled on first use
+    """
+
+    def __init__(self, ards: dict, xrds: dict, user_regions: dict = None):
+        """
+        :param ards: dictionary of locus to last ARD position
+        :param xrds: dictionary of locus to last XRD position
+        :param user_regions: dictionary of (name, locus) to list of positions
+        """
+        self.ards = ards
+        self.xrds = xrds
+        self.user_regions = dict(user_regions or {})
+        self._compiled = {}
+
+    def define(self, name: str, positions) -> dict:
+        """
+        Add or replace a user-defined region
+
+        :param name: name of the region, which cannot be a built-in one
+        :param positions: list of positions used for every locus, or a
+            dictionary of locus to list of positions
+        :return: dictionary of (name, locus) to list of positions added
+        """
+        if name in BUILTIN_REGIONS:
+            raise ValueError(f"{name} is a built-in region")
+        if not isinstance(positions, dict):
+            positions = {locus: positions for locus in config["loci"]}
+
+        added = {}
+        for locus, locus_positions in positions.items():
+            if locus not in config["loci"]:
+                raise ValueError(f"Unknown locus {locus}")
+            # compile now so invalid positions fail before anything is saved
+            region = Region(name, locus, locus_positions)
+            added[name, locus] = list(region.positions)
+
+        self.user_regions.update(added)
+        for key in added:
+            self._compiled.pop(key, None)
+        return added
+
+    def names(self, locus: str = None) -> list[str]:
+        """
+        List the regions available
+
+        :param locus: HLA locus, None for the regions of any locus
+        :return: list of region names, built-in ones first
+        """
+        names = list(BUILTIN_REGIONS)
+        for name, region_locus in self.user_regions:
+            if (locus is None or region_locus == locus) and name not in names:
+                names.append(name)
+        return names
+
+    def get(self, locus: str, region) -> Region:
+        """
+        Get a compiled region
+
+        :param locus: HLA locus
+        :param region: name of a region or a list of positions
+        :return: compiled region
+        """
+        if not isinstance(region, str):
+            return Region("custom", locus, region)
+
+        try:
+            return self._compiled[region, locus]
+        except KeyError:
+            pass
+
+        if region == "ARD":
+            compiled = Region(region, locus, range(1, self.ards[locus] + 1))
+        elif region == "XRD":
+            compiled = Region(region, locus, range(1, self.xrds[locus] + 1))
+        elif region == "mature":
+            compiled = Region(region, locus)
+        elif (region, locus) in self.user_regions:
+            compiled = Region(region, locus, self.user_regions[region, locus])
+        else:
+            raise ValueError(
+                f"Invalid region {region} for {locus}, must be one of "
+                f"{self.names(locus)} or a list of positions"
+            )
+        self._compiled[region, locus] = compiled
+        return compiled
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+# residues.py - residue bitplanes for comparing many positions at once
+
+import itertools  # for walking the columns of many sequences
+from collections import Counter  # for residue counts
+from .configs import config  # for configurations
+
+# translation tables turning a sequence into a bit string for one residue
+_TABLES = {}
+
+
+def _table(residue: str) -> bytes:
+    """
+    Get the table translating a residue to "1" and everything else to "0"
+
+    :param residue: residue character
+    :return: table for bytes.translate
+    """
+    try:
+        return _TABLES[residue]
+    except KeyError:
+        table = bytearray(b"0" * 256)
+        table[ord(residue)] = ord("1")
+        _TABLES[residue] = bytes(table)
+        return _TABLES[residue]
+
+
+def bitplanes(seq: str) -> dict:
+    """
+    Split a sequence into one bitmask per residue
+
+    Bit i of the mask of a residue is set when the residue is at position
+    i + 1, so comparing whole regions of two sequences takes a handful of
+    integer operations instead of a loop over positions.
+
+    :param seq: sequence to split
+    :return: dictionary of residue to bitmask of its positions
+    """
+    # reverse so position 1 is the lowest bit
+    encoded = seq.encode("ascii")[::-1]
+    return {residue: int(encoded.translate(_table(residue)), 2) for residue in set(seq)}
+
+
+def positions_mask(positions) -> int:
+    """
+    Get the bitmask of a list of positions
+
+    :param positions: 1-based positions
+    :return: bitmask with the bit of each position set
+    """
+    mask = 0
+    for position in positions:
+        mask |= 1 << (position - 1)
+    return mask
+
+
+def mask_to_bools(mask: int, positions) -> list[bool]:
+    """
+    Get whether each of a list of positions is set in a bitmask
+
+    :param mask: bitmask
+    :param positions: 1-based positions
+    :return: list of booleans aligned with positions
+    """
+    return [bool((mask >> (position - 1)) & 1) for position in positions]
+
+
+def mask_positions(mask: int) -> list[int]:
+    """
+    Get the positions set in a bitmask
+
+    :param mask: bitmask
+    :return: sorted list of 1-based positions
+    """
+    positions = []
+    while mask:
+        low = mask & -mask
+        positions.append(low.bit_length())
+        mask ^= low
+    return positions
+
+
+class ResidueIndex:
+    """
+    Bitplanes of the mature sequences of a GENIE instance, built per allele on first use
+    """
+
+    def __init__(self, seqs, stored=None):
+        """
+        :param seqs: dictionary of allele to mature sequence
+        :param stored: dictionary of allele to bitplanes and length computed
+            beforehand, such as the planes of a shared store, or None
+        """
+        self.seqs = seqs
+        self.stored = stored
+        self._planes = {}
+
+    def planes(self, allele: str) -> tuple[dict, int]:
+        """
+        Get the bitplanes of an allele
+
+        :param allele: two-field allele
+        :return: bitplanes and length of the sequence
+        """
+        try:
+            return self._planes[allele]
+        except KeyError:
+            if self.stored is not None and allele in self.stored:
+                self._planes[allele] = self.stored[allele]
+            else:
+                seq = self.seqs[allele]
+                self._planes[allele] = (bitplanes(seq), len(seq))
+            return self._planes[allele]
+
+    def mismatch_masks(
+        self, donor: list[str], recip: list[str], region_mask: int
+    ) -> list[int]:
+        """
+        Get the positions where each donor allele carries a residue absent in the recipient
+
+        Follows countAAMismatchesAllele: the caller passes a homozygous
+        donor once, and only positions covered by every allele are compared.
+
+        :param donor: distinct donor alleles
+        :param recip: recipient alleles, empty if the recipient lacks the gene
+        :param region_mask: bitmask of the positions to compare
+        :return: bitmask of mismatched positions for each donor allele
+        """
+        donor_planes = [self.planes(allele) for allele in donor]
+        recip_planes = [self.planes(allele) for allele in recip]
+
+        # only compare positions present in every sequence
+        length = min(length for _, length in donor_planes + recip_planes)
+        compared = region_mask & ((1 << length) - 1)
+
+        masks = []
+        for planes, _ in donor_planes:
+            matched = 0
+            for residue, positions in planes.items():
+                for recip_allele_planes, _ in recip_planes:
+                    matched |= positions & recip_allele_planes.get(residue, 0)
+            masks.append(compared & ~matched)
+        return masks
+
+    def directional_masks(self, donor: list[str], recip: list[str], region_mask: int):
+        """
+        Get the host-versus-graft and graft-versus-host mismatches of a pair in one pass
+
+        The positions shared by every donor and recipient allele pair are
+        computed once and used for both directions: host-versus-graft
+        positions are where a donor residue is absent in the recipient, and
+        graft-versus-host positions are where a recipient residue is absent
+        in the donor.
+
+        :param donor: distinct donor alleles
+        :param recip: distinct recipient alleles
+        :param region_mask: bitmask of the positions to compare
+        :return: (HvG bitmask, GvH bitmask, HvG count, GvH count), where the
+            counts add up the mismatched positions of each distinct allele
+        """
+        donor_planes = [self.planes(allele) for allele in donor]
+        recip_planes = [self.planes(allele) for allele in recip]
+
+        # only compare positions present in every sequence
+        length = min(length for _, length in donor_planes + recip_planes)
+        compared = region_mask & ((1 << length) - 1)
+
+        shared = [[0] * len(recip_planes) for _ in donor_planes]
+        for i, (planes, _) in enumerate(donor_planes):
+            for j, (other, _) in enumerate(recip_planes):
+                for residue, positions in planes.items():
+                    shared[i][j] |= positions & other.get(residue, 0)
+
+        hvg_masks = []
+        for row in shared:
+            matched = 0
+            for positions in row:
+                matched |= positions
+            hvg_masks.append(compared & ~matched)
+
+        gvh_masks = []
+        for j in range(len(recip_planes)):
+            matched = 0
+            for row in shared:
+                matched |= row[j]
+            gvh_masks.append(compared & ~matched)
+
+        hvg = gvh = 0
+        for mask in hvg_masks:
+            hvg |= mask
+        for mask in gvh_masks:
+            gvh |= mask
+
+        return (
+            hvg,
+            gvh,
+            sum(mask.bit_count() for mask in hvg_masks),
+            sum(mask.bit_count() for mask in gvh_masks),
+        )
+
+
+def residue_counts(seqs) -> dict:
+    """
+    Count the residues at each polymorphic position of the sequences of one locus
+
+    A position is polymorphic when the sequences covering it do not all
+    carry the same character there. Gaps and unknown residues count as
+    characters, as they do when sequences are compared.
+
+    :param seqs: mature sequences of one locus
+    :return: dictionary of 1-based position to dictionary of residue to count
+    """
+    counts = {}
+    for position, column in enumerate(itertools.zip_longest(*seqs), 1):
+        column_counts = Counter(column)
+        # sequences ending before the position do not cover it
+        column_counts.pop(None, None)
+        if len(column_counts) > 1:
+            counts[position] = dict(sorted(column_counts.items()))
+    return counts
+
+
+class PolymorphismIndex:
+    """
+    Polymorphic positions of each locus, with the residue counts at each
+
+    Positions outside the index carry the same residue in every allele of
+    their locus, so two alleles covering them never mismatch there.
+    """
+
+    def __init__(self, counts: dict):
+        """
+        :param counts: dictionary of locus to dictionary of position to
+            dictionary of residue to count, as returned by residue_counts
+        """
+        self.counts = counts
+        self._masks = {}
+
+    @classmethod
+    def from_seqs(cls, seqs):
+        """
+        Build the index from mature sequences
+
+        :param seqs: dictionary of allele to mature sequence
+        :return: index of every locus
+        """
+        loci = {locus: [] for locus in config["loci"]}
+        for allele, seq in seqs.items():
+            locus = allele.split("*")[0]
+            if locus in loci:
+                loci[locus].append(seq)
+        return cls({locus: residue_counts(loci[locus]) for locus in loci})
+
+    def mask(self, locus: str) -> int:
+        """
+        Get the bitmask of the polymorphic positions of a locus
+
+        :param locus: HLA locus
+        :return: bitmask with the bit of each polymorphic position set
+        """
+        try:
+            return self._masks[locus]
+        except KeyError:
+            self._masks[locus] = positions_mask(self.counts.get(locus, {}))
+            return self._masks[locus]
@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+
+# server.py - long-running query server keeping GENIE instances warm
+
+import json  # for request and response bodies
+import os  # for unix socket cleanup
+import socket  # for unix socket client connections
+import socketserver  # for the unix socket server
+import stat  # for checking a socket path is a socket
+import threading  # for coalescing calls across requests
+import time  # for the batching window
+import http.client  # for the client
+from concurrent.futures import Future  # for results of coalesced calls
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .configs import config  # for configurations
+from . import metrics  # for the /metrics endpoint
+
+# GENIE methods that can be called through the server
+SERVED_METHODS = (
+    "getAA",
+    "getNuc",
+    "getPeptide",
+    "getEpitope",
+    "getARD",
+    "getXRD",
+    "getRegion",
+    "listRegions",
+    "isPositionMismatched",
+    "countAAMismatchesAllele",
+    "countAAMismatches",
+    "codon",
+    "codonBatch",
+    "aaForNuc",
+    "aaForNucBatch",
+    "getTranslated",
+    "getTranslatedAA",
+    "listDiscrepancies",
+    "polymorphicPositions",
+    "distanceMatrix",
+    "genotypeMismatches",
+    "genotypeMismatchesBatch",
+    "ambiguousMismatches",
+    "directionalMismatches",
+    "directionalMismatchesBatch",
+    "codonMismatches",
+    "codonMismatchesBatch",
+    "substitutionScore",
+    "substitutionScoreBatch",
+    "getEplets",
+    "epletMismatches",
+    "epletMismatchesBatch",
+    "genotypeEpletMismatches",
+)
+
+# methods whose coalesced calls go to one call of a bulk method: the bulk
+# method and the number of leading arguments it takes as one tuple per call,
+# the remaining arguments being shared by every call of the bulk call
+BULK_METHODS = {
+    "genotypeMismatches": ("genotypeMismatchesBatch", 2),
+    "directionalMismatches": ("directionalMismatchesBatch", 4),
+    "codonMismatches": ("codonMismatchesBatch", 4),
+    "substitutionScore": ("substitutionScoreBatch", 4),
+    "epletMismatches": ("epletMismatchesBatch", 4),
+}
+
+
+def _version_key(imgt_version) -> str:
+    """
+    Normalize an IMGT/HLA version so "3.51.0" and "3510" refer to the same instance
+
+    :param imgt_version: version as given by the client
+    :return: version without dots
+    """
+    return str(imgt_version).replace(".", "")
+
+
+class MicroBatcher:
+    """
+    Coalesces calls submitted by concurrent requests into one dispatch
+
+    A call submitted while no dispatch is running is dispatched straight
+    away. Calls submitted during a dispatch are collected, from any request
+    thread, and dispatched together in a single batch once it finishes.
+    """
+
+    def __init__(self, dispatch, window: float = 0):
+        """
+        :param dispatch: function taking a list of (call, Future) and
+            setting the result of every future
+        :param window: seconds each dispatch waits for more calls before
+            starting, 0 to start straight away
+        """
+        self._dispatch = dispatch
+        self.window = window
+        self._pending = []
+        self._running = False
+        self._condition = threading.Condition()
+
+    def submit(self, calls: list) -> list:
+        """
+        Submit calls and wait for their results
+
+        :param calls: calls to dispatch
+        :return: list of results in the order of calls
+        """
+        futures = [Future() for _ in calls]
+        with self._condition:
+            self._pending += zip(calls, futures)
+
+        while True:
+            with self._condition:
+                # wait for the running dispatch, which may include these calls
+                while self._running and not all(f.done() for f in futures):
+                    self._condition.wait()
+                if all(future.done() for future in futures):
+                    break
+                self._running = True
+
+            try:
+                if self.window > 0:
+                    time.sleep(self.window)
+                with self._condition:
+                    pending, self._pending = self._pending, []
+                try:
+                    self._dispatch(pending)
+                except Exception as e:
+                    for _, future in pending:
+                        if not future.done():
+                            future.set_exception(e)
+            finally:
+                with self._condition:
+                    self._running = False
+                    self._condition.notify_all()
+
+        return [future.result() for future in futures]
+
+
+class GenieServer:
+    """
+    Dispatches calls to warm GENIE instances, one per IMGT/HLA version
+
+    Calls arriving while others are being evaluated are coalesced. Calls
+    of a method with a bulk counterpart (BULK_METHODS) sharing their other
+    arguments go to one call of the bulk method, and the remaining calls
+    to GENIE.batch, which runs each distinct call once.
+    """
+
+    def __init__(self, genies: dict, batch_window: float = config["batch_window"]):
+        """
+        :param genies: dictionary of IMGT/HLA version to GENIE instance
+        :param batch_window: seconds calls are collected across requests
+            before being dispatched, 0 to dispatch straight away and only
+            coalesce calls arriving during a dispatch
+        """
+        if not genies:
+            raise ValueError("At least one GENIE instance must be served")
+
+        self.genies = {_version_key(k): v for k, v in genies.items()}
+
+        # the first version is used when a client does not specify one
+        self.default_version = next(iter(self.genies))
+
+        self._batcher = MicroBatcher(self._dispatch, batch_window)
+
+    @classmethod
+    def from_versions(
+        cls,
+        imgt_versions: list[str],
+        batch_window: float = config["batch_window"],
+        **genie_kwargs,
+    ):
+        """
+        Initialize a GENIE instance for each version and serve them
+
+        :param imgt_versions: IMGT/HLA versions to load
+        :param batch_window: seconds calls are collected across requests
+        :param genie_kwargs: keyword arguments passed to hlagenie.init
+        :return: GenieServer with all versions loaded
+        """
+        from . import init
+
+        genies = {}
+        for imgt_version in imgt_versions:
+            genie = init(imgt_version, **genie_kwargs)
+            genies[genie.imgt_version] = genie
+
+        return cls(genies, batch_window)
+
+    def get_genie(self, imgt_version=None):
+        """
+        Get the GENIE instance for a version
+
+        :param imgt_version: version to retrieve, or None for the default
+        :return: GENIE instance
+        """
+        if imgt_version is None:
+            imgt_version = self.default_version
+        try:
+            return self.genies[_version_key(imgt_version)]
+        except KeyError:
+            raise ValueError(f"IMGT/HLA version {imgt_version} is not loaded")
+
+    def call(self, method: str, args: list, imgt_version=None):
+        """
+        Call a single GENIE method
+
+        :param method: name of the GENIE method
+        :param args: positional arguments for the method
+        :param imgt_version: version to query, or None for the default
+        :return: result of the method
+        """
+        if method not in SERVED_METHODS:
+            raise ValueError(f"{method} is not a served method")
+
+        self.get_genie(imgt_version)
+        version = _version_key(imgt_version or self.default_version)
+        result = self._batcher.submit([(version, method, args)])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def batch(self, calls: list[dict], imgt_version=None) -> list[dict]:
+        """
+        Call many GENIE methods at once
+
+        The calls are coalesced with those of concurrent requests, so a
+        client can send a whole cohort's worth of lookups in one request.
+
+        :param calls: list of {"method": ..., "args": [...]} dictionaries
+        :param imgt_version: version to query, or None for the default
+        :return: list of {"result": ...} or {"error": ...} in the order of calls
+        """
+        self.get_genie(imgt_version)
+        version = _version_key(imgt_version or self.default_version)
+
+        served = [
+            (version, entry.get("method"), entry.get("args", []))
+            for entry in calls
+            if entry.get("method") in SERVED_METHODS
+        ]
+        results = iter(self._batcher.submit(served))
+
+        responses = []
+        for entry in calls:
+            method = entry.get("method")
+            if method not in SERVED_METHODS:
+                responses.append({"error": f"{method} is not a served method"})
+                continue
+            result = next(results)
+            if isinstance(result, Exception):
+                responses.append({"error": repr(result)})
+            else:
+                responses.append({"result": result})
+        return responses
+
+    def _dispatch(self, pending: list):
+        """
+        Evaluate coalesced calls, setting the result or exception of each
+
+        :param pending: list of ((version, method, args), Future)
+        """
+        groups = {}
+        for (version, method, args), future in pending:
+            bulk = BULK_METHODS.get(method)
+            if bulk is not None and len(args) >= bulk[1]:
+                key = (version, method, repr(args[bulk[1] :]))
+            else:
+                key = (version, None, None)
+            groups.setdefault(key, []).append((method, args, future))
+
+        for (version, method, _), group in groups.items():
+            genie = self.genies[version]
+            calls = [(call_method, args) for call_method, args, _ in group]
+            if method is None:
+                results = genie.batch(calls, return_exceptions=True)
+            else:
+                results = self._bulk(genie, method, calls)
+            for (_, _, future), result in zip(group, results):
+                future.set_result(result)
+
+    def _bulk(self, genie, method: str, calls: list) -> list:
+        """
+        Evaluate calls of one method and shared arguments with its bulk method
+
+        :param genie: GENIE instance
+        :param method: name of the single-call method
+        :param calls: list of (method, args) sharing the arguments after the
+            leading ones
+        :return: list of results in the order of calls
+        """
+        bulk_method, leading = BULK_METHODS[method]
+        rows = [tuple(args[:leading]) for _, args in calls]
+        shared = calls[0][1][leading:]
+        try:
+            return getattr(genie, bulk_method)(rows, *shared)
+        except Exception:
+            # one bad call fails the whole bulk call, so find it call by call
+            return genie.batch(calls, return_exceptions=True)
+
+
+class GenieRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP/JSON front end for a GenieServer
+
+    GET  /versions -> {"versions": [...]}
+    GET  /metrics  -> metrics in the Prometheus text format
+    POST /call     -> {"method": ..., "args": [...], "version": ...}
+    POST /batch    -> {"calls": [{"method": ..., "args": [...]}, ...], "version": ...}
+    """
+
+    # keep connections open so clients avoid a handshake per query
+    protocol_version = "HTTP/1.1"
+
+    # buffer the response so headers and body go out in a single write
+    wbufsize = -1
+
+    def address_string(self):
+        # unix socket clients have no address
+        if not self.client_address:
+            return "unix"
+        return super().address_string()
+
+    def log_message(self, format, *args):
+        # logging every request would dominate the response time
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == "/versions":
+            self._send_json(200, {"versions": list(self.server.genie_server.genies)})
+        elif self.path == "/metrics":
+            payload = metrics.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            self._send_json(400, {"error": f"Invalid JSON: {e}"})
+            return
+
+        genie_server = self.server.genie_server
+        try:
+            if self.path == "/call":
+                result = genie_server.call(
+                    body.get("method"), body.get("args", []), body.get("version")
+                )
+                self._send_json(200, {"result": result})
+            elif self.path == "/batch":
+                results = genie_server.batch(body.get("calls", []), body.get("version"))
+                self._send_json(200, {"results": results})
+            else:
+                self._send_json(404, {"error": f"Unknown path {self.path}"})
+        except Exception as e:
+            self._send_json(400, {"error": repr(e)})
+
+
+class UnixGenieHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    HTTP server listening on a unix domain socket
+    """
+
+    daemon_threads = True
+
+    def server_bind(self):
+        # remove a stale socket file left by a previous server, but nothing else
+        try:
+            mode = os.lstat(self.server_address).st_mode
+        except FileNotFoundError:
+            pass
+        else:
+            if not stat.S_ISSOCK(mode):
+                raise FileExistsError(
+                    f"{self.server_address} exists and is not a socket"
+                )
+            os.unlink(self.server_address)
+        super().server_bind()
+
+
+def make_server(
+    genie_server: GenieServer,
+    host: str = config["server_host"],
+    port: int = config["server_port"],
+    socket_path: str = None,
+    verbose: bool = False,
+):
+    """
+    Create an HTTP server for a GenieServer on localhost or a unix socket
+
+    :param genie_server: GenieServer to dispatch requests to
+    :param host: host to listen on (ignored if socket_path is given)
+    :param port: port to listen on (ignored if socket_path is given)
+    :param socket_path: path of a unix domain socket to listen on
+    :param verbose: log every request to stderr
+    :return: server ready for serve_forever()
+    """
+    if socket_path:
+        httpd = UnixGenieHTTPServer(socket_path, GenieRequestHandler)
+    else:
+        httpd = ThreadingHTTPServer((host, port), GenieRequestHandler)
+
+    httpd.genie_server = genie_server
+    httpd.verbose = verbose
+
+    return httpd
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a unix domain socket"""
+
+    def __init__(self, socket_path: str, timeout: float = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class Client:
+    """
+    Client for a running hlagenie server, reusing one connection for all queries
+    """
+
+    def __init__(
+        self,
+        host: str = config["server_host"],
+        port: int = config["server_port"],
+        socket_path: str = None,
+        imgt_version: str = None,
+        timeout: float = 15,
+    ):
+        if socket_path:
+            self.connection = _UnixHTTPConnection(socket_path, timeout=timeout)
+        else:
+            self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        self.imgt_version = imgt_version
+
+    def _post(self, path: str, body: dict) -> dict:
+        payload = json.dumps(body)
+        self.connection.request(
+            "POST", path, payload, {"Content-Type": "application/json"}
+        )
+        response = json.loads(self.connection.getresponse().read())
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response
+
+    def call(self, method: str, *args):
+        """
+        Call a GENIE method on the server
+
+        :param method: name of the GENIE method
+        :param args: positional arguments for the method
+        :return: result of the method
+        """
+        body = {"method": method, "args": list(args), "version": self.imgt_version}
+        return self._post("/call", body)["result"]
+
+    def batch(self, calls: list[tuple]) -> list:
+        """
+        Call many GENIE methods in one request
+
+        :param calls: list of (method, arg1, arg2, ...) tuples
+        :return: list of results, with exceptions in place of failed calls
+        """
+        body = {
+            "calls": [{"method": c[0], "args": list(c[1:])} for c in calls],
+            "version": self.imgt_version,
+        }
+        return [
+            r["result"] if "result" in r else RuntimeError(r["error"])
+            for r in self._post("/batch", body)["results"]
+        ]
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+
+# shared.py - sequence tables in a memory-mapped file shared by worker processes
+
+import array  # for sequence offsets
+import json  # for the store header
+import mmap  # for mapping the store without copying it
+import os  # for atomic replacement of the store
+import pathlib  # for path manipulation
+import struct  # for the header length
+import tempfile  # for the default store directory
+import uuid  # for unique store names
+from collections.abc import Mapping  # for store-backed sequence dictionaries
+from .configs import config  # for configurations
+from .export import SEQUENCE_TABLES, STATUSES  # for the tables of a store
+from .genie import GENIE  # for views over a store
+from .residues import PolymorphismIndex, bitplanes  # for residue matrices
+from .smart_sort import smart_sort  # for sorted tables
+
+MAGIC = b"HLAGSHM2"
+
+# magic followed by the length of the JSON header
+_PREAMBLE = struct.Struct("<8sQ")
+
+
+def default_directory() -> pathlib.Path:
+    """
+    Get the directory stores are written to by default
+
+    :return: /dev/shm when available, so the store lives in memory, or the
+        temporary directory
+    """
+    shm = pathlib.Path("/dev/shm")
+    if shm.is_dir() and os.access(shm, os.W_OK):
+        return shm
+    return pathlib.Path(tempfile.gettempdir())
+
+
+def publish(genie, path=None) -> "SharedStore":
+    """
+    Write the sequence tables of a GENIE instance into a store file
+
+    Each locus of each table is written as its allele names, the offsets of
+    its sequences and the sequences themselves back to back, so processes
+    mapping the file share one copy through the page cache. The residue
+    bitplanes of the mature sequences are written the same way, as the
+    residues of each allele, the sequence lengths and one little-endian
+    bitmask per residue. The header records the options of the instance,
+    the ARD/XRD ends, the regions added with defineRegion, the residue
+    counts of the polymorphic positions and the completeness lists.
+
+    :param genie: GENIE instance to publish
+    :param path: file to write, a new file in default_directory() if None
+    :return: SharedStore owning the file
+    """
+    if path is None:
+        path = (
+            default_directory()
+            / f"hlagenie-{genie.imgt_version}-{uuid.uuid4().hex}.shm"
+        )
+    path = pathlib.Path(path)
+
+    segments = []
+    position = 0
+
+    def add(data: bytes) -> list[int]:
+        nonlocal position
+        segments.append(data)
+        span = [position, len(data)]
+        position += len(data)
+        return span
+
+    tables = {}
+    for table_name, attribute in SEQUENCE_TABLES.items():
+        seqs = getattr(genie, attribute)
+        tables[table_name] = {}
+        for locus in config["loci"]:
+            alleles = smart_sort(a for a in seqs if a.split("*")[0] == locus)
+            encoded = [seqs[allele].encode("ascii") for allele in alleles]
+            offsets = array.array("Q", [0])
+            for seq in encoded:
+                offsets.append(offsets[-1] + len(seq))
+            tables[table_name][locus] = {
+                "names": add("\n".join(alleles).encode("ascii")),
+                "offsets": add(offsets.tobytes()),
+                "seqs": add(b"".join(encoded)),
+            }
+
+    planes = {}
+    for locus in config["loci"]:
+        alleles = smart_sort(a for a in genie.seqs if a.split("*")[0] == locus)
+        residues = []
+        lengths = array.array("Q")
+        masks = []
+        for allele in alleles:
+            seq = genie.seqs[allele]
+            width = (len(seq) + 7) // 8
+            allele_planes = bitplanes(seq)
+            residues.append("".join(allele_planes))
+            lengths.append(len(seq))
+            masks += [mask.to_bytes(width, "little") for mask in allele_planes.values()]
+        planes[locus] = {
+            "names": add("\n".join(alleles).encode("ascii")),
+            "residues": add("\n".join(residues).encode("ascii")),
+            "lengths": add(lengths.tobytes()),
+            "masks": add(b"".join(masks)),
+        }
+
+    completeness = {}
+    for locus in config["loci"]:
+        for seqtype in ("prot", "nuc"):
+            for status, method in STATUSES.items():
+                listed = getattr(genie, method)(locus, seqtype)
+                completeness[f"{locus}/{seqtype}/{status}"] = list(listed)
+
+    header = json.dumps(
+        {
+            "imgt_version": str(genie.imgt_version),
+            "ungap": genie.ungap,
+            "imputed": genie.imputed,
+            "imputation_method": genie.imputation_method,
+            "ard_ends": genie.ards,
+            "xrd_ends": genie.xrds,
+            "regions": [
+                {"name": name, "locus": locus, "positions": positions}
+                for (name, locus), positions in genie.regions.user_regions.items()
+            ],
+            "polymorphism": genie.polymorphism.counts,
+            "completeness": completeness,
+            "tables": tables,
+            "planes": planes,
+        }
+    ).encode("utf-8")
+
+    # write next to the target and rename, so no process maps a partial store
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, len(header)))
+        f.write(header)
+        for data in segments:
+            f.write(data)
+    os.replace(tmp_path, path)
+
+    return SharedStore(path, owner=True)
+
+
+class SharedSeqs(Mapping):
+    """
+    Read-only dictionary of allele to sequence backed by a mapped store
+
+    Only the allele index is built in each process; sequences stay in the
+    shared mapping and are decoded when looked up.
+    """
+
+    def __init__(self, buffer: mmap.mmap, base: int, loci: dict):
+        """
+        :param buffer: mapping of the store file
+        :param base: offset of the data segments in the file
+        :param loci: dictionary of locus to the spans of its names, offsets
+            and sequences, as written by publish
+        """
+        self._buffer = buffer
+        self._index = {}
+        for spans in loci.values():
+            start, length = spans["names"]
+            if not length:
+                continue
+            names = buffer[base + start : base + start + length].decode("ascii")
+            start, length = spans["offsets"]
+            offsets = memoryview(buffer)[base + start : base + start + length]
+            offsets = offsets.cast("Q").tolist()
+            seqs_start = base + spans["seqs"][0]
+            for allele, begin, end in zip(names.split("\n"), offsets, offsets[1:]):
+                # keep the first, like the builders do for duplicate alleles
+                self._index.setdefault(allele, (seqs_start + begin, seqs_start + end))
+
+    def __getitem__(self, allele: str) -> str:
+        start, end = self._index[allele]
+        return self._buffer[start:end].decode("ascii")
+
+    def __contains__(self, allele) -> bool:
+        return allele in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+class SharedPlanes(Mapping):
+    """
+    Read-only dictionary of allele to residue bitplanes backed by a mapped store
+
+    Only the allele index is built in each process; the bitmasks stay in the
+    shared mapping and are turned into integers when looked up.
+    """
+
+    def __init__(self, buffer: mmap.mmap, base: int, loci: dict):
+        """
+        :param buffer: mapping of the store file
+        :param base: offset of the data segments in the file
+        :param loci: dictionary of locus to the spans of its names, residues,
+            lengths and bitmasks, as written by publish
+        """
+        self._buffer = buffer
+        self._index = {}
+        for spans in loci.values():
+            start, length = spans["names"]
+            if not length:
+                continue
+            names = buffer[base + start : base + start + length].decode("ascii")
+            start, length = spans["residues"]
+            residues = buffer[base + start : base + start + length].decode("ascii")
+            start, length = spans["lengths"]
+            lengths = memoryview(buffer)[base + start : base + start + length]
+            lengths = lengths.cast("Q").tolist()
+            position = base + spans["masks"][0]
+            for allele, allele_residues, seq_length in zip(
+                names.split("\n"), residues.split("\n"), lengths
+            ):
+                self._index.setdefault(allele, (allele_residues, seq_length, position))
+                position += len(allele_residues) * ((seq_length + 7) // 8)
+
+    def __getitem__(self, allele: str) -> tuple[dict, int]:
+        residues, length, start = self._index[allele]
+        width = (length + 7) // 8
+        planes = {}
+        for residue in residues:
+            planes[residue] = int.from_bytes(
+                self._buffer[start : start + width], "little"
+            )
+            start += width
+        return planes, length
+
+    def __contains__(self, allele) -> bool:
+        return allele in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+class SharedStore:
+    """
+    A store file mapped into this process
+
+    The process that published the store owns it and removes the file on
+    close; processes that only attached leave it in place.
+    """
+
+    def __init__(self, path, owner: bool = False):
+        """
+        :param path: store file written by publish
+        :param owner: remove the file when the store is closed
+        """
+        self.path = pathlib.Path(path)
+        self.owner = owner
+
+        with open(self.path, "rb") as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_length = _PREAMBLE.unpack_from(self._buffer)
+        if magic != MAGIC:
+            self._buffer.close()
+            raise ValueError(f"{self.path} is not an hlagenie shared store")
+        base = _PREAMBLE.size + header_length
+        self.header = json.loads(self._buffer[_PREAMBLE.size : base])
+
+        self.tables = {
+            table_name: SharedSeqs(self._buffer, base, loci)
+            for table_name, loci in self.header["tables"].items()
+        }
+        self.planes = SharedPlanes(self._buffer, base, self.header["planes"])
+        # JSON keys are strings, so turn the positions back into integers
+        self.polymorphism = PolymorphismIndex(
+            {
+                locus: {
+                    int(position): residues for position, residues in counts.items()
+                }
+                for locus, counts in self.header["polymorphism"].items()
+            }
+        )
+        self.completeness = {
+            tuple(key.split("/")): alleles
+            for key, alleles in self.header["completeness"].items()
+        }
+        self.regions = {
+            (region["name"], region["locus"]): region["positions"]
+            for region in self.header["regions"]
+        }
+
+    def view(self, **kwargs) -> "GenieView":
+        """
+        Get a GENIE view over the store
+
+        :param kwargs: keyword arguments passed to GenieView
+        :return: GenieView
+        """
+        return GenieView(self.path, **kwargs)
+
+    def close(self):
+        """Unmap the store, removing the file if this process published it"""
+        self.tables = {}
+        self.planes = None
+        # views may still hold the mapping, which stays valid until they go away
+        self._buffer = None
+        if self.owner:
+            self.path.unlink(missing_ok=True)
+            self.owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class GenieView(GENIE):
+    """
+    GENIE over a store published by another process, without a database
+
+    Pickles as the path of the store, so it can be handed to worker
+    processes cheaply; each worker maps the same file. The residue
+    bitplanes and polymorphic positions are read from the store rather
+    than rebuilt. Python integers cannot point into the mapping, so each
+    worker still turns the bitmasks of the alleles it compares into
+    integers, once per allele. py-ard is only initialized in a worker if
+    it needs to reduce an allele.
+    """
+
+    def __init__(
+        self,
+        path,
+        load_mac: bool = True,
+        cache_size: int = config["DEFAULT_CACHE_SIZE"],
+        ard=None,
+    ):
+        """
+        :param path: store file written by publish
+        :param load_mac: load MACs if py-ard is initialized
+        :param cache_size: size of the caches of the view
+        :param ard: py-ard object used to reduce alleles, created if needed
+        """
+        super().__init__(
+            load_mac=load_mac, cache_size=cache_size, ard=ard, from_shared=path
+        )
+
+    def __reduce__(self):
+        return (
+            GenieView,
+            (str(self._shared.path), self.load_mac, self.cache_size),
+        )
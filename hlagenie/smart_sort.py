@@ -1,18 +1,61 @@
 import functools
 import re
+from .configs import config  # for configurations
 
 expr_regex = re.compile("[PNQLSGg]")
 glstring_chars = re.compile("[/|+^~]")
+field_digits = re.compile(r"\d*")
 
 
-# TODO - change the maxsize to use DEFAULT_CACHE_SIZE from the configs file
-@functools.lru_cache(maxsize=1000)
+@functools.lru_cache(maxsize=config["DEFAULT_CACHE_SIZE"])
+def smart_sort_key(allele: str) -> tuple:
+    """
+    Natural sort key of an allele, for use as sorted(alleles, key=smart_sort_key)
+
+    Each allele is parsed once into (0, locus, field1, field2, field3, field4,
+    allele), so alleles of a locus sort by the numerical value of each field,
+    as with smart_sort_comparator. Serology sorts after alleles and GL strings
+    last, and the allele name breaks ties such as expression characters.
+    Keys are cached for up to DEFAULT_CACHE_SIZE alleles.
+
+    :param allele: allele to get the key for
+    :return: sort key
+    """
+    # GL strings are sorted lexicographically
+    if re.search(glstring_chars, allele):
+        return (2, allele)
+
+    # serology is sorted lexicographically
+    if ":" not in allele:
+        return (1, allele)
+
+    locus, _, name = allele.partition("*")
+
+    # the numerical part of each field, ignoring expression characters
+    fields = [int(field_digits.match(field).group() or 0) for field in name.split(":")]
+    fields = (fields + [0, 0, 0, 0])[:4]
+
+    return (0, locus, *fields, allele)
+
+
+def smart_sort(alleles) -> list:
+    """
+    Natural sort a collection of alleles
+
+    :param alleles: alleles to sort
+    :return: sorted list of alleles
+    """
+    return sorted(alleles, key=smart_sort_key)
+
+
+@functools.lru_cache(maxsize=config["DEFAULT_CACHE_SIZE"])
 def smart_sort_comparator(a1, a2):
     """
     Natural sort 2 given alleles.
 
     Python sorts strings lexicographically but HLA alleles need
     to be sorted by numerical values in each field of the HLA nomenclature.
+    Sorting with smart_sort or smart_sort_key parses each allele only once.
 
     :param a1: first allele
     :param a2: second allele
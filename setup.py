@@ -27,6 +27,7 @@ setup(
     scripts=[
         "scripts/hlagenie",
         "scripts/hlagenie-match",
+        "scripts/hlagenie-serve",
     ],
     install_requires=requirements,
     license="LGPL 3.0",
@@ -1,20 +1,71 @@
+import functools
+import http.server
+import os
+import shutil
+import threading
 import pytest
 import hlagenie
+from hlagenie.configs import config
+from .synthetic import write_imgt_release, TwoFieldReducer
 
 # fixtures for test functions
 
+# fraction of the real IMGT/HLA allele counts used for the synthetic release
+SYNTHETIC_SCALE = float(os.environ.get("HLAGENIE_SYNTHETIC_SCALE", "0.05"))
 
-@pytest.fixture(autouse=True)
-def aa_mm():
-    # create an object for testing
-    aa_mm = hlagenie.init("3510")
 
-    # set known alleles for testing
-    allele1 = "A*02:01"
-    allele2 = "A*01:01"
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
 
-    # set known position for testing
-    position1 = 8
 
-    # run tests here
-    yield
+@pytest.fixture(scope="session")
+def imgt_server(tmp_path_factory):
+    """
+    Serve a synthetic IMGT/HLA release from a local HTTP server and point
+    hlagenie at it instead of GitHub
+    """
+    root = tmp_path_factory.mktemp("imgthla")
+    write_imgt_release(root, "3510", scale=SYNTHETIC_SCALE)
+
+    handler = functools.partial(_QuietHandler, directory=str(root))
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    original_url = config["imgt_hla_url"]
+    config["imgt_hla_url"] = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield config["imgt_hla_url"]
+
+    config["imgt_hla_url"] = original_url
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(scope="session")
+def synthetic_data_dir(imgt_server, tmp_path_factory):
+    """Data directory with the synthetic release already built into a database"""
+    data_dir = tmp_path_factory.mktemp("hlagenie")
+    hlagenie.init("3510", data_dir=str(data_dir), ard=TwoFieldReducer())
+    return str(data_dir)
+
+
+@pytest.fixture(scope="session")
+def synthetic_genie(synthetic_data_dir):
+    """GENIE instance over the synthetic release"""
+    return hlagenie.init("3510", data_dir=synthetic_data_dir, ard=TwoFieldReducer())
+
+
+@pytest.fixture
+def scratch_data_dir(synthetic_data_dir, tmp_path):
+    """Copy of the built database for tests that write to it"""
+    for name in os.listdir(synthetic_data_dir):
+        if name.endswith(".db"):
+            shutil.copy(os.path.join(synthetic_data_dir, name), tmp_path)
+    return str(tmp_path)
+
+
+@pytest.fixture
+def scratch_genie(scratch_data_dir):
+    """GENIE instance over a copy of the built database"""
+    return hlagenie.init("3510", data_dir=scratch_data_dir, ard=TwoFieldReducer())
@@ -0,0 +1,294 @@
+# synthetic.py - generator of synthetic IMGT/HLA MSF alignments for network-free tests
+
+import pathlib
+import random
+from hlagenie.configs import config
+from hlagenie.misc import regex_gen, coordinate, coordinate_end
+
+# approximate number of two-field protein alleles per gene in IPD-IMGT/HLA 3.51.0
+ALLELE_COUNTS = {
+    "A": 4200,
+    "B": 5300,
+    "C": 3900,
+    "DRB1": 2200,
+    "DRB3": 240,
+    "DRB4": 100,
+    "DRB5": 80,
+    "DQA1": 250,
+    "DQB1": 1400,
+    "DPA1": 180,
+    "DPB1": 1300,
+}
+
+# leader length, mature length, ARD end and XRD end of each gene's protein
+PROTEIN_LAYOUT = {
+    "A": (24, 341, 182, 274),
+    "B": (24, 338, 182, 274),
+    "C": (24, 342, 182, 274),
+    "DRB1": (29, 237, 94, 198),
+    "DRB3": (29, 237, 94, 198),
+    "DRB4": (29, 237, 94, 198),
+    "DRB5": (29, 237, 94, 198),
+    "DQA1": (23, 232, 87, 192),
+    "DQB1": (32, 229, 94, 198),
+    "DPA1": (31, 229, 84, 190),
+    "DPB1": (29, 229, 92, 196),
+}
+
+# genes are written to one file per IMGT locus, with DRB3/4/5 mixed in DRB345
+MSF_LOCI = {
+    "A": ["A"],
+    "B": ["B"],
+    "C": ["C"],
+    "DRB1": ["DRB1"],
+    "DRB345": ["DRB3", "DRB4", "DRB5"],
+    "DQA1": ["DQA1"],
+    "DQB1": ["DQB1"],
+    "DPA1": ["DPA1"],
+    "DPB1": ["DPB1"],
+}
+
+CODONS = {
+    "A": ["GCT", "GCC", "GCA", "GCG"],
+    "R": ["CGT", "CGC", "CGA", "CGG", "AGA", "AGG"],
+    "N": ["AAT", "AAC"],
+    "D": ["GAT", "GAC"],
+    "C": ["TGT", "TGC"],
+    "Q": ["CAA", "CAG"],
+    "E": ["GAA", "GAG"],
+    "G": ["GGT", "GGC", "GGA", "GGG"],
+    "H": ["CAT", "CAC"],
+    "I": ["ATT", "ATC", "ATA"],
+    "L": ["TTA", "TTG", "CTT", "CTC", "CTA", "CTG"],
+    "K": ["AAA", "AAG"],
+    "M": ["ATG"],
+    "F": ["TTT", "TTC"],
+    "P": ["CCT", "CCC", "CCA", "CCG"],
+    "S": ["TCT", "TCC", "TCA", "TCG", "AGT", "AGC"],
+    "T": ["ACT", "ACC", "ACA", "ACG"],
+    "W": ["TGG"],
+    "Y": ["TAT", "TAC"],
+    "V": ["GTT", "GTC", "GTA", "GTG"],
+    "X": ["TGA"],
+}
+RESIDUES = "ACDEFGHIKLMNPQRSTVWY"
+
+
+class TwoFieldReducer:
+    """Stand-in for py-ard's U2 reduction that truncates names to two fields"""
+
+    def redux(self, allele: str, redux_type: str = "U2") -> str:
+        fields = allele.split(":")
+        reduced = ":".join(fields[:2])
+        # keep the expression character of null and low expression alleles
+        if len(fields) > 2 and fields[-1][-1].isalpha() and not reduced[-1].isalpha():
+            reduced += fields[-1][-1]
+        return reduced
+
+
+def _reference_protein(gene: str, rng: random.Random) -> str:
+    """
+    Random full protein for a reference allele that contains the anchors used
+    to find the mature start and the ARD and XRD ends
+    """
+    leader, mature, ard_end, xrd_end = PROTEIN_LAYOUT[gene]
+    ref_allele = config["refseq"][gene]
+    first_ten = config["first_ten"][ref_allele]
+    ard_last_ten = config["ard_last_ten"][ref_allele]
+    xrd_last_ten = config["xrd_last_ten"][ref_allele]
+
+    while True:
+        seq = (
+            "".join(rng.choice(RESIDUES) for _ in range(leader))
+            + first_ten
+            + "".join(rng.choice(RESIDUES) for _ in range(ard_end - 20))
+            + ard_last_ten
+            + "".join(rng.choice(RESIDUES) for _ in range(xrd_end - ard_end - 10))
+            + xrd_last_ten
+            + "".join(rng.choice(RESIDUES) for _ in range(mature - xrd_end))
+        )
+        # redraw if the random filler happens to match one of the anchors early
+        mature_seq = seq[coordinate(seq, regex_gen(first_ten)) :]
+        if (
+            coordinate(seq, regex_gen(first_ten)) == leader
+            and coordinate_end(mature_seq, regex_gen(ard_last_ten)) == ard_end
+            and coordinate_end(mature_seq, regex_gen(xrd_last_ten)) == xrd_end
+        ):
+            return seq
+
+
+def _allele_names(gene: str, count: int, rng: random.Random) -> list[str]:
+    """Two-field names for a gene, starting with the reference allele"""
+    ref_allele = config["refseq"][gene]
+    names = [ref_allele]
+    seen = {ref_allele}
+    groups = max(1, count // 40)
+    while len(names) < count:
+        name = f"{gene}*{rng.randint(1, groups):02d}:{rng.randint(1, 150):02d}"
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def _gene_alleles(gene: str, count: int, rng: random.Random) -> list[tuple[str, str]]:
+    """
+    Full allele names and ungapped full protein sequences for one gene
+
+    New alleles are point mutants of earlier ones, so sequences cluster like
+    real allele lineages. A share of alleles are nulls, truncated at a stop.
+    """
+    leader = PROTEIN_LAYOUT[gene][0]
+    ref_full = config["refseq_full"][gene]
+    proteins = [_reference_protein(gene, rng)]
+
+    alleles = []
+    for i, name in enumerate(_allele_names(gene, count, rng)):
+        if i > 0:
+            protein = list(rng.choice(proteins))
+            for _ in range(rng.randint(1, 4)):
+                position = rng.randrange(leader, len(protein))
+                protein[position] = rng.choice(RESIDUES)
+            protein = "".join(protein)
+            # null alleles carry an early stop
+            if rng.random() < 0.02:
+                stop = rng.randrange(leader + 10, len(protein))
+                protein = protein[:stop] + "X"
+                name += "N"
+            else:
+                proteins.append(protein)
+        else:
+            protein = proteins[0]
+
+        # one to three full names share the two-field protein
+        if i == 0:
+            full_names = [ref_full]
+        else:
+            suffixes = [":01:01", ":01:02", ":02"][: rng.randint(1, 3)]
+            full_names = [
+                name[:-1] + suffix + "N" if name.endswith("N") else name + suffix
+                for suffix in suffixes
+            ]
+        for full_name in full_names:
+            alleles.append((full_name, protein))
+
+    return alleles
+
+
+def _align(gene_alleles: dict, rng: random.Random) -> list[tuple[str, str, str]]:
+    """
+    Gapped protein and nucleotide sequences for all alleles of one MSF file
+
+    Adds insertion columns (gaps in most alleles), short deletions and
+    alleles only sequenced over the ARD exons, which show as leading and
+    trailing gaps, as in the IMGT/HLA alignments.
+    """
+    length = max(len(p) for alleles in gene_alleles.values() for _, p in alleles)
+    insertions = set(rng.sample(range(40, length - 40), 2))
+
+    aligned = []
+    for gene, alleles in gene_alleles.items():
+        leader, _, ard_end, _ = PROTEIN_LAYOUT[gene]
+        codon_choice = {}
+        for full_name, protein in alleles:
+            # alleles of the same two-field group differ only by synonymous codons
+            two_field = ":".join(full_name.split(":")[:2])
+            if two_field not in codon_choice:
+                codon_choice[two_field] = [rng.choice(CODONS[r]) for r in protein]
+            codons = list(codon_choice[two_field])
+            if full_name != config["refseq_full"][gene]:
+                position = rng.randrange(len(protein))
+                codons[position] = rng.choice(CODONS[protein[position]])
+
+            prot_cols = list(protein.ljust(length, "."))
+            nuc_cols = [c for c in codons] + ["..."] * (length - len(codons))
+
+            # partially sequenced alleles only cover the ARD
+            is_ref = full_name == config["refseq_full"][gene]
+            if not is_ref and rng.random() < 0.3:
+                for i in list(range(leader)) + list(range(leader + ard_end, length)):
+                    prot_cols[i] = "."
+                    nuc_cols[i] = "..."
+            # short deletions
+            if not is_ref and rng.random() < 0.02:
+                start = rng.randrange(leader, leader + ard_end - 3)
+                for i in range(start, start + rng.randint(1, 3)):
+                    prot_cols[i] = "."
+                    nuc_cols[i] = "..."
+
+            # insertion columns are gaps unless this allele carries an insert
+            gapped_prot, gapped_nuc = [], []
+            for i in range(length):
+                if i in insertions:
+                    if not is_ref and rng.random() < 0.03:
+                        residue = rng.choice(RESIDUES)
+                        gapped_prot.append(residue)
+                        gapped_nuc.append(rng.choice(CODONS[residue]))
+                    else:
+                        gapped_prot.append(".")
+                        gapped_nuc.append("...")
+                gapped_prot.append(prot_cols[i])
+                gapped_nuc.append(nuc_cols[i])
+
+            aligned.append((full_name, "".join(gapped_prot), "".join(gapped_nuc)))
+
+    return aligned
+
+
+def _msf(records: list[tuple[str, str]], seq_type: str) -> str:
+    """Format gapped sequences as a GCG MSF alignment"""
+    length = len(records[0][1])
+    width = max(len(name) for name, _ in records) + 1
+    lines = [
+        "!!AA_MULTIPLE_ALIGNMENT 1.0"
+        if seq_type == "P"
+        else "!!NA_MULTIPLE_ALIGNMENT 1.0",
+        "",
+        f"   MSF: {length}  Type: {seq_type}  Check: 0 ..",
+        "",
+    ]
+    for name, seq in records:
+        lines.append(f" Name: {name} Len: {length}  Check: 0  Weight: 1.00")
+    lines += ["", "//", ""]
+    for start in range(0, length, 50):
+        for name, seq in records:
+            block = seq[start : start + 50]
+            chunks = " ".join(block[i : i + 10] for i in range(0, len(block), 10))
+            lines.append(f"{name.ljust(width)} {chunks}")
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+def write_imgt_release(
+    root, imgt_version: str = "3510", scale: float = 0.05, seed: int = 3510
+) -> pathlib.Path:
+    """
+    Write synthetic protein and nucleotide MSF files laid out like the IMGTHLA
+    repository (<root>/<version>/msf/<locus>_prot.msf)
+
+    :param root: directory to write the release to
+    :param imgt_version: version directory name
+    :param scale: fraction of the real number of alleles to generate
+    :param seed: random seed, so runs are reproducible
+    :return: path to the msf directory
+    """
+    rng = random.Random(seed)
+    msf_dir = pathlib.Path(root) / imgt_version / "msf"
+    msf_dir.mkdir(parents=True, exist_ok=True)
+
+    for msf_locus, genes in MSF_LOCI.items():
+        gene_alleles = {
+            gene: _gene_alleles(gene, max(5, int(ALLELE_COUNTS[gene] * scale)), rng)
+            for gene in genes
+        }
+        aligned = _align(gene_alleles, rng)
+        # DRB345 mixes the genes through the file
+        if len(genes) > 1:
+            rng.shuffle(aligned)
+
+        prot = [(name, prot) for name, prot, _ in aligned]
+        nuc = [(name, nuc) for name, _, nuc in aligned]
+        (msf_dir / f"{msf_locus}_prot.msf").write_text(_msf(prot, "P"))
+        (msf_dir / f"{msf_locus}_nuc.msf").write_text(_msf(nuc, "N"))
+
+    return msf_dir
@@ -0,0 +1,76 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+from hlagenie import accessor  # noqa: E402 - registers df.hlagenie
+
+
+@pytest.fixture(scope="module")
+def cohort(synthetic_genie):
+    alleles = sorted(a for a in synthetic_genie.seqs if a.startswith("A*"))[:6]
+    rows = [
+        (alleles[i % 6], alleles[(i * 5) % 6], alleles[(i + 1) % 6], alleles[2])
+        for i in range(30)
+    ]
+    df = pd.DataFrame(rows, columns=["d1", "d2", "r1", "r2"])
+    df.loc[3, "d1"] = None
+    return df
+
+
+# test column lookups match the row by row GENIE calls
+def test_aa_and_epitope(cohort, synthetic_genie):
+    aa = cohort.hlagenie.aa("d2", 44, genie=synthetic_genie)
+    epitope = cohort.hlagenie.epitope("d2", [44, 45], genie=synthetic_genie)
+    for i, allele in cohort["d2"].items():
+        assert aa[i] == synthetic_genie.getAA(allele, 44)
+        assert epitope[i] == synthetic_genie.getEpitope(allele, [44, 45])
+
+    # missing alleles stay missing
+    assert pd.isna(cohort.hlagenie.aa("d1", 44, genie=synthetic_genie)[3])
+
+
+# test region mismatch counts match summing countAAMismatchesAllele
+def test_mismatch(cohort, synthetic_genie):
+    accessor.set_genie(synthetic_genie)
+    try:
+        counts = cohort.hlagenie.mismatch(["d1", "d2"], ["r1", "r2"], region="ARD")
+        listed = cohort.hlagenie.mismatch(["d1", "d2"], ["r1", "r2"], positions=[9])
+    finally:
+        accessor.set_genie(None)
+
+    ard_end = synthetic_genie.ards["A"]
+    for i, (d1, d2, r1, r2) in cohort.iterrows():
+        if pd.isna(d1):
+            assert pd.isna(counts[i])
+            continue
+        expected = sum(
+            synthetic_genie.countAAMismatchesAllele(d1, d2, r1, r2, position)
+            for position in range(1, ard_end + 1)
+        )
+        assert counts[i] == expected
+        assert listed[i] == synthetic_genie.countAAMismatchesAllele(d1, d2, r1, r2, 9)
+
+
+# test distinct donor alleles with identical sequences are not taken as homozygous
+def test_mismatch_identical_sequences(synthetic_genie):
+    by_seq = {}
+    for allele in sorted(a for a in synthetic_genie.seqs if a.startswith("A*")):
+        by_seq.setdefault(synthetic_genie.seqs[allele], []).append(allele)
+    same = next(alleles for alleles in by_seq.values() if len(alleles) > 1)
+    recip = next(a for a in by_seq if a != synthetic_genie.seqs[same[0]])
+    recip = by_seq[recip][0]
+
+    df = pd.DataFrame(
+        [(same[0], same[1], recip, recip)], columns=["d1", "d2", "r1", "r2"]
+    )
+    counts = df.hlagenie.mismatch(["d1", "d2"], ["r1", "r2"], genie=synthetic_genie)
+    expected = synthetic_genie.genotypeMismatches(
+        f"{same[0]}+{same[1]}", f"{recip}+{recip}"
+    )["total"]
+    assert expected > 0
+    assert counts[0] == expected
+
+
+# test a clear error without a GENIE instance
+def test_no_genie(cohort):
+    with pytest.raises(ValueError):
+        cohort.hlagenie.aa("d2", 44)
@@ -0,0 +1,190 @@
+import itertools
+import tracemalloc
+import pytest
+import hlagenie
+from hlagenie.configs import config
+from .synthetic import TwoFieldReducer
+
+# benchmarks run against the synthetic release served by the imgt_server fixture
+pytest.importorskip("pytest_benchmark")
+
+
+def _sample_alleles(genie, locus: str, n: int = 50) -> list[str]:
+    alleles = [a for a in genie.seqs if a.startswith(f"{locus}*") and a[-1] != "N"]
+    return alleles[:n]
+
+
+# benchmark building all tables from downloaded alignments
+def test_build_tables(benchmark, imgt_server, tmp_path_factory):
+    def setup():
+        data_dir = str(tmp_path_factory.mktemp("build"))
+        return (), {"data_dir": data_dir}
+
+    def build(data_dir):
+        return hlagenie.init("3510", data_dir=data_dir, ard=TwoFieldReducer())
+
+    genie = benchmark.pedantic(build, setup=setup, rounds=3)
+    assert set(config["loci"]) <= set(genie.ards)
+
+
+# benchmark initializing from an existing cache
+def test_init_from_cache(benchmark, synthetic_data_dir):
+    genie = benchmark(
+        hlagenie.init, "3510", data_dir=synthetic_data_dir, ard=TwoFieldReducer()
+    )
+    assert genie.seqs
+
+
+# benchmark the memory held by an instance initialized from cache
+def test_init_memory(benchmark, synthetic_data_dir):
+    def init_traced():
+        tracemalloc.start()
+        genie = hlagenie.init(
+            "3510", data_dir=synthetic_data_dir, ard=TwoFieldReducer()
+        )
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        benchmark.extra_info["current_bytes"] = current
+        benchmark.extra_info["peak_bytes"] = peak
+        return genie
+
+    benchmark.pedantic(init_traced, rounds=1)
+    assert benchmark.extra_info["peak_bytes"] > 0
+
+
+# benchmark single residue lookups
+def test_getAA_throughput(benchmark, synthetic_genie):
+    queries = list(
+        itertools.product(_sample_alleles(synthetic_genie, "A"), range(1, 183))
+    )
+
+    def run():
+        for allele, position in queries:
+            synthetic_genie.getAA(allele, position)
+
+    benchmark(run)
+
+
+# benchmark epitope string construction
+def test_getEpitope_throughput(benchmark, synthetic_genie):
+    alleles = _sample_alleles(synthetic_genie, "DRB1")
+    positions = [9, 11, 13, 26, 28, 30, 37, 47, 57, 60, 67, 70, 71, 74, 86]
+
+    def run():
+        for allele in alleles:
+            synthetic_genie.getEpitope(allele, positions)
+
+    benchmark(run)
+
+
+# benchmark donor/recipient mismatch counting over the ARD
+def test_count_mismatches(benchmark, synthetic_genie):
+    alleles = _sample_alleles(synthetic_genie, "B", 20)
+    pairs = list(zip(alleles[0::2], alleles[1::2]))
+    ard_end = synthetic_genie.ards["B"]
+
+    def run():
+        count = 0
+        for (d1, d2), (r1, r2) in zip(pairs, pairs[1:]):
+            for position in range(1, ard_end + 1):
+                count += synthetic_genie.countAAMismatchesAllele(
+                    d1, d2, r1, r2, position
+                )
+        return count
+
+    assert benchmark(run) > 0
+
+
+# benchmark ARD mismatch counting over a cohort table with the pandas accessor
+def test_accessor_mismatch(benchmark, synthetic_genie):
+    pd = pytest.importorskip("pandas")
+    from hlagenie import accessor  # noqa: F401 - registers df.hlagenie
+
+    alleles = _sample_alleles(synthetic_genie, "B", 20)
+    cohort = pd.DataFrame(
+        [
+            (alleles[i % 20], alleles[(i * 7) % 20], alleles[(i * 3) % 20], alleles[0])
+            for i in range(5000)
+        ],
+        columns=["d1", "d2", "r1", "r2"],
+    )
+
+    counts = benchmark(
+        cohort.hlagenie.mismatch,
+        ["d1", "d2"],
+        ["r1", "r2"],
+        region="ARD",
+        genie=synthetic_genie,
+    )
+    assert counts.sum() > 0
+
+
+# benchmark ARD mismatches of full typings over every locus
+def test_genotype_mismatches(benchmark, synthetic_genie):
+    typings = []
+    for i in range(10):
+        typing = {}
+        for locus in ("A", "B", "C", "DRB1", "DQA1", "DQB1", "DPA1", "DPB1"):
+            alleles = _sample_alleles(synthetic_genie, locus, 20)
+            n = len(alleles)
+            typing[locus] = [alleles[i % n], alleles[(i * 3 + 1) % n]]
+        typings.append(typing)
+    pairs = list(zip(typings, typings[1:]))
+
+    def run():
+        return [synthetic_genie.genotypeMismatches(d, r) for d, r in pairs]
+
+    results = benchmark(run)
+    assert all(result["total"] > 0 for result in results)
+
+
+# benchmark expected mismatches of heavily ambiguous typings
+def test_ambiguous_mismatches(benchmark, synthetic_genie):
+    alleles = _sample_alleles(synthetic_genie, "B", 40)
+    donor = "/".join(alleles[:10]) + "+" + "/".join(alleles[10:20])
+    recip = "/".join(alleles[20:30]) + "+" + "/".join(alleles[30:40])
+
+    result = benchmark(synthetic_genie.ambiguousMismatches, donor, recip)
+    assert result["min"] <= result["expected"] <= result["max"]
+
+
+# benchmark eplet loads of a cohort against a library of 300 eplets
+def test_eplet_mismatches(benchmark, synthetic_genie, tmp_path):
+    alleles = _sample_alleles(synthetic_genie, "B", 50)
+    lines = []
+    for j in range(300):
+        seq = synthetic_genie.seqs[alleles[j % len(alleles)]]
+        position = j % (synthetic_genie.ards["B"] - 2) + 1
+        lines.append(f"B e{j} {position}{seq[position - 1:position + 2]}")
+    (tmp_path / "eplets.txt").write_text("\n".join(lines))
+    synthetic_genie.loadEplets(tmp_path / "eplets.txt")
+
+    n = len(alleles)
+    pairs = [
+        (
+            alleles[i % n],
+            alleles[(i * 7) % n],
+            alleles[(i * 3) % n],
+            alleles[(i * 5) % n],
+        )
+        for i in range(1000)
+    ]
+    results = benchmark(synthetic_genie.epletMismatchesBatch, pairs, names=False)
+    assert any(result["count"] for result in results)
+
+
+# benchmark codon classification of a cohort over the ARD
+def test_codon_mismatches(benchmark, synthetic_genie):
+    alleles = _sample_alleles(synthetic_genie, "A", 50)
+    n = len(alleles)
+    pairs = [
+        (
+            alleles[i % n],
+            alleles[(i * 7) % n],
+            alleles[(i * 3) % n],
+            alleles[(i * 5) % n],
+        )
+        for i in range(1000)
+    ]
+    results = benchmark(synthetic_genie.codonMismatchesBatch, pairs)
+    assert any(result["non-synonymous"] for result in results)
@@ -0,0 +1,100 @@
+import glob
+import sqlite3
+import threading
+import pytest
+from hlagenie import data_repository as dr
+from hlagenie import db
+from hlagenie.configs import config
+from .synthetic import TwoFieldReducer
+
+
+def _build(data_dir, ungap=True):
+    return dr.build_database(
+        str(data_dir), "3510", False, "nearest", ungap=ungap, ard=TwoFieldReducer()
+    )
+
+
+# test concurrent starters wait for a single build
+def test_concurrent_builds(imgt_server, tmp_path, monkeypatch):
+    builds = []
+    generate = dr.generate_ungapped_tables
+
+    def counted(*args, **kwargs):
+        builds.append(threading.get_ident())
+        return generate(*args, **kwargs)
+
+    monkeypatch.setattr(dr, "generate_ungapped_tables", counted)
+
+    paths, errors = [], []
+
+    def run():
+        try:
+            paths.append(_build(tmp_path))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(builds) == 1
+    assert len(set(paths)) == 1
+    assert db.completed_builds(paths[0]) == {"ungapped"}
+
+
+# test a failed build leaves neither a database nor a temporary file
+def test_failed_build(imgt_server, tmp_path, monkeypatch):
+    def crash(conn):
+        raise RuntimeError("crashed mid-build")
+
+    monkeypatch.setattr(dr, "generate_ungapped_mature_tables", crash)
+    with pytest.raises(RuntimeError):
+        _build(tmp_path)
+    assert glob.glob(f"{tmp_path}/*.db") == []
+    assert glob.glob(f"{tmp_path}/*.tmp") == []
+
+    monkeypatch.undo()
+    path = _build(tmp_path)
+    assert db.completed_builds(path) == {"ungapped"}
+
+
+# test building the other mode keeps the tables already built
+def test_second_mode(imgt_server, tmp_path):
+    path = _build(tmp_path)
+    assert _build(tmp_path, ungap=False) == path
+    assert db.completed_builds(path) == {"ungapped", "gapped"}
+
+    conn = db.create_db_connection(
+        str(tmp_path), "3510", False, "nearest", read_only=True
+    )
+    try:
+        for mode in ("ungapped", "gapped"):
+            assert db.load_sequences(conn, f"{mode}_mature", "A")
+            assert db.load_allele_list(conn, f"{mode}_A_completed_prot")
+            assert set(db.load_region_ends(conn, f"{mode}_ard")) == set(config["loci"])
+    finally:
+        conn.close()
+
+
+# test a database of an older layout is rebuilt rather than trusted
+def test_old_layout(imgt_server, tmp_path):
+    path = db.db_filename(str(tmp_path), "3510", False, "nearest")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE builds (mode TEXT PRIMARY KEY)")
+    conn.execute("INSERT INTO builds VALUES ('ungapped')")
+    conn.commit()
+    conn.close()
+    assert db.completed_builds(path) == set()
+
+    assert _build(tmp_path) == path
+    assert db.completed_builds(path) == {"ungapped"}
+
+
+# test opening a missing database read-only fails instead of creating it
+def test_read_only_missing(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        db.create_db_connection(str(tmp_path), "3510", False, "nearest", read_only=True)
+    assert glob.glob(f"{tmp_path}/*") == []
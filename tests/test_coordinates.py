@@ -0,0 +1,200 @@
+import pytest
+import hlagenie
+from hlagenie.configs import config
+from hlagenie.coordinates import (
+    CODON_TABLE,
+    translate,
+    translate_sequence,
+    two_field_name,
+)
+from hlagenie.smart_sort import smart_sort
+from .synthetic import CODONS, TwoFieldReducer
+
+TRANSLATE = {codon: residue for residue, codons in CODONS.items() for codon in codons}
+
+
+def _check_codons(genie, locus):
+    ref_allele = config["refseq"][locus]
+    seq = genie.seqs[ref_allele]
+    codons = genie.codonBatch([ref_allele] * len(seq), range(1, len(seq) + 1))
+    assert [TRANSLATE[codon] for codon in codons] == list(seq.replace("-", ""))
+
+
+# test each codon of the reference translates to the residue at its position
+def test_codons(synthetic_genie):
+    for locus in ("A", "DRB1", "DRB4"):
+        _check_codons(synthetic_genie, locus)
+
+    # a two-field allele uses its lowest full name
+    allele = next(
+        a for a in synthetic_genie.seqs if a.startswith("B*") and a[-1] != "N"
+    )
+    full_name = synthetic_genie.coordinates.nuc_allele(allele)
+    assert full_name.startswith(allele + ":")
+    assert synthetic_genie.codon(allele, 5) == synthetic_genie.codon(full_name, 5)
+
+    # a three-field name without a coding sequence of its own resolves the same
+    three_field = f"{allele}:99"
+    assert synthetic_genie.coordinates.nuc_allele(three_field) == full_name
+    with pytest.raises(ValueError, match="B\\*99:99"):
+        synthetic_genie.codon("B*99:99", 5)
+
+
+# test the index also holds over the gapped alignments
+def test_gapped_codons(synthetic_data_dir):
+    genie = hlagenie.init(
+        "3510", data_dir=synthetic_data_dir, ungap=False, ard=TwoFieldReducer()
+    )
+    ref_allele = config["refseq"]["A"]
+    seq = genie.seqs[ref_allele]
+    for position, residue in enumerate(seq, 1):
+        codon = genie.codon(ref_allele, position)
+        assert (codon is None) == (residue == "-")
+        assert codon is None or TRANSLATE[codon] == residue
+
+
+# test alleles carrying an insertion read codons in their own coordinates
+def test_insertion_codons(synthetic_genie):
+    coordinates = synthetic_genie.coordinates
+    inserted = [
+        full_name
+        for full_name, seq in synthetic_genie.nuc_seqs.items()
+        if len(seq) != coordinates.lengths[full_name.split("*")[0]]
+    ]
+    assert inserted
+    for full_name in inserted:
+        translated = synthetic_genie.getTranslated(full_name)
+        positions = range(1, len(translated) + 1)
+        coded, codons = coordinates.codons_at(full_name, positions)
+        assert list(coded) == list(positions)
+        assert [translate(codon) or "*" for codon in codons] == [
+            residue if residue in CODON_TABLE.values() else "*"
+            for residue in translated
+        ]
+        assert synthetic_genie.codon(full_name, len(translated)) == codons[-1]
+
+        # the last base maps back to the last position
+        nuc_position = len(synthetic_genie.nuc_seqs[full_name])
+        assert coordinates.residue_position(full_name, nuc_position) == (
+            len(translated),
+            3,
+        )
+
+
+# test nucleotide positions map back to their residue
+def test_aa_for_nuc(synthetic_genie):
+    locus = "C"
+    ref_allele = config["refseq"][locus]
+    ref_full = config["refseq_full"][locus]
+    leader = len(synthetic_genie.full_seqs[ref_allele]) - len(
+        synthetic_genie.seqs[ref_allele]
+    )
+
+    # the leader is outside the mature protein
+    assert synthetic_genie.aaForNuc(ref_allele, 1) is None
+    first = 3 * leader + 1
+    assert synthetic_genie.aaForNuc(ref_allele, first) == (
+        1,
+        1,
+        synthetic_genie.seqs[ref_allele][0],
+    )
+
+    positions = list(range(first, first + 30))
+    results = synthetic_genie.aaForNucBatch([ref_full] * 30, positions)
+    assert [result[:2] for result in results] == [
+        (1 + i // 3, 1 + i % 3) for i in range(30)
+    ]
+    assert all(
+        synthetic_genie.codon(ref_allele, position)[offset - 1]
+        == synthetic_genie.nuc_seqs[ref_full][nuc_position - 1]
+        for (position, offset, _), nuc_position in zip(results, positions)
+    )
+
+
+# test the compiled codon table agrees with the codons of the synthetic release
+def test_codon_table():
+    assert len(CODON_TABLE) == 64
+    assert all(CODON_TABLE[codon] == residue for codon, residue in TRANSLATE.items())
+    assert translate("A-G") is None
+
+
+# test codons coding different amino acids are non-synonymous and the others synonymous
+def test_codon_mismatches(synthetic_genie):
+    ard = synthetic_genie.ards["A"]
+    alleles = [
+        allele
+        for allele in smart_sort(a for a in synthetic_genie.seqs if a.startswith("A*"))
+        if "-" not in synthetic_genie.seqs[allele][:ard]
+        and "-"
+        not in "".join(
+            synthetic_genie.coordinates.codons_at(allele, range(1, ard + 1))[1]
+        )
+    ]
+    donor, recip = alleles[1], alleles[2]
+    result = synthetic_genie.codonMismatches(donor, donor, recip, recip)
+
+    differing = [
+        position
+        for position in range(1, ard + 1)
+        if synthetic_genie.getAA(donor, position)
+        != synthetic_genie.getAA(recip, position)
+    ]
+    by_type = {}
+    for codon in result["codons"]:
+        by_type.setdefault(codon["type"], []).append(codon["position"])
+    assert by_type["non-synonymous"] == differing
+    assert result["non-synonymous"] == len(differing)
+    assert result["unknown"] == 0
+    assert result["nucleotide_differences"] == sum(
+        c["differences"] for c in result["codons"]
+    )
+    assert all(
+        translate(c["donor"]) == translate(c["recipient"])
+        for c in result["codons"]
+        if c["type"] == "synonymous"
+    )
+
+    # full names of one two-field allele only differ by synonymous codons,
+    # unless one carries an insertion shifting its positions
+    ref_lengths = {
+        locus: len(synthetic_genie.nuc_seqs[full_name])
+        for locus, full_name in config["refseq_full"].items()
+    }
+    full_names = {}
+    for full_name, seq in synthetic_genie.nuc_seqs.items():
+        if len(seq) == ref_lengths[full_name.split("*")[0]]:
+            full_names.setdefault(two_field_name(full_name), []).append(full_name)
+    pairs = [names[:2] for names in full_names.values() if len(names) > 1]
+    results = synthetic_genie.codonMismatchesBatch(
+        [(a, a, b, b) for a, b in pairs], region="mature"
+    )
+    assert len(results) == len(pairs)
+    assert all(result["non-synonymous"] == 0 for result in results)
+    assert any(result["synonymous"] for result in results)
+
+
+# test translations through the byte lookup table
+def test_translate_sequence():
+    assert translate_sequence("ATGGCC---A-GTAAnnnTG") == "MA-*X*"
+
+
+# test the translated tables built with the database agree with the protein alignments
+def test_translated_tables(synthetic_genie):
+    for locus in ("A", "DRB1", "DQB1"):
+        ref_allele = config["refseq"][locus]
+        translated = synthetic_genie.getTranslated(config["refseq_full"][locus])
+        assert translated == synthetic_genie.seqs[ref_allele]
+        assert synthetic_genie.getTranslated(ref_allele) == translated
+
+    discrepancies = synthetic_genie.listDiscrepancies()
+    for discrepancy in discrepancies[:50]:
+        allele, position = discrepancy["allele"], discrepancy["position"]
+        assert synthetic_genie.getTranslatedAA(allele, position) == (
+            discrepancy["translated"]
+        )
+        assert synthetic_genie.getAA(two_field_name(allele), position) == (
+            discrepancy["protein"]
+        )
+    assert all(
+        d["allele"].startswith("B*") for d in synthetic_genie.listDiscrepancies("B")
+    )
@@ -0,0 +1,71 @@
+import random
+import pytest
+from hlagenie.eplets import parse_definition, read_library
+
+
+def test_parse_definition():
+    assert parse_definition("44R_45M") == ((44, "R"), (45, "M"))
+    assert parse_definition("62GE") == ((62, "G"), (63, "E"))
+    with pytest.raises(ValueError):
+        parse_definition("GE62")
+
+
+def _write_library(genie, path, locus, count=40):
+    """Write a library of eplets taken from random alleles of a locus"""
+    rng = random.Random(7)
+    alleles = sorted(a for a in genie.seqs if a.startswith(f"{locus}*"))
+    lines = ["# synthetic eplets"]
+    definitions = {}
+    for j in range(count):
+        seq = genie.seqs[rng.choice(alleles)]
+        positions = sorted(rng.sample(range(1, genie.ards[locus] + 1), 2))
+        definition = "_".join(f"{p}{seq[p - 1]}" for p in positions)
+        name = f"e{j}"
+        lines.append(f"{locus}\t{name}\t{definition}")
+        definitions[name] = positions, [seq[p - 1] for p in positions]
+    path.write_text("\n".join(lines) + "\n")
+    return definitions
+
+
+def _carries(seq, definition):
+    positions, residues = definition
+    return all(seq[p - 1] == r for p, r in zip(positions, residues))
+
+
+# test eplet mismatches match a per-position string comparison
+def test_eplet_mismatches(synthetic_genie, tmp_path):
+    definitions = _write_library(synthetic_genie, tmp_path / "eplets.txt", "B")
+    synthetic_genie.loadEplets(tmp_path / "eplets.txt")
+
+    alleles = sorted(a for a in synthetic_genie.seqs if a.startswith("B*"))
+    pairs = [
+        tuple(alleles[(i * 3 + k) % len(alleles)] for k in range(4)) for i in range(10)
+    ]
+    results = synthetic_genie.epletMismatchesBatch(pairs)
+    for pair, result in zip(pairs, results):
+        seqs = [synthetic_genie.seqs[a] for a in pair]
+        expected = [
+            name
+            for name, definition in definitions.items()
+            if any(_carries(seq, definition) for seq in seqs[:2])
+            and not any(_carries(seq, definition) for seq in seqs[2:])
+        ]
+        assert result == {"count": len(expected), "eplets": expected}
+        assert result == synthetic_genie.epletMismatches(*pair)
+
+    assert synthetic_genie.getEplets(alleles[0]) == [
+        name
+        for name, definition in definitions.items()
+        if _carries(synthetic_genie.seqs[alleles[0]], definition)
+    ]
+
+    d1, d2, r1, r2 = pairs[0]
+    typing = synthetic_genie.genotypeEpletMismatches({"B": [d1, d2]}, {"B": [r1, r2]})
+    assert typing["total"] == results[0]["count"]
+
+
+def test_read_library_errors(tmp_path):
+    path = tmp_path / "bad.txt"
+    path.write_text("Q 62GE\n")
+    with pytest.raises(ValueError):
+        read_library(path)
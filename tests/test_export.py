@@ -0,0 +1,61 @@
+import json
+import pytest
+import hlagenie
+from hlagenie.configs import config
+
+pa = pytest.importorskip("pyarrow")
+
+
+@pytest.fixture(scope="module", params=["parquet", "arrow"])
+def bundle(request, synthetic_genie, tmp_path_factory):
+    path = tmp_path_factory.mktemp(f"bundle-{request.param}")
+    synthetic_genie.export(path, format=request.param)
+    return path
+
+
+# test a GENIE loaded from a bundle answers like the one it was exported from
+def test_round_trip(bundle, synthetic_genie):
+    genie = hlagenie.init(from_parquet=bundle)
+    assert genie.imgt_version == synthetic_genie.imgt_version
+    assert genie.db_connection is None
+
+    assert set(genie.seqs) == set(synthetic_genie.seqs)
+    for allele in list(synthetic_genie.seqs)[::25]:
+        assert genie.seqs[allele] == synthetic_genie.seqs[allele]
+        assert genie.getARD(allele) == synthetic_genie.getARD(allele)
+        assert genie.getAA(allele, 10) == synthetic_genie.getAA(allele, 10)
+    for allele in list(synthetic_genie.nuc_seqs)[::25]:
+        assert genie.nuc_seqs[allele] == synthetic_genie.nuc_seqs[allele]
+
+    for locus in config["loci"]:
+        for seqtype in ("prot", "nuc"):
+            assert sorted(genie.listCompletes(locus, seqtype)) == sorted(
+                synthetic_genie.listCompletes(locus, seqtype)
+            )
+            assert sorted(genie.listIncompletes(locus, seqtype)) == sorted(
+                synthetic_genie.listIncompletes(locus, seqtype)
+            )
+
+
+# test the bundle is a Hive partitioned dataset with a manifest
+def test_layout(bundle, synthetic_genie):
+    import pyarrow.dataset as ds
+
+    manifest = json.loads((bundle / "manifest.json").read_text())
+    format = manifest["format"]
+    assert manifest["imgt_version"] == synthetic_genie.imgt_version
+
+    dataset = ds.dataset(
+        bundle / "mature",
+        format="ipc" if format == "arrow" else format,
+        partitioning="hive",
+    )
+    table = dataset.to_table()
+    assert table.num_rows == len(synthetic_genie.seqs)
+    assert set(table.column("locus").to_pylist()) == set(config["loci"])
+
+
+# test loading a directory that is not a bundle fails clearly
+def test_not_a_bundle(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        hlagenie.init(from_parquet=tmp_path)
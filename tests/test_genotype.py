@@ -0,0 +1,206 @@
+import pytest
+import hlagenie
+from hlagenie import genotype
+from hlagenie.configs import config
+from hlagenie.residues import bitplanes, mask_positions, positions_mask
+from .synthetic import TwoFieldReducer
+
+
+def _alleles(genie, locus, n):
+    return sorted(a for a in genie.seqs if a.startswith(f"{locus}*") and a[-1] != "N")[
+        :n
+    ]
+
+
+@pytest.fixture(scope="module")
+def typings(synthetic_genie):
+    a = _alleles(synthetic_genie, "A", 4)
+    b = _alleles(synthetic_genie, "B", 4)
+    drb3 = _alleles(synthetic_genie, "DRB3", 2)
+    drb4 = _alleles(synthetic_genie, "DRB4", 1)
+    donor = f"{a[0]}+{a[1]}^{b[0]}+{b[0]}^{drb3[0]}+{drb4[0]}"
+    recip = {"A": [a[2], a[3]], "B": f"{b[1]}+{b[2]}", "DRB3": [drb3[1]]}
+    return donor, recip
+
+
+def test_bitplanes():
+    planes = bitplanes("ABAC")
+    assert mask_positions(planes["A"]) == [1, 3]
+    assert planes["C"] == positions_mask([4])
+
+
+def test_parse_typing():
+    parsed = genotype.parse_typing("A*01:01+A*02:01^DRB3*01:01+DRB4*01:01")
+    assert parsed == {
+        "A": ["A*01:01", "A*02:01"],
+        "DRB3": ["DRB3*01:01"],
+        "DRB4": ["DRB4*01:01"],
+    }
+    with pytest.raises(ValueError):
+        genotype.parse_typing({"A": ["B*07:02"]})
+    with pytest.raises(ValueError):
+        genotype.parse_typing("A*01:01/A*01:02+A*02:01")
+    with pytest.raises(ValueError):
+        genotype.parse_typing({"A": ["A*01:01", "A*02:01", "A*03:01"]})
+
+
+# test per-locus counts match summing countAAMismatchesAllele
+def test_matches_allele_counts(synthetic_genie, typings):
+    donor, recip = typings
+    result = synthetic_genie.genotypeMismatches(donor, recip, region="ARD")
+
+    for locus in ("A", "B"):
+        d1, d2 = genotype.parse_typing(donor)[locus]
+        r1, r2 = genotype.parse_typing(recip)[locus]
+        per_position = {
+            position: synthetic_genie.countAAMismatchesAllele(d1, d2, r1, r2, position)
+            for position in range(1, synthetic_genie.ards[locus] + 1)
+        }
+        assert result["loci"][locus]["count"] == sum(per_position.values())
+        assert result["loci"][locus]["positions"] == {
+            p: mm for p, mm in per_position.items() if mm
+        }
+
+    assert result["total"] == sum(c["count"] for c in result["loci"].values())
+
+
+# test absent DRB3/4/5 are not carried, while absent standard loci are errors
+def test_absent_drb345(synthetic_genie, typings):
+    donor, recip = typings
+    result = synthetic_genie.genotypeMismatches(donor, recip, region="ARD")
+
+    # the donor DRB4 allele is foreign to a recipient without DRB4
+    assert result["loci"]["DRB4"]["count"] == synthetic_genie.ards["DRB4"]
+    # a donor without DRB4 presents nothing to a recipient carrying it
+    reverse = synthetic_genie.genotypeMismatches(recip, donor, region="ARD")
+    assert "DRB4" in reverse["loci"] and reverse["loci"]["DRB4"]["count"] == 0
+
+    with pytest.raises(ValueError):
+        synthetic_genie.genotypeMismatches(donor, {"A": recip["A"]})
+
+
+# test the batch gives the same results as single calls
+def test_batch(synthetic_genie, typings):
+    donor, recip = typings
+    pairs = [(donor, recip), (recip, donor), (donor, recip)]
+    batch = synthetic_genie.genotypeMismatchesBatch(pairs, region=[9, 45, 62])
+    for (d, r), result in zip(pairs, batch):
+        assert result == synthetic_genie.genotypeMismatches(d, r, region=[9, 45, 62])
+
+
+# test batches fanned out per locus match the serial counts
+def test_parallel_batch(synthetic_genie, typings, monkeypatch):
+    donor, recip = typings
+    pairs = [(donor, recip), (recip, donor)] * 3
+    serial = synthetic_genie.genotypeMismatchesBatch(pairs, workers=1)
+    monkeypatch.setitem(config, "parallel_batch_size", 1)
+    assert synthetic_genie.genotypeMismatchesBatch(pairs, workers=4) == serial
+
+
+# test batches count without caching comparisons when there is no cache
+def test_batch_without_cache(synthetic_genie, typings):
+    genie = hlagenie.init(
+        "3510",
+        data_dir=synthetic_genie._data_dir,
+        ard=TwoFieldReducer(),
+        cache_size=0,
+    )
+    donor, recip = typings
+    pairs = [(donor, recip), (recip, donor), (donor, recip)]
+    assert genie.genotypeMismatchesBatch(pairs) == (
+        synthetic_genie.genotypeMismatchesBatch(pairs)
+    )
+
+
+class MACReducer(TwoFieldReducer):
+    """Stand-in for py-ard knowing a single MAC code"""
+
+    def __init__(self, alleles):
+        self.alleles = alleles
+
+    def is_mac(self, allele):
+        return allele == "A*01:AB"
+
+    def expand_mac(self, allele):
+        return "/".join(self.alleles)
+
+
+# test ambiguous typings summarize every candidate combination
+def test_ambiguous(synthetic_genie):
+    a = _alleles(synthetic_genie, "A", 5)
+    donor = f"{a[0]}/{a[1]}+{a[2]}"
+    recip = f"{a[3]}+{a[4]}|{a[3]}+{a[3]}"
+
+    counts = [
+        synthetic_genie.genotypeMismatches(f"{d}+{a[2]}", r)["total"]
+        for d in (a[0], a[1])
+        for r in (f"{a[3]}+{a[4]}", f"{a[3]}+{a[3]}")
+    ]
+    result = synthetic_genie.ambiguousMismatches(donor, recip)
+    assert result["min"] == min(counts)
+    assert result["max"] == max(counts)
+    assert result["expected"] == pytest.approx(sum(counts) / 4)
+    assert result["loci"]["A"]["candidates"] == 4
+
+    # only the first donor allele has a frequency, so only its genotypes count
+    weighted = synthetic_genie.ambiguousMismatches(
+        donor, recip, frequencies={a[0]: 0.1, a[2]: 0.2, a[3]: 0.3, a[4]: 0.1}
+    )
+    expected = (counts[0] * 2 * 0.03 + counts[1] * 0.09) / (2 * 0.03 + 0.09)
+    assert weighted["expected"] == pytest.approx(expected)
+
+
+# test a heterozygous donor is not merged into a homozygous one when its
+# alleles have identical sequences
+def test_ambiguous_identical_alleles(synthetic_genie):
+    by_seq = {}
+    for allele in _alleles(synthetic_genie, "A", len(synthetic_genie.seqs)):
+        by_seq.setdefault(synthetic_genie.seqs[allele], []).append(allele)
+    same = next(alleles for alleles in by_seq.values() if len(alleles) > 1)
+    a = _alleles(synthetic_genie, "A", 2)
+
+    donor, recip = f"{same[0]}+{same[1]}", f"{a[0]}+{a[1]}"
+    expected = synthetic_genie.genotypeMismatches(donor, recip)["total"]
+    assert expected > 0
+    result = synthetic_genie.ambiguousMismatches(donor, recip)
+    assert result["min"] == result["max"] == expected
+
+
+# test MAC codes are expanded with py-ard
+def test_ambiguous_mac(synthetic_genie):
+    a = _alleles(synthetic_genie, "A", 4)
+    genie = hlagenie.init(
+        "3510", data_dir=synthetic_genie._data_dir, ard=MACReducer(a[:2])
+    )
+    by_mac = genie.ambiguousMismatches(f"A*01:AB+{a[2]}", f"{a[3]}+{a[3]}")
+    by_gl = genie.ambiguousMismatches(f"{a[0]}/{a[1]}+{a[2]}", f"{a[3]}+{a[3]}")
+    assert by_mac == by_gl
+
+
+# test both directions match countAAMismatchesAllele with the roles swapped
+def test_directional(synthetic_genie):
+    d1, d2, r1, r2 = _alleles(synthetic_genie, "B", 4)
+    result = synthetic_genie.directionalMismatches(d1, d2, r1, r2, as_bool=True)
+    for position, hvg, gvh in zip(result["positions"], result["hvg"], result["gvh"]):
+        assert hvg == bool(
+            synthetic_genie.countAAMismatchesAllele(d1, d2, r1, r2, position)
+        )
+        assert gvh == bool(
+            synthetic_genie.countAAMismatchesAllele(r1, r2, d1, d2, position)
+        )
+
+    ard = synthetic_genie.ards["B"]
+    masks = synthetic_genie.directionalMismatches(d1, d2, r1, r2)
+    assert masks["hvg_count"] == sum(
+        synthetic_genie.countAAMismatchesAllele(d1, d2, r1, r2, p)
+        for p in range(1, ard + 1)
+    )
+    assert masks["gvh"] == positions_mask(
+        [p for p, gvh in zip(result["positions"], result["gvh"]) if gvh]
+    )
+
+    batch = synthetic_genie.directionalMismatchesBatch(
+        [(d1, d2, r1, r2), (r1, r2, d1, d2)]
+    )
+    assert batch[0] == masks
+    assert batch[1]["hvg"] == masks["gvh"] and batch[1]["gvh"] == masks["hvg"]
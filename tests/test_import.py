@@ -0,0 +1,61 @@
+import subprocess
+import sys
+from hlagenie import db
+
+# modules that should only be imported when building a database or using an
+# optional feature
+HEAVY_MODULES = ["Bio", "requests", "urllib3", "pyard", "pandas", "pyarrow"]
+
+# hlagenie modules only imported by the features that need them
+DEFERRED_MODULES = ["hlagenie.export", "hlagenie.shared", "hlagenie.accessor"]
+
+
+def _run(code: str) -> str:
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip()
+
+
+def _loaded_heavy_modules(code: str) -> list[str]:
+    check = (
+        f"import sys\n{code}\nprint([m for m in {HEAVY_MODULES!r} if m in sys.modules])"
+    )
+    # the loaded modules are reported on the last line of output
+    return eval(_run(check).splitlines()[-1])
+
+
+def _make_prebuilt_db(data_dir):
+    # a cache containing every table the ungapped GENIE loads at init
+    conn = db.create_db_connection(data_dir, "3510", False, "nearest")
+    db.create_schema(conn)
+    db.save_region_ends(conn, "ungapped_ard", {"A": 182})
+    db.save_region_ends(conn, "ungapped_xrd", {"A": 274})
+    db.mark_build_complete(conn, "ungapped")
+    conn.commit()
+    conn.close()
+
+
+# test importing the package does not pull in build-only dependencies
+def test_import_is_light():
+    assert _loaded_heavy_modules("import hlagenie, hlagenie.genie") == []
+
+
+# test opening an existing cache does not pull in build-only dependencies
+def test_open_cache_is_light(tmp_path):
+    _make_prebuilt_db(tmp_path)
+    code = f"import hlagenie\ngenie = hlagenie.init('3510', data_dir={str(tmp_path)!r})"
+    assert _loaded_heavy_modules(code) == []
+
+
+# test the package itself only loads its configuration until GENIE is needed
+def test_deferred_modules():
+    code = (
+        "import sys, hlagenie\n"
+        "print(sorted(m for m in sys.modules if m.startswith('hlagenie')))\n"
+        "import hlagenie.genie\n"
+        f"print([m for m in {DEFERRED_MODULES!r} if m in sys.modules])"
+    )
+    package, deferred = _run(code).splitlines()[-2:]
+    assert eval(package) == ["hlagenie", "hlagenie.configs"]
+    assert eval(deferred) == []
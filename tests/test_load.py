@@ -0,0 +1,211 @@
+import http.server
+import json
+import os
+import threading
+import time
+import pytest
+import requests
+from hlagenie import load
+from hlagenie.configs import config
+
+CONTENT = b"".join(f"line {i}\n".encode() for i in range(5000))
+ETAG = '"v1"'
+# a newer release of the file, whose first download is cut off halfway
+CHANGED = CONTENT.replace(b"line", b"LINE")
+CHANGED_ETAG = '"v2"'
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """Stand-in for raw.githubusercontent.com supporting ETags and ranges"""
+
+    # number of requests per path
+    hits = {}
+    # number of requests to fail with 503 before answering /flaky
+    flaky_failures = 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        hits = StandInHandler.hits
+        hits[self.path] = hits.get(self.path, 0) + 1
+
+        if self.path == "/Latest/release_version.txt":
+            body = b"# file: release_version.txt\n# version: IPD-IMGT/HLA 3.52.0\n"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.path == "/missing":
+            self.send_error(404)
+            return
+        if self.path == "/flaky" and hits[self.path] <= self.flaky_failures:
+            self.send_error(503)
+            return
+        content, etag = CONTENT, ETAG
+        if self.path == "/changed":
+            content, etag = CHANGED, CHANGED_ETAG
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body, status = content, 200
+        byte_range = self.headers.get("Range")
+        if byte_range and self.headers.get("If-Range") == etag:
+            start = int(byte_range.split("=")[1].rstrip("-"))
+            body, status = content[start:], 206
+
+        self.send_response(status)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.path == "/changed" and hits[self.path] == 1:
+            # close the connection before the whole body is sent
+            self.wfile.write(body[: len(body) // 2])
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    # retry immediately and build a session with the patched settings
+    monkeypatch.setitem(config, "download_backoff", 0)
+    monkeypatch.setattr(load, "_session", None)
+    StandInHandler.hits.clear()
+
+
+# test a download is revalidated with its ETag instead of fetched again
+def test_download_and_revalidate(server, tmp_path):
+    path = tmp_path / "A_prot.msf"
+    load.download_file(f"{server}/file", path)
+    assert path.read_bytes() == CONTENT
+
+    load.download_file(f"{server}/file", path)
+    assert path.read_bytes() == CONTENT
+    assert StandInHandler.hits["/file"] == 2
+
+
+# test an interrupted download resumes from the partial file
+def test_resume(server, tmp_path):
+    path = tmp_path / "A_prot.msf"
+    path.with_name("A_prot.msf.part").write_bytes(CONTENT[:1000])
+    path.with_name("A_prot.msf.part.meta").write_text(json.dumps({"etag": ETAG}))
+
+    load.download_file(f"{server}/file", path)
+    assert path.read_bytes() == CONTENT
+    assert json.loads(path.with_name("A_prot.msf.meta").read_text())["etag"] == ETAG
+
+
+# test an interrupted refresh of a changed file is resumed rather than
+# revalidated against the validators of the unfinished download
+def test_interrupted_refresh(server, tmp_path, monkeypatch):
+    path = tmp_path / "A_prot.msf"
+    meta_path = path.with_name("A_prot.msf.meta")
+    path.write_bytes(CONTENT)
+    meta_path.write_text(json.dumps({"etag": ETAG}))
+
+    monkeypatch.setitem(config, "download_retries", 0)
+    with pytest.raises(requests.RequestException):
+        load.download_file(f"{server}/changed", path)
+    assert path.read_bytes() == CONTENT
+    assert json.loads(meta_path.read_text())["etag"] == ETAG
+
+    load.download_file(f"{server}/changed", path)
+    assert path.read_bytes() == CHANGED
+    assert json.loads(meta_path.read_text())["etag"] == CHANGED_ETAG
+    assert StandInHandler.hits["/changed"] == 2
+
+
+# test transient server errors are retried
+def test_retry(server, tmp_path):
+    path = tmp_path / "A_prot.msf"
+    load.download_file(f"{server}/flaky", path)
+    assert path.read_bytes() == CONTENT
+    assert StandInHandler.hits["/flaky"] == 2
+
+
+# test error responses are raised rather than written to the file
+def test_status_check(server, tmp_path):
+    path = tmp_path / "A_prot.msf"
+    with pytest.raises(requests.HTTPError):
+        load.download_file(f"{server}/missing", path)
+    assert not path.exists()
+
+
+# test all loci are fetched with DRB3/4/5 sharing one file
+def test_download_alignments(server, tmp_path, monkeypatch):
+    monkeypatch.setitem(config, "imgt_hla_url", server)
+    paths = load.download_alignments(
+        "3510", config["loci"], "prot", False, "nearest", tmp_path
+    )
+    assert set(paths) == set(config["loci"])
+    assert paths["DRB3"] == paths["DRB4"] == paths["DRB5"]
+    assert paths["DRB3"].name == "DRB345_prot.msf"
+    assert sum(StandInHandler.hits.values()) == len(set(paths.values()))
+
+
+# nothing listens on this port, so requests to it fail straight away
+OFFLINE_URL = "http://127.0.0.1:9"
+
+
+# test the latest version is fetched once and then read from the data dir
+def test_latest_version_cached(server, tmp_path, monkeypatch):
+    monkeypatch.setitem(config, "imgt_hla_url", server)
+    assert load.load_latest_version(tmp_path) == "3520"
+
+    monkeypatch.setitem(config, "imgt_hla_url", OFFLINE_URL)
+    assert load.load_latest_version(tmp_path) == "3520"
+    assert StandInHandler.hits["/Latest/release_version.txt"] == 1
+
+
+# test an expired cached version is refreshed
+def test_latest_version_expired(server, tmp_path, monkeypatch):
+    (tmp_path / "latest_version.txt").write_text("3500")
+    monkeypatch.setitem(config, "imgt_hla_url", server)
+    assert load.load_latest_version(tmp_path, ttl=0) == "3520"
+    assert (tmp_path / "latest_version.txt").read_text() == "3520"
+
+
+# test the expired cached version is used when GitHub cannot be reached, and
+# trusted again for the ttl so later startups do not wait on GitHub
+def test_latest_version_offline(tmp_path, monkeypatch):
+    cache_path = tmp_path / "latest_version.txt"
+    cache_path.write_text("3500")
+    monkeypatch.setitem(config, "imgt_hla_url", OFFLINE_URL)
+    assert load.load_latest_version(tmp_path, ttl=0) == "3500"
+
+    expired = time.time() - 120
+    os.utime(cache_path, (expired, expired))
+    assert load.load_latest_version(tmp_path, ttl=60) == "3500"
+    assert cache_path.stat().st_mtime > expired + 60
+
+    fetches = []
+    monkeypatch.setattr(load, "_fetch_latest_version", lambda: fetches.append(1))
+    assert load.load_latest_version(tmp_path, ttl=60) == "3500"
+    assert fetches == []
+
+
+# test the newest built database is used when offline with no cached version
+def test_latest_version_local_database(tmp_path, monkeypatch):
+    monkeypatch.setitem(config, "imgt_hla_url", OFFLINE_URL)
+    (tmp_path / "hlagenie-3490.db").touch()
+    (tmp_path / "hlagenie-3510-imputed-nearest.db").touch()
+    assert load.load_latest_version(tmp_path) == "3510"
+
+    for db_path in tmp_path.glob("*.db"):
+        db_path.unlink()
+    (tmp_path / "latest_version.txt").unlink()
+    with pytest.raises(SystemExit):
+        load.load_latest_version(tmp_path)
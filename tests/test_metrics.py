@@ -0,0 +1,87 @@
+import pytest
+import hlagenie
+from hlagenie import metrics
+from .synthetic import TwoFieldReducer
+
+
+@pytest.fixture
+def recording():
+    metrics.reset()
+    metrics.enable()
+    yield
+    metrics.disable()
+    metrics.reset()
+
+
+# test query calls are counted and timed per method
+def test_query_metrics(recording, synthetic_genie):
+    synthetic_genie.getAA("A*01:01", 1)
+    synthetic_genie.getAA("A*01:01", 2)
+    synthetic_genie.getARD("A*01:01")
+
+    histograms = metrics.snapshot()["histograms"]
+    assert histograms[("call_seconds", (("method", "getAA"),))]["count"] == 2
+    assert histograms[("call_seconds", (("method", "getARD"),))]["count"] == 1
+
+
+# test redux cache hits and misses are counted
+def test_redux_cache_metrics(recording, synthetic_genie):
+    synthetic_genie.getAA("A*01:01:01:01", 1)
+    synthetic_genie.getAA("A*01:01:01:01", 1)
+
+    counters = metrics.snapshot()["counters"]
+    assert counters[("redux_cache_hits", ())] >= 1
+
+
+# test reductions are not cached without a cache
+def test_redux_without_cache(recording, synthetic_data_dir):
+    genie = hlagenie.init(
+        "3510", data_dir=synthetic_data_dir, ard=TwoFieldReducer(), cache_size=0
+    )
+    assert genie.getAA("A*01:01:01:01", 1) == genie.getAA("A*01:01:01:01", 1)
+
+    counters = metrics.snapshot()["counters"]
+    assert counters[("redux_cache_misses", ())] == 2
+    assert ("redux_cache_hits", ()) not in counters
+
+
+# test build stages are reported to hooks
+def test_build_hooks(recording, imgt_server, tmp_path):
+    seen = set()
+
+    def hook(name, value, labels):
+        seen.add(name)
+
+    metrics.add_hook(hook)
+    try:
+        hlagenie.init("3510", data_dir=str(tmp_path), ard=TwoFieldReducer())
+    finally:
+        metrics.remove_hook(hook)
+
+    assert {
+        "download_bytes",
+        "download_seconds",
+        "parse_seconds",
+        "gap_strip_seconds",
+        "sqlite_write_seconds",
+    } <= seen
+
+
+# test export in the Prometheus text format
+def test_to_prometheus(recording):
+    metrics.inc("download_bytes", 10, locus="A", kind="prot")
+    metrics.observe("call_seconds", 0.00002, method="getAA")
+
+    text = metrics.to_prometheus()
+    assert "# TYPE hlagenie_download_bytes_total counter" in text
+    assert 'hlagenie_download_bytes_total{kind="prot",locus="A"} 10' in text
+    assert 'hlagenie_call_seconds_bucket{method="getAA",le="1e-05"} 0' in text
+    assert 'hlagenie_call_seconds_bucket{method="getAA",le="5e-05"} 1' in text
+    assert 'hlagenie_call_seconds_count{method="getAA"} 1' in text
+
+
+# test nothing is recorded while disabled
+def test_disabled(synthetic_genie):
+    metrics.reset()
+    synthetic_genie.getAA("A*01:01", 1)
+    assert metrics.snapshot() == {"counters": {}, "histograms": {}}
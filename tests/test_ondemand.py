@@ -0,0 +1,74 @@
+import pytest
+import hlagenie
+from hlagenie.ondemand import SQLiteSeqs
+from .synthetic import TwoFieldReducer
+
+
+@pytest.fixture(scope="module")
+def on_demand_genie(synthetic_data_dir):
+    return hlagenie.init(
+        "3510",
+        data_dir=synthetic_data_dir,
+        ard=TwoFieldReducer(),
+        cache_size=8,
+        on_demand=True,
+    )
+
+
+# test lookups answered in SQL agree with the in-memory tables
+def test_lookups(on_demand_genie, synthetic_genie):
+    assert isinstance(on_demand_genie.seqs, SQLiteSeqs)
+    alleles = sorted(a for a in synthetic_genie.seqs if a.startswith("B*"))[:10]
+    for allele in alleles:
+        length = len(synthetic_genie.seqs[allele])
+        for method, args in (
+            ("getAA", [allele, 1]),
+            ("getAA", [allele, length]),
+            ("getPeptide", [allele, 5, 20]),
+            ("getPeptide", [allele, length - 2, length + 10]),
+            ("getARD", [allele]),
+            ("getXRD", [allele]),
+            ("getEpitope", [allele, [9, 62, 97]]),
+        ):
+            expected = getattr(synthetic_genie, method)(*args)
+            assert getattr(on_demand_genie, method)(*args) == expected
+
+    nuc_allele = next(a for a in synthetic_genie.nuc_seqs if a.startswith("B*"))
+    nuc_seq = synthetic_genie.nuc_seqs[nuc_allele]
+    assert on_demand_genie.nuc_seqs.residue(nuc_allele, 3) == nuc_seq[2]
+
+    with pytest.raises(IndexError):
+        on_demand_genie.getAA(alleles[0], len(synthetic_genie.seqs[alleles[0]]) + 1)
+    with pytest.raises(KeyError):
+        on_demand_genie.getAA("B*99:99", 1)
+
+
+# test the cache stays bounded while the mapping still covers every allele
+def test_bounded_cache(on_demand_genie, synthetic_genie):
+    seqs = on_demand_genie.seqs
+    for allele in list(synthetic_genie.seqs)[:50]:
+        assert seqs[allele] == synthetic_genie.seqs[allele]
+    assert len(seqs._cache) == 8
+
+    assert len(seqs) == len(synthetic_genie.seqs)
+    assert set(seqs) == set(synthetic_genie.seqs)
+    assert "A*01:01" in seqs
+    assert "A*99:99" not in seqs
+
+    # a repeated position lookup caches its sequence and stops querying SQLite
+    allele = sorted(a for a in synthetic_genie.seqs if a.startswith("C*"))[-1]
+    queries = []
+    query = seqs._query
+
+    def counted(statement, *args):
+        queries.append(statement)
+        return query(statement, *args)
+
+    seqs._query = counted
+    try:
+        residues = [on_demand_genie.getAA(allele, p) for p in (1, 2, 3, 4)]
+    finally:
+        del seqs._query
+    assert residues == list(synthetic_genie.seqs[allele][:4])
+    assert len(queries) == 2
+    assert allele in seqs._cache
@@ -0,0 +1,61 @@
+import pytest
+from hlagenie import db, metrics, pipeline
+from hlagenie.configs import config
+
+
+def _keep_records(locus, multi_seq):
+    return {
+        record.id: str(record.seq)
+        for record in multi_seq
+        if record.id.split("*")[0] == locus
+    }
+
+
+# test every locus gets its sequences and the shared DRB345 file is parsed once
+def test_build_locus_tables(imgt_server, tmp_path):
+    conn = db.create_db_connection(tmp_path, "3510", False, "nearest")
+    db.create_schema(conn)
+    metrics.reset()
+    metrics.enable()
+    try:
+        seqs = pipeline.build_locus_tables(
+            conn, "3510", "prot", False, "nearest", "test", _keep_records, tmp_path
+        )
+        parses = metrics.snapshot()["histograms"]
+    finally:
+        metrics.disable()
+        metrics.reset()
+
+    for locus in config["loci"]:
+        table = db.load_sequences(conn, "test", locus)
+        assert table and all(allele.startswith(locus + "*") for allele in table)
+        assert all(seqs[allele] == seq for allele, seq in table.items())
+
+    drb345 = ("parse_seconds", (("kind", "prot"), ("locus", "DRB345")))
+    assert parses[drb345]["count"] == 1
+    conn.close()
+
+
+# test an error while processing is raised in the calling thread
+def test_process_error(imgt_server, tmp_path):
+    def fail(locus, multi_seq):
+        raise ValueError(locus)
+
+    conn = db.create_db_connection(tmp_path, "3510", False, "nearest")
+    with pytest.raises(ValueError):
+        pipeline.build_locus_tables(
+            conn, "3510", "prot", False, "nearest", "test", fail, tmp_path
+        )
+    conn.close()
+
+
+# test a failed download exits like the other downloads
+def test_download_error(imgt_server, tmp_path, monkeypatch):
+    monkeypatch.setitem(config, "imgt_hla_url", imgt_server + "/missing")
+    monkeypatch.setitem(config, "download_retries", 0)
+    conn = db.create_db_connection(tmp_path, "3510", False, "nearest")
+    with pytest.raises(SystemExit):
+        pipeline.build_locus_tables(
+            conn, "3510", "prot", False, "nearest", "test", _keep_records, tmp_path
+        )
+    conn.close()
@@ -0,0 +1,56 @@
+from hlagenie.residues import PolymorphismIndex
+
+
+def _alleles(genie, locus, n=12):
+    return sorted(a for a in genie.seqs if a.startswith(f"{locus}*"))[:n]
+
+
+# test the index persisted at build matches the mature sequences
+def test_persisted_index(synthetic_genie):
+    computed = PolymorphismIndex.from_seqs(synthetic_genie.seqs)
+    assert synthetic_genie.polymorphism.counts == computed.counts
+
+    seqs = [seq for a, seq in synthetic_genie.seqs.items() if a.startswith("A*")]
+    counts = synthetic_genie.polymorphicPositions("A")
+    for position in range(1, max(len(seq) for seq in seqs) + 1):
+        residues = {seq[position - 1] for seq in seqs if len(seq) >= position}
+        assert (position in counts) == (len(residues) > 1)
+    for position, residues in counts.items():
+        covering = sum(len(seq) >= position for seq in seqs)
+        assert sum(residues.values()) == covering
+
+
+# test region limits and distances over the informative positions only
+def test_region_and_distances(synthetic_genie):
+    ard = synthetic_genie.ards["B"]
+    positions = synthetic_genie.polymorphicPositions("B", "ARD")
+    assert positions and all(position <= ard for position in positions)
+    assert list(positions) == sorted(positions)
+
+    alleles = _alleles(synthetic_genie, "B")
+    matrix = synthetic_genie.distanceMatrix(alleles, "ARD")
+    for i, allele1 in enumerate(alleles):
+        for j, allele2 in enumerate(alleles):
+            seq1, seq2 = synthetic_genie.seqs[allele1], synthetic_genie.seqs[allele2]
+            length = min(ard, len(seq1), len(seq2))
+            expected = sum(seq1[k] != seq2[k] for k in range(length))
+            assert matrix[i][j] == expected
+
+
+# test counts skipping invariant positions agree with a loop over every position
+def test_mismatch_counts(synthetic_genie):
+    alleles = _alleles(synthetic_genie, "DRB1")
+    for i in range(len(alleles) - 3):
+        donor1, donor2, recip1, recip2 = alleles[i : i + 4]
+        result = synthetic_genie.genotypeMismatches(
+            {"DRB1": [donor1, donor2]}, {"DRB1": [recip1, recip2]}
+        )
+        seqs = [synthetic_genie.seqs[a] for a in (donor1, donor2, recip1, recip2)]
+        length = min(synthetic_genie.ards["DRB1"], *(len(seq) for seq in seqs))
+        expected = sum(
+            synthetic_genie.countAAMismatchesAllele(
+                donor1, donor2, recip1, recip2, position
+            )
+            for position in range(1, length + 1)
+        )
+        assert result["loci"]["DRB1"]["count"] == expected
@@ -0,0 +1,66 @@
+import hlagenie
+import pytest
+from hlagenie.regions import Region
+from .synthetic import TwoFieldReducer
+
+POCKET_B = [7, 9, 24, 34, 45, 63, 66, 67, 70, 99]
+
+
+# test compiled regions gather the same residues as indexing each position
+def test_region_gather():
+    seq = "GSHSMRYFFTSVSRPGRGEPRFIAVGYVDDTQFVRFDSDAASQRMEPRAPWIEQEGPEYWDQETRNVKAQS" * 2
+    pocket = Region("B", "A", POCKET_B)
+    assert pocket.gather(seq) == "".join(seq[p - 1] for p in POCKET_B)
+    assert Region("one", "A", [5]).gather(seq) == seq[4]
+    assert Region("start", "A", range(1, 11)).gather(seq) == seq[:10]
+    assert pocket.mask.bit_count() == len(POCKET_B)
+    with pytest.raises(ValueError):
+        Region("bad", "A", [0, 5])
+
+
+# test named regions work across the lookup and mismatch calls
+def test_named_regions(scratch_genie):
+    alleles = sorted(a for a in scratch_genie.seqs if a.startswith("B*"))
+    d1, d2, r1, r2 = alleles[:4]
+    scratch_genie.defineRegion("pocketB", {"B": POCKET_B})
+
+    assert "pocketB" in scratch_genie.listRegions("B")
+    assert "pocketB" not in scratch_genie.listRegions("A")
+    assert scratch_genie.getRegion(d1, "pocketB") == "".join(
+        scratch_genie.getAA(d1, p) for p in POCKET_B
+    )
+    assert scratch_genie.getEpitope(d1, "pocketB") == scratch_genie.getEpitope(
+        d1, POCKET_B
+    )
+    assert scratch_genie.getRegion(d1, "ARD") == scratch_genie.getARD(d1)
+
+    donor = {"B": [d1, d2]}
+    recip = {"B": [r1, r2]}
+    assert scratch_genie.genotypeMismatches(
+        donor, recip, region="pocketB"
+    ) == scratch_genie.genotypeMismatches(donor, recip, region=POCKET_B)
+    with pytest.raises(ValueError):
+        scratch_genie.getRegion(d1, "pocketZ")
+
+
+# test user-defined regions are saved with the database
+def test_regions_persist(scratch_data_dir, synthetic_data_dir):
+    genie = hlagenie.init("3510", data_dir=scratch_data_dir, ard=TwoFieldReducer())
+    genie.defineRegion("contacts", [62, 65, 66, 69])
+    reopened = hlagenie.init("3510", data_dir=scratch_data_dir, ard=TwoFieldReducer())
+    assert reopened.regions.user_regions["contacts", "A"] == [62, 65, 66, 69]
+    # gapped positions are a different coordinate system
+    assert "contacts" not in regions_of(scratch_data_dir, ungap=False)
+    # the shared database is left as it was built
+    assert "contacts" not in regions_of(synthetic_data_dir, ungap=True)
+
+
+def regions_of(data_dir, ungap):
+    from hlagenie import db
+
+    conn = db.create_db_connection(data_dir, "3510", False, "nearest", read_only=True)
+    try:
+        mode = "ungapped" if ungap else "gapped"
+        return {name for name, _ in db.load_regions(conn, mode)}
+    finally:
+        conn.close()
@@ -0,0 +1,58 @@
+import pytest
+from hlagenie import scoring
+
+
+# test computed Grantham distances are close to the published values
+def test_grantham():
+    matrix = scoring.grantham()
+    published = {("S", "R"): 110, ("L", "I"): 5, ("C", "W"): 215, ("D", "E"): 45}
+    for (a, b), distance in published.items():
+        assert matrix(a, b) == pytest.approx(distance, abs=3)
+        assert matrix(b, a) == matrix(a, b)
+    assert matrix("A", "A") == 0
+
+
+def test_blosum62():
+    pytest.importorskip("Bio")
+    matrix = scoring.blosum62()
+    assert matrix("A", "A") == 0
+    assert matrix("I", "L") < matrix("W", "G")
+
+
+# test custom weights and positions give the mismatch count when all are 1
+def test_score_matches_count(synthetic_genie):
+    d1, d2, r1, r2 = sorted(a for a in synthetic_genie.seqs if a.startswith("C*"))[:4]
+    residues = sorted(scoring.GRANTHAM_PROPERTIES) + ["-", "X"]
+    ones = {(a, b): 1 for a in residues for b in residues}
+
+    count = sum(
+        synthetic_genie.countAAMismatchesAllele(d1, d2, r1, r2, p)
+        for p in range(1, synthetic_genie.ards["C"] + 1)
+    )
+    assert synthetic_genie.substitutionScore(d1, d2, r1, r2, matrix=ones) == count
+
+    mismatched = [
+        p
+        for p in range(1, synthetic_genie.ards["C"] + 1)
+        if synthetic_genie.countAAMismatchesAllele(d1, d2, r1, r2, p)
+    ]
+    weights = {mismatched[0]: 10.0}
+    weighted = synthetic_genie.substitutionScore(
+        d1, d2, r1, r2, matrix=ones, position_weights=weights
+    )
+    first = synthetic_genie.countAAMismatchesAllele(d1, d2, r1, r2, mismatched[0])
+    assert weighted == count + 9 * first
+
+
+# test the batch and both directions
+def test_batch(synthetic_genie):
+    d1, d2, r1, r2 = sorted(a for a in synthetic_genie.seqs if a.startswith("C*"))[:4]
+    batch = synthetic_genie.substitutionScoreBatch(
+        [(d1, d2, r1, r2), (r1, r2, d1, d2)], region="XRD"
+    )
+    assert batch[0] == synthetic_genie.substitutionScore(d1, d2, r1, r2, region="XRD")
+    assert batch[1] == synthetic_genie.substitutionScore(
+        d1, d2, r1, r2, region="XRD", direction="gvh"
+    )
+    with pytest.raises(ValueError):
+        synthetic_genie.substitutionScore(d1, d2, r1, r2, matrix="pam250")
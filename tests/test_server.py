@@ -0,0 +1,187 @@
+import threading
+import time
+import pytest
+from hlagenie.genie import GENIE
+from hlagenie.server import GenieServer, MicroBatcher, make_server, Client
+
+
+class StubGenie:
+    """Stand-in with the GENIE query interface over a fixed sequence table"""
+
+    imgt_version = "3510"
+    seqs = {"A*01:01": "GSHSMRYFFT", "A*02:01": "GSHSMRYFYT"}
+
+    def __init__(self):
+        self.calls = 0
+        # number of calls in each GENIE.batch and epletMismatchesBatch call
+        self.batches = []
+        self.bulk_calls = []
+
+    def getAA(self, allele, position):
+        self.calls += 1
+        return self.seqs[allele][position - 1]
+
+    def epletMismatches(self, allele1donor, allele2donor, allele1recip, allele2recip):
+        return self.epletMismatchesBatch(
+            [(allele1donor, allele2donor, allele1recip, allele2recip)]
+        )[0]
+
+    def epletMismatchesBatch(self, allele_pairs, names=True):
+        self.bulk_calls.append(len(allele_pairs))
+        # unknown alleles raise KeyError, like GENIE
+        for pair in allele_pairs:
+            for allele in pair:
+                self.seqs[allele]
+        return [{"count": len(set(pair[:2]) - set(pair[2:]))} for pair in allele_pairs]
+
+    # the server spreads batches over the same thread pool as GENIE
+    def batch(self, calls, **kwargs):
+        self.batches.append(len(calls))
+        return GENIE.batch(self, calls, **kwargs)
+
+
+@pytest.fixture
+def client():
+    genie = StubGenie()
+    httpd = make_server(GenieServer({"3.51.0": genie}), port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    client = Client(port=httpd.server_address[1])
+    yield client, genie
+
+    client.close()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+# test single calls against a warm instance
+def test_call(client):
+    client, genie = client
+    assert client.call("getAA", "A*01:01", 9) == "F"
+    assert client.call("getAA", "A*02:01", 9) == "Y"
+
+
+# test batches evaluate duplicate calls once and keep errors per call
+def test_batch(client):
+    client, genie = client
+    results = client.batch(
+        [
+            ("getAA", "A*01:01", 9),
+            ("getAA", "A*01:01", 9),
+            ("getAA", "A*02:01", 9),
+            ("getAA", "B*07:02", 1),
+            ("__init__",),
+        ]
+    )
+    assert results[:3] == ["F", "F", "Y"]
+    assert isinstance(results[3], RuntimeError)
+    assert isinstance(results[4], RuntimeError)
+    assert genie.calls == 3
+
+
+# test only whitelisted methods are callable
+def test_unserved_method(client):
+    client, genie = client
+    with pytest.raises(RuntimeError):
+        client.call("__del__")
+
+
+def _concurrently(function, args_list):
+    barrier = threading.Barrier(len(args_list))
+    results = [None] * len(args_list)
+
+    def run(i, args):
+        barrier.wait()
+        results[i] = function(*args)
+
+    threads = [
+        threading.Thread(target=run, args=(i, args)) for i, args in enumerate(args_list)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+# test calls of concurrent requests are coalesced into one dispatch
+def test_coalesced_requests():
+    genie = StubGenie()
+    server = GenieServer({"3510": genie}, batch_window=0.2)
+
+    positions = list(range(1, 9))
+    results = _concurrently(
+        server.call, [("getAA", ["A*01:01", position]) for position in positions]
+    )
+    assert results == [genie.seqs["A*01:01"][p - 1] for p in positions]
+    assert genie.batches == [len(positions)]
+
+
+# test coalesced calls with a bulk counterpart go to one bulk call
+def test_bulk_dispatch():
+    genie = StubGenie()
+    server = GenieServer({"3510": genie}, batch_window=0.2)
+
+    pairs = [["A*01:01", "A*02:01", "A*01:01", "A*01:01"]] * 6
+    results = _concurrently(server.call, [("epletMismatches", pair) for pair in pairs])
+    assert results == [{"count": 1}] * 6
+    assert genie.bulk_calls == [6]
+
+    # a failing call is isolated from the others of its bulk call
+    responses = server.batch(
+        [
+            {"method": "epletMismatches", "args": pairs[0]},
+            {"method": "epletMismatches", "args": ["B*07:02"] * 4},
+        ]
+    )
+    assert responses[0] == {"result": {"count": 1}}
+    assert "error" in responses[1]
+
+
+# test an idle batcher dispatches at once and coalesces calls arriving meanwhile
+def test_coalesced_in_flight():
+    started, release = threading.Event(), threading.Event()
+    dispatched = []
+
+    def dispatch(pending):
+        dispatched.append([call for call, _ in pending])
+        if len(dispatched) == 1:
+            started.set()
+            release.wait()
+        for call, future in pending:
+            future.set_result(call * 2)
+
+    batcher = MicroBatcher(dispatch)
+    first = threading.Thread(target=batcher.submit, args=([1],))
+    first.start()
+    assert started.wait(1)
+
+    # calls submitted during the first dispatch wait for it, then go together
+    results = [None] * 4
+
+    def submit(i):
+        results[i] = batcher.submit([i + 10])
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    while len(batcher._pending) < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads + [first]:
+        thread.join()
+
+    assert dispatched[0] == [1]
+    assert sorted(dispatched[1]) == [10, 11, 12, 13]
+    assert len(dispatched) == 2
+    assert results == [[20], [22], [24], [26]]
+
+
+# test a unix socket path holding a regular file is left alone
+def test_socket_path_not_a_socket(tmp_path):
+    path = tmp_path / "hlagenie.sock"
+    path.write_text("data")
+    with pytest.raises(FileExistsError):
+        make_server(GenieServer({"3510": StubGenie()}), socket_path=str(path))
+    assert path.read_text() == "data"
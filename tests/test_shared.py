@@ -0,0 +1,72 @@
+import multiprocessing
+import pickle
+import pytest
+from hlagenie.configs import config
+from hlagenie.residues import bitplanes
+from hlagenie.shared import GenieView, SharedPlanes
+
+
+def _first_residues(view, alleles):
+    return [view.getAA(allele, 1) for allele in alleles]
+
+
+@pytest.fixture(scope="module")
+def store(synthetic_genie, tmp_path_factory):
+    path = tmp_path_factory.mktemp("shared") / "genie.shm"
+    with synthetic_genie.share(path) as store:
+        yield store
+    assert not path.exists()
+
+
+# test a view over a store answers like the instance that published it
+def test_view(store, synthetic_genie):
+    view = store.view()
+    assert view.db_connection is None
+    assert view.imgt_version == synthetic_genie.imgt_version
+    assert set(view.seqs) == set(synthetic_genie.seqs)
+    assert set(view.nuc_seqs) == set(synthetic_genie.nuc_seqs)
+    for allele in list(synthetic_genie.seqs)[::25]:
+        assert view.seqs[allele] == synthetic_genie.seqs[allele]
+        assert view.getXRD(allele) == synthetic_genie.getXRD(allele)
+    for locus in config["loci"]:
+        assert view.listCompletes(locus) == synthetic_genie.listCompletes(locus)
+
+    alleles = sorted(a for a in synthetic_genie.seqs if a.startswith("A*"))[:4]
+    assert view.genotypeMismatches(
+        {"A": alleles[:2]}, {"A": alleles[2:]}
+    ) == synthetic_genie.genotypeMismatches({"A": alleles[:2]}, {"A": alleles[2:]})
+
+
+# test views pickle as the path of the store and work in worker processes
+def test_pickle_and_workers(store, synthetic_genie):
+    view = store.view()
+    payload = pickle.dumps(view)
+    assert len(payload) < 1000
+    assert pickle.loads(payload).seqs == view.seqs
+
+    alleles = list(synthetic_genie.seqs)[:20]
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(2) as pool:
+        results = pool.starmap(
+            _first_residues, [(view, alleles[:10]), (view, alleles[10:])]
+        )
+    assert sum(results, []) == [synthetic_genie.seqs[a][0] for a in alleles]
+
+
+# test the residue bitplanes and polymorphic positions are read from the store
+def test_residue_matrices(store, synthetic_genie):
+    view = store.view()
+    assert len(store.planes) == len(synthetic_genie.seqs)
+    for allele in list(synthetic_genie.seqs)[::25]:
+        seq = synthetic_genie.seqs[allele]
+        assert store.planes[allele] == (bitplanes(seq), len(seq))
+    assert isinstance(view.residues.stored, SharedPlanes)
+    assert view.polymorphism.counts == synthetic_genie.polymorphism.counts
+
+
+# test files that are not stores are refused
+def test_not_a_store(tmp_path):
+    path = tmp_path / "other.shm"
+    path.write_bytes(b"x" * 64)
+    with pytest.raises(ValueError):
+        GenieView(path)
@@ -0,0 +1,45 @@
+import functools
+import random
+from hlagenie.smart_sort import smart_sort, smart_sort_comparator, smart_sort_key
+
+
+# test the key sorts alleles of a locus like the comparator
+def test_key_matches_comparator():
+    rng = random.Random(1)
+    alleles = list(
+        {
+            f"B*{rng.randint(1, 99):02d}:{rng.randint(1, 300):02d}"
+            + rng.choice(["", ":01", ":02:01", ":01:02", "N", ":01Q"])
+            for _ in range(500)
+        }
+    )
+    by_key = smart_sort(alleles)
+    by_comparator = sorted(alleles, key=functools.cmp_to_key(smart_sort_comparator))
+    assert [smart_sort_key(a)[1:6] for a in by_key] == [
+        smart_sort_key(a)[1:6] for a in by_comparator
+    ]
+
+
+# test numerical field ordering, locus grouping and GL strings
+def test_natural_order():
+    alleles = ["A*10:01", "A*02:101", "B*07:02", "A*02:01:01:02L", "A*02:01", "A*02:9"]
+    assert smart_sort(alleles) == [
+        "A*02:01",
+        "A*02:01:01:02L",
+        "A*02:9",
+        "A*02:101",
+        "A*10:01",
+        "B*07:02",
+    ]
+    assert smart_sort(["A*02:01/A*02:02", "A2", "A*01:01"]) == [
+        "A*01:01",
+        "A2",
+        "A*02:01/A*02:02",
+    ]
+
+
+# test listings come back sorted
+def test_listings_sorted(synthetic_genie):
+    for seqtype in ("prot", "nuc"):
+        completes = synthetic_genie.listCompletes("A", seqtype)
+        assert completes == smart_sort(completes)
@@ -0,0 +1,92 @@
+import threading
+import time
+import hlagenie
+from .synthetic import TwoFieldReducer
+
+
+def _run_threads(target, n=8):
+    barrier = threading.Barrier(n)
+    results, errors = [None] * n, []
+
+    def run(i):
+        barrier.wait()
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    return results
+
+
+# test py-ard is initialized once when threads reduce alleles at the same time
+def test_guarded_pyard_init(synthetic_data_dir, monkeypatch):
+    import pyard
+
+    inits = []
+
+    def slow_init(imgt_version, load_mac=True):
+        inits.append(imgt_version)
+        time.sleep(0.05)
+        return TwoFieldReducer()
+
+    monkeypatch.setattr(pyard, "init", slow_init)
+    genie = hlagenie.init("3510", data_dir=synthetic_data_dir)
+    allele = next(a for a in genie.seqs if a.startswith("A*"))
+
+    results = _run_threads(lambda: genie.getAA(f"{allele}:01", 1))
+    assert inits == ["3510"]
+    assert set(results) == {genie.seqs[allele][0]}
+
+
+# test the residue index is built once when threads first compare alleles together
+def test_guarded_residue_index(synthetic_data_dir, monkeypatch):
+    from hlagenie import genie as genie_module
+
+    builds = []
+
+    class SlowResidueIndex(genie_module.ResidueIndex):
+        def __init__(self, *args, **kwargs):
+            builds.append(None)
+            time.sleep(0.05)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(genie_module, "ResidueIndex", SlowResidueIndex)
+    genie = hlagenie.init("3510", data_dir=synthetic_data_dir, ard=TwoFieldReducer())
+
+    results = _run_threads(lambda: genie.residues)
+    assert len(builds) == 1
+    assert all(result is results[0] for result in results)
+
+
+# test threads listing alleles through pooled readers agree
+def test_concurrent_list_tables(synthetic_genie):
+    genie = synthetic_genie
+
+    def list_all():
+        return [
+            (genie.listCompletes(locus), genie.listExtendeds(locus, "nuc"))
+            for locus in ("A", "B", "DRB1")
+        ]
+
+    results = _run_threads(list_all)
+    assert all(result == results[0] for result in results)
+    assert results[0][0][0]
+
+
+# test batches over threads give the same results as calling one by one
+def test_batch(synthetic_genie):
+    alleles = sorted(a for a in synthetic_genie.seqs if a.startswith("C*"))[:20]
+    calls = [("getAA", [allele, 9]) for allele in alleles] + [
+        ("getARD", [allele]) for allele in alleles
+    ]
+    results = synthetic_genie.batch(calls, workers=4)
+    assert results == [getattr(synthetic_genie, m)(*args) for m, args in calls]
+
+    results = synthetic_genie.batch([("getAA", ["C*99:99", 1])], return_exceptions=True)
+    assert isinstance(results[0], KeyError)